@@ -8,6 +8,8 @@
 from flask import Flask
 from routes.api import api_bp
 from flask_swagger_ui import get_swaggerui_blueprint
+from config.es_config import CLUSTER_POLLER_ENABLED
+from services.cluster_poller import cluster_poller
 
 SWAGGER_URL = '/api/docs'
 API_URL = '/api/swagger.json'
@@ -21,5 +23,8 @@ app = Flask(__name__)
 app.register_blueprint(api_bp, url_prefix='')
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
+if CLUSTER_POLLER_ENABLED:
+    cluster_poller.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=6012)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : asgi.py
+@Time    : 2026/10/18 11:55
+@Author  : xxlaila
+@Software: dify
+
+异步服务入口：uvicorn asgi:app --host 0.0.0.0 --port 6012
+/call_tool 的 query、command 由 AsyncElasticsearch 在事件循环中执行，单进程可同时挂起大量慢查询；
+其余路由和工具仍交给 Flask 应用（在线程池中运行）。
+"""
+import json
+import time
+from typing import Tuple
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+from config.es_config import RESPONSE_COMPRESSION_ENABLED, RESPONSE_COMPRESSION_MIN_BYTES, SLOW_QUERY_CALLER_HEADER
+from utils.compression import compress_bytes, negotiate_encoding
+from models.async_es_client import AsyncESClient
+from routes.api import record_response_status, record_tool_result
+from routes.async_api import dispatch_tool_call
+from services.slow_queries import set_current_caller
+from utils import metrics
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+def _replay(body: bytes):
+    """
+    请求体已被读取，转交 WSGI 时重新提供一次。
+    """
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+    return receive
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+async def _send_json(send, status: int, payload: dict, extra_headers: dict, labels: Tuple[str, str],
+                     accept_encoding: str = "") -> int:
+    """
+    发送 JSON 响应，返回实际发送的字节数（压缩后）。
+    """
+    # 与 flask.jsonify 的输出及 api_bp 的压缩协商保持一致
+    started = time.perf_counter()
+    body = (json.dumps(payload, ensure_ascii=True, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+    if "result" in payload:
+        # 与 tool_response 一致，只统计工具结果的序列化耗时
+        metrics.serialization_seconds.observe(time.perf_counter() - started, *labels)
+    headers = [(b"content-type", b"application/json")]
+    headers.extend((k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in extra_headers.items())
+    if RESPONSE_COMPRESSION_ENABLED:
+        headers.append((b"vary", b"Accept-Encoding"))
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is not None and len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+            body = compress_bytes(body, encoding)
+            headers.append((b"content-encoding", encoding.encode()))
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": headers
+    })
+    await send({"type": "http.response.body", "body": body})
+    return len(body)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await AsyncESClient.close_all()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/call_tool":
+        started = time.perf_counter()
+        body = await _read_body(receive)
+        client = scope.get("client")
+        set_current_caller(_header(scope, SLOW_QUERY_CALLER_HEADER.lower().encode("latin-1")) or (client[0] if client else None))
+        result = await dispatch_tool_call(body.decode("utf-8", errors="replace"))
+        if result is not None:
+            status, payload, extra_headers, labels = result
+            # 与 Flask 路径的 tool_response / after_request 记录相同的请求级指标
+            tool_error = isinstance(payload.get("result"), dict) and record_tool_result(payload["result"], *labels)
+            size = await _send_json(send, status, payload, extra_headers, labels, _header(scope, b"accept-encoding"))
+            record_response_status(*labels, status, tool_error)
+            metrics.request_seconds.observe(time.perf_counter() - started, *labels)
+            metrics.response_bytes.observe(size, *labels)
+            return
+        receive = _replay(body)
+
+    await wsgi_app(scope, receive, send)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : run_benchmark.py
+@Time    : 2026/10/18 14:30
+@Author  : xxlaila
+@Software: dify
+"""
+import argparse
+import gzip
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+CLUSTER = "bench"
+
+def _query(cache: bool, size: int = 10) -> dict:
+    return {"name": "query", "parameters": {
+        "cluster_name": CLUSTER,
+        "dsl": {"index": "app-logs-*", "size": size, "query": {"match": {"level": "ERROR"}}},
+        "cache": cache
+    }}
+
+def _command(action: str, cache: bool) -> dict:
+    return {"name": "command", "parameters": {"cluster_name": CLUSTER, "action": action, "cache": cache}}
+
+# 场景名 -> 生成 /call_tool 请求体的函数（参数为请求序号，便于构造互不相同的请求）
+SCENARIOS: Dict[str, Callable[[int], dict]] = {
+    "query": lambda i: _query(cache=False),
+    "query_cached": lambda i: _query(cache=True),
+    "query_stream": lambda i: {"name": "query", "parameters": {
+        "cluster_name": CLUSTER,
+        "dsl": {"index": "app-logs-*", "query": {"match_all": {}}},
+        "stream": True,
+        "max_hits": 1000
+    }},
+    "batch_query": lambda i: {"name": "batch_query", "parameters": {
+        "cluster_name": CLUSTER,
+        "queries": [{"index": "app-logs-*", "dsl": {"size": 10, "query": {"term": {"service": f"svc-{n}"}}}} for n in range(5)],
+        "cache": False
+    }},
+    "command": lambda i: _command("_cat/indices?format=json", cache=False),
+    "command_cached": lambda i: _command("_cat/indices?format=json", cache=True),
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Port {port} did not open within {timeout}s")
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def start_stub(args) -> subprocess.Popen:
+    """
+    桩 ES 运行在独立进程中，避免与被测服务争抢 GIL，也不计入被测进程的 RSS。
+    """
+    port = _free_port()
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_es.py"),
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--hits", str(args.hits),
+        "--field-bytes", str(args.field_bytes),
+        "--cat-rows", str(args.cat_rows)
+    ])
+    _wait_for_port(port)
+    proc.port = port
+    return proc
+
+def start_service(stub_port: int, args) -> int:
+    """
+    在当前进程内以多线程 WSGI 服务启动 Flask 应用，集群配置指向桩 ES。
+    必须在设置好环境变量之后再导入 app，配置在导入时读取。
+    """
+    os.environ["CLUSTERS_CONFIG"] = json.dumps({CLUSTER: {
+        "endpoint": f"http://127.0.0.1:{stub_port}",
+        "timeout": 30000,
+        "pool_maxsize": max(10, args.concurrency * 2),
+        "query_cache_ttl": 300
+    }})
+    os.environ["CLUSTERS_CONFIG_FILE"] = ""
+    os.environ["CLUSTER_POLLER_ENABLED"] = "false"
+    sys.path.insert(0, SERVICE_DIR)
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app
+    from utils.logger import logger
+    if not args.verbose:
+        # 每次调用的 INFO 日志会淹没压测输出，默认只保留告警
+        logger.setLevel(logging.WARNING)
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    port = _free_port()
+    server = make_server("127.0.0.1", port, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port
+
+class Worker:
+    """
+    每个压测线程持有一条 keep-alive 连接，模拟常驻的调用方。
+    """
+
+    def __init__(self, port: int, accept_encoding: Optional[str] = None):
+        self.port = port
+        self.headers = {"Content-Type": "application/json"}
+        if accept_encoding:
+            self.headers["Accept-Encoding"] = accept_encoding
+        self.conn = None
+
+    def call(self, payload: bytes):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        try:
+            self.conn.request("POST", "/call_tool", body=payload, headers=self.headers)
+            response = self.conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            self.conn.close()
+            self.conn = None
+        # 统计实际传输的字节数，错误判断用解压后的内容
+        wire_size = len(body)
+        encoding = response.getheader("Content-Encoding")
+        if encoding:
+            body = decompress(body, encoding)
+        return response.status, body, wire_size
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br":
+        import brotli
+        return brotli.decompress(body)
+    raise ValueError(f"Unexpected Content-Encoding {encoding}")
+
+def _is_error(status: int, body: bytes) -> bool:
+    if status != 200:
+        return True
+    # 流式响应最后一行是 summary/error，普通响应的工具错误包在 result.output.status 中
+    if body.startswith(b'{"result"'):
+        output = json.loads(body).get("result", {}).get("output", {})
+        return isinstance(output, dict) and output.get("status") == "error"
+    last = body.rstrip().rsplit(b"\n", 1)[-1]
+    return b'"type": "error"' in last
+
+def run_scenario(name: str, port: int, args) -> dict:
+    build = SCENARIOS[name]
+    local = threading.local()
+    lock = threading.Lock()
+    latencies, sizes = [], []
+    errors = 0
+
+    def one(i: int):
+        nonlocal errors
+        worker = getattr(local, "worker", None)
+        if worker is None:
+            worker = local.worker = Worker(port, args.accept_encoding)
+        payload = json.dumps(build(i)).encode("utf-8")
+        start = time.perf_counter()
+        try:
+            status, body, wire_size = worker.call(payload)
+            failed = _is_error(status, body)
+        except Exception:
+            wire_size, failed = 0, True
+        elapsed = time.perf_counter() - start
+        if i < 0:
+            return
+        with lock:
+            latencies.append(elapsed)
+            sizes.append(wire_size)
+            if failed:
+                errors += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # 预热：建立连接、填充结果缓存，不计入统计
+        list(pool.map(one, range(-args.warmup, 0)))
+        started = time.perf_counter()
+        list(pool.map(one, range(args.requests)))
+        duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "rps": round(len(latencies) / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p95": round(_percentile(latencies, 95) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0
+        },
+        "bytes_total": sum(sizes),
+        "bytes_per_request": round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+        "peak_rss_mb": round(_peak_rss_bytes() / 1048576, 1)
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    与基线逐场景比较：p95 延迟升高或吞吐下降超过 tolerance（比例）即视为回归。
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        base_p95, p95 = base["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base_p95}ms -> {p95}ms")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']} -> {current['rps']}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+def print_table(results: dict):
+    header = f"{'scenario':<16}{'req':>7}{'err':>5}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'B/req':>10}{'rssMB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["scenarios"].items():
+        lat = r["latency_ms"]
+        print(f"{name:<16}{r['requests']:>7}{r['errors']:>5}{r['rps']:>10}{lat['p50']:>9}{lat['p95']:>9}"
+              f"{lat['p99']:>9}{r['bytes_per_request']:>10}{r['peak_rss_mb']:>8}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="es-flask-service /call_tool 压测（使用本地桩 ES）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="桩 ES 每个请求的固定延迟")
+    parser.add_argument("--hits", type=int, default=50, help="桩 ES 单次 _search 最多返回的命中数")
+    parser.add_argument("--field-bytes", type=int, default=200, help="每条命中 message 字段的长度")
+    parser.add_argument("--cat-rows", type=int, default=200, help="_cat 接口返回的行数")
+    parser.add_argument("--accept-encoding", default="", help="请求头 Accept-Encoding（如 gzip、br），用于测压缩响应")
+    parser.add_argument("--output", help="结果写入该 JSON 文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="用于比较的基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的回归比例")
+    parser.add_argument("--verbose", action="store_true", help="保留服务的 INFO 日志")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    stub = start_stub(args)
+    try:
+        port = start_service(stub.port, args)
+        _wait_for_port(port)
+        results = {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "settings": {k: getattr(args, k) for k in ("concurrency", "requests", "warmup", "latency_ms", "hits", "field_bytes", "cat_rows", "accept_encoding")},
+            "scenarios": {}
+        }
+        for name in names:
+            results["scenarios"][name] = run_scenario(name, port, args)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != results["settings"]:
+            print("Baseline was recorded with different settings, skipping comparison")
+            return 0
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : stub_es.py
+@Time    : 2026/10/18 14:10
+@Author  : xxlaila
+@Software: dify
+"""
+import argparse
+import gzip
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class StubSettings:
+    """
+    桩服务的可调参数：每个请求的固定延迟、每次 _search 返回的命中数、单条命中 message 字段长度、_cat 返回行数。
+    """
+
+    def __init__(self, latency_ms: float = 0.0, hits: int = 10, field_bytes: int = 200, cat_rows: int = 50):
+        self.latency = latency_ms / 1000.0
+        self.hits = hits
+        self.field_bytes = field_bytes
+        self.cat_rows = cat_rows
+
+def _hit(settings: StubSettings, i: int) -> dict:
+    return {
+        "_index": "app-logs-2026.10.18",
+        "_id": str(i),
+        "_score": 1.0,
+        "_source": {
+            "@timestamp": "2026-10-18T10:%02d:%02dZ" % (i // 60 % 60, i % 60),
+            "level": "ERROR",
+            "service": f"svc-{i % 8}",
+            "message": ("request failed " * (settings.field_bytes // 15 + 1))[:settings.field_bytes]
+        },
+        "sort": [i]
+    }
+
+def _search_response(settings: StubSettings, body: dict) -> dict:
+    size = min(body.get("size", settings.hits), settings.hits)
+    search_after = body.get("search_after")
+    start = search_after[0] + 1 if search_after else 0
+    response = {
+        "took": 2,
+        "timed_out": False,
+        "_shards": {"total": 5, "successful": 5, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": settings.hits, "relation": "eq"},
+            "max_score": 1.0,
+            "hits": [_hit(settings, i) for i in range(start, min(start + size, settings.hits))]
+        }
+    }
+    if body.get("pit"):
+        response["pit_id"] = body["pit"]["id"]
+    if body.get("aggs") or body.get("aggregations"):
+        response["aggregations"] = {
+            "by_service": {"buckets": [{"key": f"svc-{i}", "doc_count": 100 - i} for i in range(8)]}
+        }
+    return response
+
+# 与 _hit 中的字段一致，供服务端的字段校验使用
+_FIELD_TYPES = {"@timestamp": "date", "level": "keyword", "service": "keyword", "message": "text"}
+
+def _field_caps_response() -> dict:
+    return {
+        "indices": ["app-logs-2026.10.18"],
+        "fields": {
+            name: {field_type: {
+                "type": field_type, "searchable": True, "aggregatable": field_type != "text"
+            }} for name, field_type in _FIELD_TYPES.items()
+        }
+    }
+
+def _cat_rows(settings: StubSettings, path: str) -> list:
+    if path.startswith("/_cat/indices"):
+        return [{
+            "health": "green", "status": "open", "index": "app-logs-2026.%02d.%02d" % (i // 28 % 12 + 1, i % 28 + 1),
+            "pri": "1", "rep": "1", "docs.count": str(100000 + i), "store.size": "1.2gb"
+        } for i in range(settings.cat_rows)]
+    return [{"name": f"node-{i}", "heap.percent": str(40 + i % 50), "cpu": str(i % 100)} for i in range(settings.cat_rows)]
+
+def make_handler(settings: StubSettings):
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 响应头和响应体分两次写出，开着 Nagle 时第二段要等客户端的延迟 ACK（约 40ms），压测测到的就只是这个等待
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload, content_type: str = "application/json"):
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+            # 与真实ES一致：客户端开启 http_compress 时返回 gzip 响应
+            gzipped = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            if gzipped:
+                data = gzip.compress(data, 1)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            # elasticsearch-py 7.14+ 会校验该响应头
+            self.send_header("X-Elastic-Product", "Elasticsearch")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        def handle_request(self):
+            url = urlparse(self.path)
+            path, query = url.path, parse_qs(url.query)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if self.headers.get("Content-Encoding") == "gzip":
+                raw = gzip.decompress(raw)
+            if settings.latency:
+                time.sleep(settings.latency)
+
+            if path == "/":
+                return self._send(200, {"version": {"number": "7.17.0"}, "tagline": "You Know, for Search"})
+            if path.endswith("/_msearch"):
+                lines = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+                responses = [{**_search_response(settings, body), "status": 200} for body in lines[1::2]]
+                return self._send(200, {"took": 2, "responses": responses})
+            if path.endswith("/_search"):
+                return self._send(200, _search_response(settings, json.loads(raw or b"{}")))
+            if path.endswith("/_field_caps"):
+                return self._send(200, _field_caps_response())
+            if path.endswith("/_pit"):
+                return self._send(200, {"id": "stub-pit"} if self.command == "POST" else {"succeeded": True})
+            if path.startswith("/_cat"):
+                rows = _cat_rows(settings, path)
+                if query.get("format") == ["json"]:
+                    return self._send(200, rows)
+                text = "\n".join(" ".join(row.values()) for row in rows) + "\n"
+                return self._send(200, text.encode("utf-8"), "text/plain; charset=UTF-8")
+            if path.startswith("/_cluster/health"):
+                return self._send(200, {"cluster_name": "stub", "status": "green", "number_of_nodes": 3})
+            return self._send(404, {"error": {"type": "stub_not_found", "reason": f"no stub for {path}"}, "status": 404})
+
+        do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = handle_request
+
+    return StubHandler
+
+def serve(port: int, settings: StubSettings):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings))
+    server.daemon_threads = True
+    server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="用于压测的 Elasticsearch 桩服务")
+    parser.add_argument("--port", type=int, default=19200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--hits", type=int, default=10)
+    parser.add_argument("--field-bytes", type=int, default=200)
+    parser.add_argument("--cat-rows", type=int, default=50)
+    args = parser.parse_args()
+    serve(args.port, StubSettings(args.latency_ms, args.hits, args.field_bytes, args.cat_rows))
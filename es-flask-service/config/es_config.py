@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-@File    : es_config.py 
+@File    : es_config.py
 @Time    : 2025/4/2 16:50
 @Author  : xxlaila
 @Software: dify
@@ -8,27 +8,356 @@
 
 import os
 import json
-from dotenv import load_dotenv
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping
+from dotenv import load_dotenv, find_dotenv, dotenv_values
+from utils.logger import logger
+
+# 进程环境变量中显式设置的 CLUSTERS_CONFIG 优先于 .env 文件（与 load_dotenv 的默认行为一致）
+_PROCESS_CLUSTERS_CONFIG = os.environ.get("CLUSTERS_CONFIG")
 
 load_dotenv()
 
-def get_cluster_config(cluster_name: str) -> dict:
-    clusters = json.loads(os.getenv("CLUSTERS_CONFIG"))
-    config = clusters.get(cluster_name)
+# 连接池默认参数（可在 CLUSTERS_CONFIG 中按集群覆盖）
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_RETRIES = 3
+# 超时默认不重试（与 elasticsearch-py 一致）：慢查询重发只会放大已过载集群的压力，并在重试期间一直占用准入名额；
+# 需要时在 CLUSTERS_CONFIG 中按集群设置 "retry_on_timeout": true
+DEFAULT_RETRY_ON_TIMEOUT = False
+DEFAULT_KEEP_ALIVE = True
+DEFAULT_IDLE_TIMEOUT = 300
+# 与ES之间启用 gzip（请求体压缩 + Accept-Encoding），跨机房时显著减少大结果的传输时间
+DEFAULT_HTTP_COMPRESS = os.getenv("ES_HTTP_COMPRESS", "true").lower() == "true"
+# 熔断：连续失败多少次打开熔断、打开后多久开始后台探活（秒）
+DEFAULT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+DEFAULT_BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 10))
+# 准入控制：每个集群同时发往ES的请求数上限（0 表示不限制）、排队上限和排队超时（秒），均可按集群覆盖
+DEFAULT_ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 16))
+DEFAULT_ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))
+DEFAULT_ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 5))
+# 排队时优先放行的工具（background 为后台采集），其余工具按到达顺序排在后面
+ADMISSION_PRIORITY_TOOLS = tuple(
+    t.strip() for t in os.getenv("ADMISSION_PRIORITY_TOOLS", "command,background").split(",") if t.strip()
+)
+# 异步服务模式下每个集群允许同时在途的连接数（aiohttp 连接池上限）
+DEFAULT_ASYNC_POOL_MAXSIZE = int(os.getenv("ASYNC_POOL_MAXSIZE", 256))
+
+# query 结果缓存：默认 TTL（秒，可按集群用 query_cache_ttl 覆盖，0 表示关闭）与全局内存预算
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 30))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 5000))
+
+# 流式查询：每页大小、PIT 保活时间与单次请求可返回的命中数上限
+STREAM_PAGE_SIZE = int(os.getenv("STREAM_PAGE_SIZE", 1000))
+STREAM_PIT_KEEP_ALIVE = os.getenv("STREAM_PIT_KEEP_ALIVE", "1m")
+STREAM_MAX_HITS = int(os.getenv("STREAM_MAX_HITS", 100000))
+
+# query 响应裁剪默认值：单字段最大字符数、整个结果的最大字节数（0 表示不限制）
+QUERY_MAX_FIELD_LENGTH = int(os.getenv("QUERY_MAX_FIELD_LENGTH", 0))
+QUERY_MAX_RESPONSE_BYTES = int(os.getenv("QUERY_MAX_RESPONSE_BYTES", 0))
+
+# command 只读请求缓存：按路径前缀配置 TTL（秒，最长前缀匹配，0 表示不缓存），可用 COMMAND_CACHE_TTLS 覆盖
+DEFAULT_COMMAND_CACHE_TTLS = {
+    "_cat/indices": 60,
+    "_cat/shards": 30,
+    "_cat/allocation": 30,
+    "_cat/nodes": 10,
+    "_cat/thread_pool": 5,
+    "_cat": 15,
+    "_cluster/health": 5,
+    "_cluster/stats": 30,
+    "_cluster/settings": 60,
+    "_cluster": 10,
+    "_nodes/stats": 10,
+    "_nodes": 60,
+    "_mapping": 300,
+    "_settings": 300,
+    "_tasks": 0,
+    "_explain": 0,
+    "_search": 0
+}
+COMMAND_CACHE_TTLS = {**DEFAULT_COMMAND_CACHE_TTLS, **json.loads(os.getenv("COMMAND_CACHE_TTLS") or "{}")}
+COMMAND_CACHE_MAX_BYTES = int(os.getenv("COMMAND_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# command format=columnar 时最多返回的列数（_nodes/stats 展开后有上千列，0 表示不限制）
+COMMAND_COLUMNAR_MAX_COLUMNS = int(os.getenv("COMMAND_COLUMNAR_MAX_COLUMNS", 200))
+
+# 后台集群状态采集：开关、采集间隔（秒）、历史保留时长（秒）与采集线程数
+CLUSTER_POLLER_ENABLED = os.getenv("CLUSTER_POLLER_ENABLED", "false").lower() == "true"
+CLUSTER_POLLER_INTERVAL = float(os.getenv("CLUSTER_POLLER_INTERVAL", 15))
+CLUSTER_POLLER_HISTORY = float(os.getenv("CLUSTER_POLLER_HISTORY", 300))
+CLUSTER_POLLER_WORKERS = int(os.getenv("CLUSTER_POLLER_WORKERS", 4))
+
+# batch_query 单次最多合并的查询条数
+BATCH_QUERY_MAX_SIZE = int(os.getenv("BATCH_QUERY_MAX_SIZE", 50))
+
+# 多集群查询：并发线程池大小（所有请求共享）
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", 8))
+
+# 按时间裁剪按天/按月滚动的索引：时间字段、索引日期与文档时间允许的偏差（小时，覆盖时区差异）、索引列表缓存时间（秒）
+INDEX_PRUNING_ENABLED = os.getenv("INDEX_PRUNING_ENABLED", "true").lower() == "true"
+INDEX_PRUNING_FIELD = os.getenv("INDEX_PRUNING_FIELD", "@timestamp")
+INDEX_PRUNING_SLACK_HOURS = float(os.getenv("INDEX_PRUNING_SLACK_HOURS", 24))
+INDEX_CATALOG_TTL = float(os.getenv("INDEX_CATALOG_TTL", 60))
+
+# 返回给调用方的响应压缩（按 Accept-Encoding 协商 br/gzip）：小于阈值（字节）的非流式响应不压缩
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 5))
+
+# 日志模板归纳（query 的 summarize=templates）：消息/时间字段、相似度阈值、前缀树深度、模板数上限、每个模板的样例数、默认返回的模板数
+LOG_TEMPLATE_MESSAGE_FIELD = os.getenv("LOG_TEMPLATE_MESSAGE_FIELD", "message")
+LOG_TEMPLATE_TIMESTAMP_FIELD = os.getenv("LOG_TEMPLATE_TIMESTAMP_FIELD", "@timestamp")
+LOG_TEMPLATE_SIM_THRESHOLD = float(os.getenv("LOG_TEMPLATE_SIM_THRESHOLD", 0.4))
+LOG_TEMPLATE_DEPTH = int(os.getenv("LOG_TEMPLATE_DEPTH", 4))
+LOG_TEMPLATE_MAX_CLUSTERS = int(os.getenv("LOG_TEMPLATE_MAX_CLUSTERS", 1000))
+LOG_TEMPLATE_SAMPLES = int(os.getenv("LOG_TEMPLATE_SAMPLES", 3))
+LOG_TEMPLATE_TOP = int(os.getenv("LOG_TEMPLATE_TOP", 50))
+
+# 异步查询（_async_search）：结果在ES端的保留时间、提交/获取时默认和最长的同步等待秒数、每个集群同时运行的任务数、服务端记录的任务总数上限
+ASYNC_SEARCH_KEEP_ALIVE = os.getenv("ASYNC_SEARCH_KEEP_ALIVE", "1h")
+ASYNC_SEARCH_WAIT_SECONDS = float(os.getenv("ASYNC_SEARCH_WAIT_SECONDS", 1))
+ASYNC_SEARCH_MAX_WAIT_SECONDS = float(os.getenv("ASYNC_SEARCH_MAX_WAIT_SECONDS", 10))
+ASYNC_SEARCH_MAX_PER_CLUSTER = int(os.getenv("ASYNC_SEARCH_MAX_PER_CLUSTER", 4))
+ASYNC_SEARCH_MAX_JOBS = int(os.getenv("ASYNC_SEARCH_MAX_JOBS", 1000))
+
+# DSL 规范化：键排序、range 中的 now 相对时间按该单位取整（留空不取整）、size=0 聚合开启 request_cache
+DSL_NORMALIZE_ENABLED = os.getenv("DSL_NORMALIZE_ENABLED", "true").lower() == "true"
+DSL_DATE_ROUNDING = os.getenv("DSL_DATE_ROUNDING", "m")
+
+# 查询代价预检：命中高代价写法时的处理策略（reject 拒绝 / rewrite 加 timeout、terminate_after 并收紧 size /
+# report 只在结果中报告、不改查询 / allow 不检查，可按集群用 query_guard 覆盖）、各项阈值、改写时使用的 timeout 与 terminate_after、预检结果缓存时间（秒）
+QUERY_GUARD_POLICIES = ("reject", "rewrite", "report", "allow")
+QUERY_GUARD_POLICY = os.getenv("QUERY_GUARD_POLICY", "report")
+QUERY_GUARD_MAX_SIZE = int(os.getenv("QUERY_GUARD_MAX_SIZE", 1000))
+QUERY_GUARD_MAX_TERMS_SIZE = int(os.getenv("QUERY_GUARD_MAX_TERMS_SIZE", 1000))
+QUERY_GUARD_MAX_SHARDS = int(os.getenv("QUERY_GUARD_MAX_SHARDS", 500))
+QUERY_GUARD_TIMEOUT = os.getenv("QUERY_GUARD_TIMEOUT", "10s")
+QUERY_GUARD_TERMINATE_AFTER = int(os.getenv("QUERY_GUARD_TERMINATE_AFTER", 100000))
+QUERY_GUARD_CACHE_TTL = float(os.getenv("QUERY_GUARD_CACHE_TTL", 60))
+
+# 合并同一集群上相同的在途 query/command 请求（重试风暴时保护ES）
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+# 字段目录（_field_caps）：查询前在本地校验 DSL 中的字段名和类型（可按集群用 field_validation 覆盖）；
+# 目录按 集群+索引表达式 缓存 TTL 秒，最多缓存 MAX_ENTRIES 个；发现未知字段且目录已超过 REFRESH_AFTER 秒时先刷新再判定
+FIELD_VALIDATION_ENABLED = os.getenv("FIELD_VALIDATION_ENABLED", "true").lower() == "true"
+FIELD_CATALOG_TTL = float(os.getenv("FIELD_CATALOG_TTL", 300))
+FIELD_CATALOG_MAX_ENTRIES = int(os.getenv("FIELD_CATALOG_MAX_ENTRIES", 256))
+FIELD_CATALOG_REFRESH_AFTER = float(os.getenv("FIELD_CATALOG_REFRESH_AFTER", 10))
+# 字段目录加载失败（索引不存在、无权限、集群异常）后 FAILURE_TTL 秒内不再重试，期间跳过校验
+FIELD_CATALOG_FAILURE_TTL = float(os.getenv("FIELD_CATALOG_FAILURE_TTL", 30))
+# fields 工具单次最多返回的字段数
+FIELDS_MAX_RESULTS = int(os.getenv("FIELDS_MAX_RESULTS", 1000))
+
+# 慢查询记录：耗时超过 THRESHOLD_MS 的 query 按集群保留最慢的 TOP_K 个（按 DSL 哈希去重）；
+# 新上榜的查询按 PROFILE_SAMPLE_RATE 抽样在后台加 profile 重放，排队的重放超过 MAX_PENDING 时丢弃
+SLOW_QUERY_ENABLED = os.getenv("SLOW_QUERY_ENABLED", "true").lower() == "true"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 1000))
+SLOW_QUERY_TOP_K = int(os.getenv("SLOW_QUERY_TOP_K", 50))
+SLOW_QUERY_PROFILE_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_PROFILE_SAMPLE_RATE", 0.1))
+SLOW_QUERY_PROFILE_MAX_PENDING = int(os.getenv("SLOW_QUERY_PROFILE_MAX_PENDING", 4))
+SLOW_QUERY_MAX_DSL_BYTES = int(os.getenv("SLOW_QUERY_MAX_DSL_BYTES", 4096))
+# 标识调用方（Agent/会话/提示词）的请求头，缺省时记录客户端地址
+SLOW_QUERY_CALLER_HEADER = os.getenv("SLOW_QUERY_CALLER_HEADER", "X-Caller")
+
+RELOAD_INTERVAL = float(os.getenv("CLUSTERS_CONFIG_RELOAD_INTERVAL", 5))
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
 
-    if not config:
-        raise ValueError(f"Cluster {cluster_name} not configured")
+# 字段校验规则：字段名 -> (校验函数, 说明)
+_FIELD_RULES = {
+    "endpoint": (lambda v: isinstance(v, str) and bool(v), "non-empty string"),
+    "username": (lambda v: isinstance(v, str), "string"),
+    "password": (lambda v: isinstance(v, str), "string"),
+    "timeout": (lambda v: _is_number(v) and v > 0, "positive number"),
+    "pool_maxsize": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0, "positive integer"),
+    "max_retries": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v >= 0, "non-negative integer"),
+    "retry_on_timeout": (lambda v: isinstance(v, bool), "boolean"),
+    "keep_alive": (lambda v: isinstance(v, bool), "boolean"),
+    "http_compress": (lambda v: isinstance(v, bool), "boolean"),
+    "idle_timeout": (lambda v: _is_number(v) and v >= 0, "non-negative number"),
+    "breaker_failure_threshold": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0, "positive integer"),
+    "breaker_reset_timeout": (lambda v: _is_number(v) and v > 0, "positive number"),
+    "admission_max_concurrency": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v >= 0, "non-negative integer"),
+    "admission_max_queue": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v >= 0, "non-negative integer"),
+    "admission_queue_timeout": (lambda v: _is_number(v) and v > 0, "positive number"),
+    "async_pool_maxsize": (lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0, "positive integer"),
+    "query_cache_ttl": (lambda v: _is_number(v) and v >= 0, "non-negative number"),
+    "index_pruning": (lambda v: isinstance(v, bool), "boolean"),
+    "field_validation": (lambda v: isinstance(v, bool), "boolean"),
+    "query_guard": (lambda v: v in QUERY_GUARD_POLICIES, f"one of {', '.join(QUERY_GUARD_POLICIES)}"),
+}
+
+@dataclass(frozen=True)
+class ClusterConfig:
+    name: str
+    client_kwargs: Mapping[str, Any]
+    keep_alive: bool
+    idle_timeout: float
+    async_pool_maxsize: int
+    breaker_failure_threshold: int
+    breaker_reset_timeout: float
+    admission_max_concurrency: int
+    admission_max_queue: int
+    admission_queue_timeout: float
+    query_cache_ttl: float
+    index_pruning: bool
+    query_guard: str
+    field_validation: bool
+    options: Mapping[str, Any]
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _compile_cluster(cluster_name: str, config: Any) -> ClusterConfig:
+    if not isinstance(config, dict):
+        raise ValueError(f"Invalid config for cluster {cluster_name}: must be an object")
     if not config.get("endpoint"):
         raise ValueError(f"Invalid config for cluster {cluster_name}: Missing endpoint")
 
-    cluster_config = {
-        "hosts": [config["endpoint"]],
-        "timeout": config.get("timeout", 30)
+    errors = [
+        f"'{field}' must be a {desc}"
+        for field, (check, desc) in _FIELD_RULES.items()
+        if field in config and not check(config[field])
+    ]
+    if errors:
+        raise ValueError(f"Invalid config for cluster {cluster_name}: {'; '.join(errors)}")
+
+    client_kwargs = {
+        "hosts": (config["endpoint"],),
+        "timeout": config.get("timeout", 30),
+        "maxsize": config.get("pool_maxsize", DEFAULT_POOL_MAXSIZE),
+        "max_retries": config.get("max_retries", DEFAULT_MAX_RETRIES),
+        "retry_on_timeout": config.get("retry_on_timeout", DEFAULT_RETRY_ON_TIMEOUT),
+        "http_compress": config.get("http_compress", DEFAULT_HTTP_COMPRESS)
     }
 
     username = config.get("username")
     password = config.get("password")
     if username and password:
-        cluster_config["http_auth"] = (username, password)
+        client_kwargs["http_auth"] = (username, password)
+
+    return ClusterConfig(
+        name=cluster_name,
+        client_kwargs=MappingProxyType(client_kwargs),
+        keep_alive=config.get("keep_alive", DEFAULT_KEEP_ALIVE),
+        idle_timeout=config.get("idle_timeout", DEFAULT_IDLE_TIMEOUT),
+        async_pool_maxsize=config.get("async_pool_maxsize", DEFAULT_ASYNC_POOL_MAXSIZE),
+        breaker_failure_threshold=config.get("breaker_failure_threshold", DEFAULT_BREAKER_FAILURE_THRESHOLD),
+        breaker_reset_timeout=config.get("breaker_reset_timeout", DEFAULT_BREAKER_RESET_TIMEOUT),
+        admission_max_concurrency=config.get("admission_max_concurrency", DEFAULT_ADMISSION_MAX_CONCURRENCY),
+        admission_max_queue=config.get("admission_max_queue", DEFAULT_ADMISSION_MAX_QUEUE),
+        admission_queue_timeout=config.get("admission_queue_timeout", DEFAULT_ADMISSION_QUEUE_TIMEOUT),
+        query_cache_ttl=config.get("query_cache_ttl", QUERY_CACHE_TTL),
+        index_pruning=config.get("index_pruning", INDEX_PRUNING_ENABLED),
+        query_guard=config.get("query_guard", QUERY_GUARD_POLICY),
+        field_validation=config.get("field_validation", FIELD_VALIDATION_ENABLED),
+        options=_freeze(config)
+    )
+
+def compile_clusters(clusters: Any) -> Mapping[str, ClusterConfig]:
+    """
+    校验并编译集群配置，返回不可变的 {集群名: ClusterConfig} 映射；任何一项非法都会整体拒绝。
+    """
+    if not isinstance(clusters, dict):
+        raise ValueError("CLUSTERS_CONFIG must be a JSON object keyed by cluster name")
+    return MappingProxyType({name: _compile_cluster(name, config) for name, config in clusters.items()})
+
+class ClusterConfigStore:
+    """
+    集群配置表：启动时解析校验一次，之后按文件 mtime 检测 .env / CLUSTERS_CONFIG_FILE 的变化并原子替换。
+    查询路径只做字典查找；重新加载失败时保留旧配置。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._env_path = find_dotenv()
+        self._json_path = os.getenv("CLUSTERS_CONFIG_FILE")
+        self._mtimes = self._stat_sources()
+        self._next_check = time.monotonic() + RELOAD_INTERVAL
+        self._table = compile_clusters(self._read_sources())
+        if not self._table:
+            logger.warning("CLUSTERS_CONFIG is empty, no Elasticsearch cluster configured")
+
+    def _stat_sources(self) -> tuple:
+        mtimes = []
+        for path in (self._env_path, self._json_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _read_sources(self) -> Dict[str, Any]:
+        raw = _PROCESS_CLUSTERS_CONFIG
+        if raw is None and self._env_path:
+            raw = dotenv_values(self._env_path).get("CLUSTERS_CONFIG")
+        if raw is None:
+            raw = os.getenv("CLUSTERS_CONFIG")
+
+        try:
+            clusters = json.loads(raw) if raw else {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in CLUSTERS_CONFIG: {e}")
+        if not isinstance(clusters, dict):
+            raise ValueError("CLUSTERS_CONFIG must be a JSON object keyed by cluster name")
+
+        # 可选的 JSON 文件中的集群定义覆盖同名的环境变量定义
+        if self._json_path:
+            try:
+                with open(self._json_path, encoding="utf-8") as f:
+                    file_clusters = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                raise ValueError(f"Invalid CLUSTERS_CONFIG_FILE {self._json_path}: {e}")
+            if not isinstance(file_clusters, dict):
+                raise ValueError(f"CLUSTERS_CONFIG_FILE {self._json_path} must be a JSON object")
+            clusters = {**clusters, **file_clusters}
+        return clusters
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + RELOAD_INTERVAL
+            mtimes = self._stat_sources()
+            if mtimes == self._mtimes:
+                return
+            self._mtimes = mtimes
+            try:
+                self._table = compile_clusters(self._read_sources())
+                logger.info(f"Reloaded cluster config: {', '.join(self._table) or '<empty>'}")
+            except ValueError as e:
+                logger.error(f"Rejected cluster config reload, keeping previous config: {e}")
+
+    def table(self) -> Mapping[str, ClusterConfig]:
+        self._maybe_reload()
+        return self._table
+
+    def get(self, cluster_name: str) -> ClusterConfig:
+        config = self.table().get(cluster_name)
+        if config is None:
+            raise ValueError(f"Cluster {cluster_name} not configured")
+        return config
+
+cluster_configs = ClusterConfigStore()
+
+def get_cluster(cluster_name: str) -> ClusterConfig:
+    return cluster_configs.get(cluster_name)
+
+def list_clusters() -> List[str]:
+    return list(cluster_configs.table())
 
-    return cluster_config
\ No newline at end of file
+def get_cluster_config(cluster_name: str) -> Mapping[str, Any]:
+    return cluster_configs.get(cluster_name).client_kwargs
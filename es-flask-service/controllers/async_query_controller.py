@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : async_query_controller.py
+@Time    : 2026/10/18 11:45
+@Author  : xxlaila
+@Software: dify
+"""
+import asyncio
+import time
+from typing import Optional
+from config.es_config import get_cluster, SINGLEFLIGHT_ENABLED
+from controllers.command_controller import command_flight_key
+from controllers.query_controller import (
+    dsl_hash, prepare_dsl, query_cache_key, lookup_cached_result, build_query_result, with_dsl_hash,
+    with_index_rewrite, with_guard, rejected_result, with_field_check, invalid_fields_result
+)
+from models.admission import AdmissionRejected
+from models.async_es_client import AsyncESClient
+from services.field_catalog import InvalidFields, check_query_fields_async
+from services.index_catalog import prune_query_indices_async
+from services.slow_queries import record_slow_query
+from services.query_guard import QueryRejected, guard_query, inspect_query
+from utils import metrics
+from utils.projection import Projection
+from utils.singleflight import AsyncSingleFlight
+
+# 事件循环内的请求合并（与同步路径的 query_flight/command_flight 相互独立）
+query_flight = AsyncSingleFlight()
+command_flight = AsyncSingleFlight(copy_results=False)
+
+async def _coalesced(flight: AsyncSingleFlight, key: tuple, cluster_name: str, call):
+    if not SINGLEFLIGHT_ENABLED:
+        return await call()
+    response, shared = await flight.do(key, call)
+    if shared:
+        metrics.record_coalesced(cluster_name)
+    return response
+
+# wait_for 的期限比 request_timeout 多留一点：正常情况下由ES客户端先超时（按请求失败反馈给熔断器），
+# wait_for 只兜底客户端没有按时返回的情况
+_DEADLINE_GRACE = 1.0
+
+def _deadline(cluster_name: str, request_timeout: Optional[float]) -> float:
+    return request_timeout or get_cluster(cluster_name).client_kwargs["timeout"]
+
+async def execute_query_async(cluster_name: str, dsl: dict, use_cache: bool = True,
+                              projection: Optional[Projection] = None,
+                              request_timeout: Optional[float] = None, prune_indices: bool = True,
+                              normalize: bool = True) -> dict:
+    """
+    execute_query 的异步版本：缓存、裁剪和返回结构与同步路径完全一致，只是 ES 调用不阻塞线程。
+    """
+    try:
+        dsl = prepare_dsl(dsl, normalize)
+        original_dsl = dsl
+        if projection is not None:
+            dsl = projection.apply_to_dsl(dsl)
+        index_rewrite = None
+        if prune_indices:
+            dsl, index_rewrite = await prune_query_indices_async(cluster_name, dsl)
+        guard = None
+        flags = inspect_query(cluster_name, dsl)
+        if flags:
+            # 预检走同步客户端，放到线程里执行；只有静态检查发现问题的查询才会走到这里
+            dsl, guard = await asyncio.to_thread(guard_query, cluster_name, dsl, flags)
+        cache_key, ttl = query_cache_key(cluster_name, dsl, use_cache)
+        cached = lookup_cached_result(cache_key, projection)
+        if cached is not None:
+            return with_guard(with_dsl_hash(with_index_rewrite(cached, index_rewrite), dsl, normalize), guard)
+        field_check = await check_query_fields_async(cluster_name, original_dsl)
+
+        es = AsyncESClient.get_client(cluster_name)
+        timeout = _deadline(cluster_name, request_timeout)
+        # 超时放在被合并的调用内部：等待方共享同一个结果或同一个超时错误
+        search = lambda: asyncio.wait_for(es.search(**dsl, request_timeout=timeout), timeout + _DEADLINE_GRACE)
+        digest = dsl_hash(dsl)
+        started = time.perf_counter()
+        try:
+            response = await _coalesced(query_flight, (cluster_name, digest, timeout), cluster_name, search)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Query timed out after {timeout}s")
+        record_slow_query(cluster_name, dsl, digest, response, time.perf_counter() - started)
+        result = build_query_result(cluster_name, response, cache_key, ttl, projection)
+        result = with_guard(with_dsl_hash(with_index_rewrite(result, index_rewrite), dsl, normalize), guard)
+        return with_field_check(result, field_check)
+    except InvalidFields as e:
+        return invalid_fields_result(e)
+    except QueryRejected as e:
+        return rejected_result(e)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+async def execute_command_async(es, cluster_name: str, path: str, params: dict,
+                                request_timeout: Optional[float] = None):
+    """
+    异步执行 command 工具的只读请求，异常由调用方转换为 JSON-RPC 错误。
+    """
+    timeout = _deadline(cluster_name, request_timeout)
+    request_params = {**params, "request_timeout": timeout}
+    perform = lambda: asyncio.wait_for(
+        es.transport.perform_request(
+            method='GET',
+            url=f'/{path.lstrip("/")}',
+            params=request_params
+        ),
+        timeout + _DEADLINE_GRACE
+    )
+    try:
+        return await _coalesced(
+            command_flight, command_flight_key(cluster_name, path, request_params), cluster_name, perform
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Command timed out after {timeout}s")
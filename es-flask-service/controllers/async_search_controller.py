@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : async_search_controller.py
+@Time    : 2026/10/18 18:10
+@Author  : xxlaila
+@Software: dify
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from elasticsearch.exceptions import NotFoundError
+from config.es_config import (
+    ASYNC_SEARCH_KEEP_ALIVE, ASYNC_SEARCH_MAX_JOBS, ASYNC_SEARCH_MAX_PER_CLUSTER, ASYNC_SEARCH_MAX_WAIT_SECONDS,
+    ASYNC_SEARCH_WAIT_SECONDS
+)
+from controllers.query_controller import apply_query_guard, rejected_result, with_guard, with_index_rewrite
+from models.admission import AdmissionRejected
+from models.es_client import ESClient
+from services.index_catalog import prune_query_indices
+from services.query_guard import QueryRejected
+from utils.logger import logger
+from utils.projection import Projection
+
+# _async_search 只接受作为 URL 参数的选项，其余键都放进请求体
+_URL_PARAM_KEYS = (
+    "preference", "routing", "search_type", "request_cache", "allow_no_indices", "expand_wildcards",
+    "ignore_unavailable", "allow_partial_search_results", "batched_reduce_size"
+)
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def _duration_seconds(value: str) -> float:
+    match = re.fullmatch(r"(\d+)(ms|s|m|h|d)", value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+class AsyncSearchError(Exception):
+    """
+    异步查询任务不存在/已过期，或集群的并发任务数已达上限。
+    """
+
+@dataclass
+class AsyncSearchJob:
+    id: str  # 对外的任务 ID：<集群名>:<ES 任务 ID>，任何 worker 都能据此找到集群
+    es_id: str
+    cluster_name: str
+    index: Optional[str]
+    submitted_at: float
+    expires_at: float
+    is_running: bool
+    index_rewrite: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        # 索引改写说明放在结果顶层的 index_rewrite 中，与 query 工具一致
+        job = asdict(self)
+        del job["index_rewrite"]
+        return job
+
+def job_id_of(cluster_name: str, es_id: str) -> str:
+    return f"{cluster_name}:{es_id}"
+
+def _parse_job_id(job_id: str) -> Tuple[str, str]:
+    # ES 的任务 ID 是 URL 安全的 base64，不含冒号，按最后一个冒号拆分
+    cluster_name, sep, es_id = job_id.rpartition(":")
+    if not sep or not cluster_name or not es_id:
+        raise AsyncSearchError(f"Async search job {job_id} not found or expired")
+    return cluster_name, es_id
+
+class AsyncSearchJobs:
+    """
+    服务端记录已提交的 _async_search 任务：按 ES 返回的过期时间清理，按集群限制同时运行的任务数。
+    并发名额在提交前预留，避免并发提交同时通过检查。
+    记录只在提交任务的进程内，其他 worker 收到的状态/结果请求按任务 ID 中的集群名向 ES 查询后补建记录。
+    """
+
+    def __init__(self, max_per_cluster: int, max_jobs: int):
+        self.max_per_cluster = max_per_cluster
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, AsyncSearchJob] = {}
+        self._reserved: Dict[str, int] = {}
+
+    def _purge(self):
+        now = time.time()
+        for job_id in [k for k, job in self._jobs.items() if job.expires_at <= now]:
+            del self._jobs[job_id]
+
+    def running(self, cluster_name: str) -> List[AsyncSearchJob]:
+        with self._lock:
+            self._purge()
+            return [job for job in self._jobs.values() if job.cluster_name == cluster_name and job.is_running]
+
+    def reserve(self, cluster_name: str) -> bool:
+        with self._lock:
+            self._purge()
+            running = sum(1 for job in self._jobs.values() if job.cluster_name == cluster_name and job.is_running)
+            if running + self._reserved.get(cluster_name, 0) >= self.max_per_cluster:
+                return False
+            if len(self._jobs) + sum(self._reserved.values()) >= self.max_jobs:
+                raise AsyncSearchError(
+                    f"Too many async search jobs ({self.max_jobs}), fetch them with delete=true or wait for expiry"
+                )
+            self._reserved[cluster_name] = self._reserved.get(cluster_name, 0) + 1
+            return True
+
+    def release(self, cluster_name: str, job: Optional[AsyncSearchJob] = None):
+        with self._lock:
+            self._reserved[cluster_name] -= 1
+            if job is not None:
+                self._jobs[job.id] = job
+
+    def find(self, job_id: str) -> Optional[AsyncSearchJob]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def adopt(self, job: AsyncSearchJob) -> AsyncSearchJob:
+        """
+        登记其他 worker 提交的任务；并发的请求同时补建时以先登记的为准。
+        """
+        with self._lock:
+            return self._jobs.setdefault(job.id, job)
+
+    def update(self, job: AsyncSearchJob, response: dict):
+        job.is_running = response.get("is_running", job.is_running)
+        if response.get("expiration_time_in_millis"):
+            job.expires_at = response["expiration_time_in_millis"] / 1000.0
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._purge()
+            by_cluster = {}
+            for job in self._jobs.values():
+                entry = by_cluster.setdefault(job.cluster_name, {"running": 0, "completed": 0})
+                entry["running" if job.is_running else "completed"] += 1
+            return by_cluster
+
+async_search_jobs = AsyncSearchJobs(ASYNC_SEARCH_MAX_PER_CLUSTER, ASYNC_SEARCH_MAX_JOBS)
+
+def _wait_timeout(wait_seconds: Optional[float]) -> str:
+    wait = ASYNC_SEARCH_WAIT_SECONDS if wait_seconds is None else wait_seconds
+    return f"{int(min(max(wait, 0), ASYNC_SEARCH_MAX_WAIT_SECONDS) * 1000)}ms"
+
+def _refresh_running(cluster_name: str):
+    """
+    并发名额用完时向ES确认"运行中"的任务是否其实已经结束（调用方可能一直没有轮询）。
+    """
+    es = ESClient.get_client(cluster_name)
+    for job in async_search_jobs.running(cluster_name):
+        try:
+            async_search_jobs.update(job, es.async_search.status(id=job.es_id))
+        except Exception as e:
+            logger.warning(f"Refreshing async search {job.id} on {cluster_name} failed: {e}")
+            async_search_jobs.remove(job.id)
+
+def _remote_job(job_id: str, cluster_name: str, es_id: str, response: dict) -> AsyncSearchJob:
+    now = time.time()
+    started = response.get("start_time_in_millis")
+    expires = response.get("expiration_time_in_millis")
+    return AsyncSearchJob(
+        id=job_id, es_id=es_id, cluster_name=cluster_name, index=None,
+        submitted_at=started / 1000.0 if started else now,
+        expires_at=expires / 1000.0 if expires else now + _duration_seconds(ASYNC_SEARCH_KEEP_ALIVE),
+        is_running=bool(response.get("is_running"))
+    )
+
+def _call_job(job_id: str, call: Callable[[Any, str], dict]) -> Tuple[AsyncSearchJob, dict, Any]:
+    """
+    对任务执行 call(es, ES任务ID)，返回 (任务记录, ES响应, ES客户端)。
+    本进程没有该任务的记录时（由其他 worker 提交，或进程重启过），按任务 ID 中的集群名访问 ES，并用响应补建记录。
+    """
+    job = async_search_jobs.find(job_id)
+    cluster_name, es_id = (job.cluster_name, job.es_id) if job is not None else _parse_job_id(job_id)
+    es = ESClient.get_client(cluster_name)
+    try:
+        response = call(es, es_id)
+    except NotFoundError:
+        async_search_jobs.remove(job_id)
+        raise AsyncSearchError(f"Async search job {job_id} not found or expired")
+    if job is None:
+        job = async_search_jobs.adopt(_remote_job(job_id, cluster_name, es_id, response))
+    async_search_jobs.update(job, response)
+    return job, response, es
+
+def _job_result(job: AsyncSearchJob, response: dict, projection: Optional[Projection] = None) -> dict:
+    data = response.get("response")
+    if projection is not None and data is not None:
+        projection.trim(data)
+    result = {
+        "status": "success",
+        "job": job.to_dict(),
+        "is_partial": response.get("is_partial"),
+        "is_running": response.get("is_running")
+    }
+    if data is not None:
+        result["data"] = data
+    return result
+
+def submit_async_search(cluster_name: str, dsl: dict, wait_seconds: Optional[float] = None,
+                        keep_alive: Optional[str] = None, prune_indices: bool = True) -> dict:
+    """
+    提交 _async_search 并在 wait_seconds 内等待结果：这段时间内完成则直接带回结果，否则返回任务 ID 供后续轮询。
+    结果在ES端保留 keep_alive（默认 ASYNC_SEARCH_KEEP_ALIVE），过期后任务自动清理。
+    """
+    try:
+        keep_alive = keep_alive or ASYNC_SEARCH_KEEP_ALIVE
+        ttl = _duration_seconds(keep_alive)
+        index_rewrite = None
+        if prune_indices:
+            dsl, index_rewrite = prune_query_indices(cluster_name, dsl)
+        dsl, guard = apply_query_guard(cluster_name, dsl, limit_runtime=False)
+
+        if not async_search_jobs.reserve(cluster_name):
+            _refresh_running(cluster_name)
+            if not async_search_jobs.reserve(cluster_name):
+                raise AsyncSearchError(
+                    f"Cluster {cluster_name} already has {ASYNC_SEARCH_MAX_PER_CLUSTER} running async searches, "
+                    f"poll or fetch them before submitting more"
+                )
+
+        job = None
+        try:
+            body = {k: v for k, v in dsl.items() if k != "index" and k not in _URL_PARAM_KEYS}
+            if "from_" in body:
+                body["from"] = body.pop("from_")
+            params = {k: dsl[k] for k in _URL_PARAM_KEYS if k in dsl}
+            es = ESClient.get_client(cluster_name)
+            response = es.async_search.submit(
+                body=body, index=dsl.get("index"),
+                wait_for_completion_timeout=_wait_timeout(wait_seconds),
+                keep_on_completion=True, keep_alive=keep_alive, **params
+            )
+            now = time.time()
+            job = AsyncSearchJob(
+                id=job_id_of(cluster_name, response["id"]), es_id=response["id"],
+                cluster_name=cluster_name, index=dsl.get("index"),
+                submitted_at=now, expires_at=now + ttl, is_running=bool(response.get("is_running")),
+                index_rewrite=index_rewrite
+            )
+            async_search_jobs.update(job, response)
+        finally:
+            async_search_jobs.release(cluster_name, job)
+
+        logger.info(f"async search {job.id} on {cluster_name} submitted, running={job.is_running}")
+        return with_guard(with_index_rewrite(_job_result(job, response), index_rewrite), guard)
+    except QueryRejected as e:
+        return rejected_result(e)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+def async_search_status(job_id: str) -> dict:
+    """
+    查询任务进度（不返回结果数据）：is_running、is_partial、已完成的分片数，结束后带 completion_status。
+    """
+    try:
+        job, response, _ = _call_job(job_id, lambda es, es_id: es.async_search.status(id=es_id))
+        return {
+            "status": "success",
+            "job": job.to_dict(),
+            "data": {k: v for k, v in response.items() if k != "id"}
+        }
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+def fetch_async_search(job_id: str, wait_seconds: Optional[float] = None,
+                       projection: Optional[Projection] = None, delete: bool = False) -> dict:
+    """
+    获取任务结果：仍在运行时返回已归并的部分结果（is_partial=true）；delete=true 且任务已结束时取回后删除ES端结果。
+    """
+    try:
+        job, response, es = _call_job(job_id, lambda es, es_id: es.async_search.get(
+            id=es_id, wait_for_completion_timeout=_wait_timeout(wait_seconds or 0)
+        ))
+        result = _job_result(job, response, projection)
+        if delete and not job.is_running:
+            try:
+                es.async_search.delete(id=job.es_id)
+            except Exception as e:
+                logger.warning(f"Deleting async search {job_id} on {job.cluster_name} failed: {e}")
+            async_search_jobs.remove(job_id)
+            result["deleted"] = True
+        return with_index_rewrite(result, job.index_rewrite)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : command_controller.py
+@Time    : 2026/10/18 12:20
+@Author  : xxlaila
+@Software: dify
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from config.es_config import (
+    get_cluster, COMMAND_CACHE_TTLS, COMMAND_CACHE_MAX_BYTES, COMMAND_COLUMNAR_MAX_COLUMNS, SINGLEFLIGHT_ENABLED
+)
+from models.admission import AdmissionRejected
+from models.es_client import ESHttpClient
+from services.cluster_poller import cluster_poller, POLLED_PATHS
+from utils import metrics
+from utils.cache import TTLCache
+from utils.columnar import to_columnar
+from utils.logger import logger
+from utils.singleflight import SingleFlight
+
+command_cache = TTLCache(COMMAND_CACHE_MAX_BYTES)
+# command 结果只读（缓存命中时同样直接返回共享对象），合并时不复制
+command_flight = SingleFlight(copy_results=False)
+
+# 按前缀长度倒序，保证最长前缀优先匹配
+_TTL_PREFIXES = sorted(COMMAND_CACHE_TTLS.items(), key=lambda item: len(item[0]), reverse=True)
+
+# 只影响文本输出的参数，返回 JSON 时没有意义
+_TEXT_ONLY_PARAMS = ("v", "help", "pretty", "human")
+# 支持 bytes=/time= 参数的 _cat 接口（其他接口带上这两个参数ES会报 unrecognized parameter）
+_CAT_BYTES_APIS = ("allocation", "fielddata", "indices", "nodes", "recovery", "segments", "shards")
+_CAT_TIME_APIS = ("indices", "nodes", "pending_tasks", "recovery", "shards", "snapshots", "tasks")
+
+class CommandError(Exception):
+    """
+    command 请求发送到ES后失败（集群不可达或ES返回错误）。
+    """
+
+def normalize_command_path(path: str) -> str:
+    return "/".join(part for part in path.split("/") if part)
+
+def command_cache_ttl(path: str) -> float:
+    """
+    按最长前缀匹配 TTL；索引级路径（如 app-*/_mapping）从第一个以 _ 开头的段开始匹配。
+    """
+    parts = normalize_command_path(path).split("/")
+    start = next((i for i, part in enumerate(parts) if part.startswith("_")), 0)
+    api_path = "/".join(parts[start:])
+    for prefix, ttl in _TTL_PREFIXES:
+        if api_path == prefix or api_path.startswith(prefix + "/"):
+            return ttl
+    return 0
+
+def command_cache_key(cluster_name: str, path: str, params: Dict[str, Any],
+                      use_cache: bool = True) -> Tuple[Optional[tuple], float]:
+    ttl = command_cache_ttl(path)
+    if not use_cache or ttl <= 0:
+        return None, ttl
+    key_params = tuple(sorted((k, str(v)) for k, v in params.items() if k != "request_timeout"))
+    return (cluster_name, normalize_command_path(path), key_params), ttl
+
+def lookup_cached_command(cache_key: Optional[tuple], ttl: float) -> Optional[Tuple[Any, dict]]:
+    if cache_key is None:
+        return None
+    cached = command_cache.get(cache_key)
+    if cached is None:
+        return None
+    response, age = cached
+    return response, {"hit": True, "age": round(age, 3), "ttl": ttl}
+
+def store_command_result(cache_key: Optional[tuple], ttl: float, response: Any) -> Optional[dict]:
+    if cache_key is None:
+        return None
+    command_cache.set(cache_key, response, ttl)
+    return {"hit": False, "age": 0, "ttl": ttl}
+
+def command_flight_key(cluster_name: str, path: str, params: Dict[str, Any]) -> tuple:
+    # 与缓存键不同，超时不同的请求不合并：等待方不能被更长的超时拖住
+    return (cluster_name, normalize_command_path(path), tuple(sorted((k, str(v)) for k, v in params.items())))
+
+def columnar_params(path: str, params: Dict[str, Any], columns: Optional[List[str]] = None,
+                    filter_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    format=columnar 时发给ES的参数：强制 format=json，去掉只影响文本展示的参数；
+    _cat 接口把 columns 下推为 h=，大小和时间统一为字节/毫秒（数字列才能按数字排序），其他接口下推 filter_path。
+    """
+    params = {k: v for k, v in params.items() if k not in _TEXT_ONLY_PARAMS}
+    params["format"] = "json"
+    parts = normalize_command_path(path).split("/")
+    if parts[0] == "_cat":
+        api = parts[1] if len(parts) > 1 else ""
+        if columns:
+            params["h"] = ",".join(columns)
+        if api in _CAT_BYTES_APIS:
+            params.setdefault("bytes", "b")
+        if api in _CAT_TIME_APIS:
+            params.setdefault("time", "ms")
+    elif filter_path:
+        params["filter_path"] = filter_path
+    return params
+
+def columnar_output(path: str, response: Any, columns: Optional[List[str]] = None) -> dict:
+    """
+    把 format=columnar 请求的ES响应转换为列式表格；_cat 接口的列已经由 h= 选好，不再本地过滤。
+    """
+    is_cat = normalize_command_path(path).split("/")[0] == "_cat"
+    return to_columnar(response, None if is_cat else columns, COMMAND_COLUMNAR_MAX_COLUMNS)
+
+def command_history(cluster_name: str, path: str, minutes: float) -> List[dict]:
+    """
+    返回后台采集的最近 N 分钟快照，路径未被采集时抛出 CommandError。
+    """
+    if not cluster_poller.is_collected(path):
+        raise CommandError(
+            f"History is only available for collected paths ({', '.join(POLLED_PATHS)}) "
+            f"when CLUSTER_POLLER_ENABLED=true"
+        )
+    get_cluster(cluster_name)
+    return cluster_poller.history(cluster_name, path, minutes)
+
+def execute_command(cluster_name: str, path: str, params: Dict[str, Any],
+                    request_timeout: Optional[float] = None, use_cache: bool = True) -> Tuple[Any, Optional[dict]]:
+    """
+    执行只读 command 请求，返回 (ES响应, 缓存元数据)；命中后台采集快照或缓存时不访问ES。
+    use_cache=False 时快照和缓存都不用，直接请求ES。
+    """
+    snapshot = cluster_poller.lookup(cluster_name, path, params) if use_cache else None
+    if snapshot is not None:
+        return snapshot
+
+    cache_key, ttl = command_cache_key(cluster_name, path, params, use_cache)
+    cached = lookup_cached_command(cache_key, ttl)
+    if cached is not None:
+        return cached
+
+    es = ESHttpClient.get_client(cluster_name)
+
+    request_params = dict(params)
+    if request_timeout:
+        request_params['request_timeout'] = request_timeout
+    perform = lambda: es.transport.perform_request(
+        method='GET',
+        url=f'/{path.lstrip("/")}',
+        params=request_params
+    )
+    try:
+        if SINGLEFLIGHT_ENABLED:
+            response, shared = command_flight.do(command_flight_key(cluster_name, path, request_params), perform)
+            if shared:
+                metrics.record_coalesced(cluster_name)
+        else:
+            response = perform()
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Command execution failed: {e}")
+        raise CommandError(str(e))
+    logger.info(f"response: {response}")
+    return response, store_command_result(cache_key, ttl, response)
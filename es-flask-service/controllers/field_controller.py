@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : field_controller.py
+@Time    : 2026/10/18 21:30
+@Author  : xxlaila
+@Software: dify
+"""
+import fnmatch
+from typing import Optional
+from config.es_config import FIELDS_MAX_RESULTS
+from models.admission import AdmissionRejected
+from services.field_catalog import field_catalog
+
+def list_fields(cluster_name: str, index: Optional[str] = None, pattern: Optional[str] = None,
+                field_type: Optional[str] = None, refresh: bool = False) -> dict:
+    """
+    返回索引的字段目录（与 query 校验字段使用同一份缓存）：字段名、类型、是否可搜索/可聚合。
+    pattern 按字段名通配符过滤（如 "http.*"），field_type 按类型过滤；多个索引中类型不一致的字段 type 为列表。
+    """
+    try:
+        fields, age = field_catalog.get(cluster_name, index, max_age=0 if refresh else None)
+        names = sorted(fields)
+        if pattern:
+            names = [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+        if field_type:
+            names = [name for name in names if field_type in fields[name].types]
+        data = {
+            "index": index or "_all",
+            "count": len(names),
+            "fields": [
+                {
+                    "name": name,
+                    "type": fields[name].types[0] if len(fields[name].types) == 1 else list(fields[name].types),
+                    "searchable": fields[name].searchable,
+                    "aggregatable": fields[name].aggregatable
+                }
+                for name in names[:FIELDS_MAX_RESULTS]
+            ]
+        }
+        if len(names) > FIELDS_MAX_RESULTS:
+            data["truncated"] = True
+        return {
+            "status": "success",
+            "data": data,
+            "cache": {"age": round(age, 3)}
+        }
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
@@ -5,20 +5,534 @@
 @Author  : xxlaila
 @Software: dify
 """
+import contextvars
+import fnmatch
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from config.es_config import (
+    get_cluster, list_clusters, QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES,
+    STREAM_PAGE_SIZE, STREAM_PIT_KEEP_ALIVE, STREAM_MAX_HITS, BATCH_QUERY_MAX_SIZE, FANOUT_MAX_WORKERS,
+    LOG_TEMPLATE_MESSAGE_FIELD, LOG_TEMPLATE_TIMESTAMP_FIELD, LOG_TEMPLATE_SIM_THRESHOLD, LOG_TEMPLATE_DEPTH,
+    LOG_TEMPLATE_MAX_CLUSTERS, LOG_TEMPLATE_SAMPLES, LOG_TEMPLATE_TOP, SINGLEFLIGHT_ENABLED,
+    DSL_NORMALIZE_ENABLED, DSL_DATE_ROUNDING
+)
+from models.admission import AdmissionRejected
 from models.es_client import ESClient
+from services.field_catalog import InvalidFields, check_query_fields
+from services.index_catalog import prune_query_indices
+from services.slow_queries import record_slow_query
+from services.query_guard import QueryRejected, guard_query, inspect_query
+from utils.cache import TTLCache
+from utils.dsl_normalize import normalize_dsl
+from utils.log_templates import TemplateMiner
+from utils import metrics
+from utils.logger import logger
+from utils.projection import Projection
+from utils.result_merge import merge_aggregations, merge_hits
+from utils.singleflight import SingleFlight
 
-def execute_query(cluster_name: str, dsl: dict) -> dict:
+query_cache = TTLCache(QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES)
+# 多集群查询共享的有界线程池，集群数再多也不会无限制地开线程
+fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="es-fanout")
+# 相同集群上相同 DSL 的在途查询只发一次
+query_flight = SingleFlight()
 
+# 带状态的请求（scroll/PIT）不能复用结果
+_UNCACHEABLE_KEYS = ("scroll", "pit", "search_after")
+# 分页遍历时由服务端接管的参数
+_PAGING_KEYS = ("index", "size", "from_", "scroll", "pit", "search_after", "track_total_hits")
+# 带 PIT 的 search 不接受索引选项，只能在打开 PIT 时传
+_PIT_INDEX_KEYS = ("ignore_unavailable", "allow_no_indices", "expand_wildcards")
+# _msearch 中只能放在每条查询 header 行里的参数
+_MSEARCH_HEADER_KEYS = (
+    "index", "preference", "routing", "search_type", "request_cache",
+    "allow_no_indices", "expand_wildcards", "ignore_unavailable", "allow_partial_search_results"
+)
+
+def canonicalize_dsl(dsl: dict) -> str:
+    """
+    DSL 的规范化表示：键排序、去掉多余空白，字段顺序不同的同一查询得到相同的字符串。
+    """
+    return json.dumps(dsl, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def dsl_hash(dsl: dict) -> str:
+    """
+    规范化 DSL 的稳定哈希，用作缓存/合并键，也在结果中返回便于比对同一查询。
+    """
+    return hashlib.sha256(canonicalize_dsl(dsl).encode("utf-8")).hexdigest()
+
+def prepare_dsl(dsl: dict, normalize: bool = True) -> dict:
+    if not normalize or not DSL_NORMALIZE_ENABLED:
+        return dsl
+    return normalize_dsl(dsl, DSL_DATE_ROUNDING or None)
+
+def _summarize(response: dict) -> str:
+    hits = response.get("hits", {})
+    return f"took={response.get('took')}ms hits={len(hits.get('hits', []))} total={hits.get('total')}"
+
+def query_cache_key(cluster_name: str, dsl: dict, use_cache: bool = True) -> Tuple[Optional[tuple], float]:
+    """
+    返回 (缓存键, TTL)；该查询不可缓存时缓存键为 None。
+    """
+    ttl = get_cluster(cluster_name).query_cache_ttl
+    if not use_cache or ttl <= 0 or any(k in dsl for k in _UNCACHEABLE_KEYS):
+        return None, ttl
+    return (cluster_name, dsl_hash(dsl)), ttl
+
+def coalesced_search(cluster_name: str, dsl: dict, request_timeout: Optional[float], search) -> dict:
+    """
+    与在途的相同查询（同集群、同规范化 DSL、同超时）共享一次ES请求。
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return search()
+    key = (cluster_name, dsl_hash(dsl), request_timeout)
+    response, shared = query_flight.do(key, search)
+    if shared:
+        metrics.record_coalesced(cluster_name)
+    return response
+
+def with_index_rewrite(result: dict, index_rewrite: Optional[dict]) -> dict:
+    if index_rewrite is not None:
+        result["index_rewrite"] = index_rewrite
+    return result
+
+def apply_query_guard(cluster_name: str, dsl: dict, paged: bool = False,
+                      limit_runtime: bool = True) -> Tuple[dict, Optional[dict]]:
+    """
+    静态检查没有发现高代价写法时直接放行（不访问ES），否则交给 guard_query 预检；被拒绝时抛出 QueryRejected。
+    paged、limit_runtime 的含义见 inspect_query 和 guard_query。
+    """
+    flags = inspect_query(cluster_name, dsl, paged)
+    if not flags:
+        return dsl, None
+    return guard_query(cluster_name, dsl, flags, limit_runtime)
+
+def with_guard(result: dict, guard: Optional[dict]) -> dict:
+    if guard is not None:
+        result["guard"] = guard
+    return result
+
+def rejected_result(e: QueryRejected) -> dict:
+    return {"status": "error", "message": str(e), "guard": e.report}
+
+def with_field_check(result: dict, field_check: Optional[dict]) -> dict:
+    if field_check is not None:
+        result["field_check"] = field_check
+    return result
+
+def invalid_fields_result(e: InvalidFields) -> dict:
+    return {"status": "error", "message": str(e), "field_check": e.report}
+
+def with_dsl_hash(result: dict, dsl: dict, normalize: bool = True) -> dict:
+    if normalize and DSL_NORMALIZE_ENABLED:
+        result["dsl_hash"] = dsl_hash(dsl)
+    return result
+
+def lookup_cached_result(cache_key: Optional[tuple], projection: Optional[Projection] = None) -> Optional[dict]:
+    if cache_key is None:
+        return None
+    cached = query_cache.get(cache_key)
+    if cached is None:
+        return None
+    response, age = cached
+    return {
+        "status": "success",
+        "data": projection.trim(response) if projection else response,
+        "cache": {"hit": True, "age": round(age, 3)}
+    }
+
+def build_query_result(cluster_name: str, response: dict, cache_key: Optional[tuple], ttl: float,
+                       projection: Optional[Projection] = None) -> dict:
+    logger.info(f"query {cluster_name}: {_summarize(response)}")
+    result = {
+        "status": "success",
+        "data": response
+    }
+    if cache_key is not None:
+        query_cache.set(cache_key, response, ttl)
+        result["cache"] = {"hit": False}
+    # 缓存中保存的是未截断的结果，截断只作用于本次返回
+    if projection is not None:
+        projection.trim(response)
+    return result
+
+def execute_query(cluster_name: str, dsl: dict, use_cache: bool = True,
+                  projection: Optional[Projection] = None, request_timeout: Optional[float] = None,
+                  prune_indices: bool = True, summarize: Optional[str] = None,
+                  message_field: Optional[str] = None, max_hits: Optional[int] = None,
+                  top_templates: Optional[int] = None, normalize: bool = True) -> dict:
+
+    if summarize == "templates":
+        return summarize_templates(cluster_name, dsl, message_field, max_hits, top_templates,
+                                   projection, prune_indices)
     try:
+        dsl = prepare_dsl(dsl, normalize)
+        # 字段目录按原始索引表达式缓存，用裁剪之前的 DSL 校验
+        original_dsl = dsl
+        if projection is not None:
+            dsl = projection.apply_to_dsl(dsl)
+        index_rewrite = None
+        if prune_indices:
+            dsl, index_rewrite = prune_query_indices(cluster_name, dsl)
+        # 在裁剪之后预检：分片数按改写后的索引估算
+        dsl, guard = apply_query_guard(cluster_name, dsl)
+        cache_key, ttl = query_cache_key(cluster_name, dsl, use_cache)
+        cached = lookup_cached_result(cache_key, projection)
+        if cached is not None:
+            # 字段有错误的查询不会进入缓存，命中缓存时不再校验字段
+            return with_guard(with_dsl_hash(with_index_rewrite(cached, index_rewrite), dsl, normalize), guard)
+        field_check = check_query_fields(cluster_name, original_dsl)
+
         es = ESClient.get_client(cluster_name)
-        response = es.search(**dsl)
-        print(f"response: {response}")
+        if request_timeout:
+            search = lambda: es.search(**dsl, request_timeout=request_timeout)
+        else:
+            search = lambda: es.search(**dsl)
+        started = time.perf_counter()
+        response = coalesced_search(cluster_name, dsl, request_timeout, search)
+        record_slow_query(cluster_name, dsl, dsl_hash(dsl), response, time.perf_counter() - started)
+        result = build_query_result(cluster_name, response, cache_key, ttl, projection)
+        result = with_guard(with_dsl_hash(with_index_rewrite(result, index_rewrite), dsl, normalize), guard)
+        return with_field_check(result, field_check)
+    except InvalidFields as e:
+        return invalid_fields_result(e)
+    except QueryRejected as e:
+        return rejected_result(e)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+def execute_batch_query(cluster_name: str, queries: List[dict], use_cache: bool = True,
+                        normalize: bool = True) -> dict:
+    """
+    将多条 {index, dsl} 合并成一次 _msearch 请求，按输入顺序返回每条查询的结果或错误。
+    已命中结果缓存的条目不会再发给ES。
+    """
+    if not queries:
+        return {"status": "error", "message": "queries must not be empty"}
+    if len(queries) > BATCH_QUERY_MAX_SIZE:
+        return {"status": "error", "message": f"At most {BATCH_QUERY_MAX_SIZE} queries per batch"}
+
+    try:
+        results = [None] * len(queries)
+        pending = []  # (position, cache_key, ttl, header, body, index_rewrite, guard, field_check)
+
+        for i, entry in enumerate(queries):
+            if not isinstance(entry, dict) or not isinstance(entry.get("dsl"), dict):
+                results[i] = {"status": "error", "message": "Each entry must be an object with a 'dsl' object"}
+                continue
+            dsl = dict(prepare_dsl(entry["dsl"], normalize))
+            if entry.get("index"):
+                dsl["index"] = entry["index"]
+            original_dsl = dsl
+            try:
+                dsl, index_rewrite = prune_query_indices(cluster_name, dsl)
+                dsl, guard = apply_query_guard(cluster_name, dsl)
+            except QueryRejected as e:
+                results[i] = rejected_result(e)
+                continue
+
+            cache_key, ttl = query_cache_key(cluster_name, dsl, use_cache)
+            cached = lookup_cached_result(cache_key)
+            if cached is not None:
+                results[i] = with_guard(with_index_rewrite(cached, index_rewrite), guard)
+                continue
+            try:
+                field_check = check_query_fields(cluster_name, original_dsl)
+            except InvalidFields as e:
+                results[i] = invalid_fields_result(e)
+                continue
+
+            header = {k: dsl.pop(k) for k in _MSEARCH_HEADER_KEYS if k in dsl}
+            if "from_" in dsl:
+                dsl["from"] = dsl.pop("from_")
+            pending.append((i, cache_key, ttl, header, dsl, index_rewrite, guard, field_check))
+
+        if pending:
+            es = ESClient.get_client(cluster_name)
+            body = []
+            for _, _, _, header, dsl, _, _, _ in pending:
+                body.extend((header, dsl))
+            responses = es.msearch(body=body)["responses"]
+
+            for (i, cache_key, ttl, _, _, index_rewrite, guard, field_check), response in zip(pending, responses):
+                if "error" in response:
+                    error = response["error"]
+                    reason = error.get("reason", error) if isinstance(error, dict) else error
+                    results[i] = {"status": "error", "message": str(reason), "http_status": response.get("status")}
+                    continue
+                response.pop("status", None)
+                result = build_query_result(cluster_name, response, cache_key, ttl)
+                results[i] = with_field_check(with_guard(with_index_rewrite(result, index_rewrite), guard), field_check)
+
         return {
             "status": "success",
-            "data": response
+            "data": results
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {
             "status": "error",
             "message": str(e)
-        }
\ No newline at end of file
+        }
+
+def resolve_clusters(patterns: List[str]) -> List[str]:
+    """
+    将集群名列表（支持 es-* 这类通配符）展开为已配置的集群名，按配置顺序去重。
+    """
+    configured = list_clusters()
+    resolved = [name for name in configured if any(fnmatch.fnmatchcase(name, p) for p in patterns)]
+    unknown = [p for p in patterns if not any(c in ("*", "?", "[") for c in p) and p not in configured]
+    if unknown:
+        raise ValueError(f"Cluster {', '.join(unknown)} not configured")
+    if not resolved:
+        raise ValueError(f"No configured cluster matches {', '.join(patterns)}")
+    return resolved
+
+def execute_multi_cluster_query(clusters: List[str], dsl: dict, use_cache: bool = True,
+                                projection: Optional[Projection] = None,
+                                request_timeout: Optional[float] = None, normalize: bool = True) -> dict:
+    """
+    在多个集群上并行执行同一 DSL 并合并结果：命中按排序键（默认 _score）重新排序，聚合按桶合并，
+    失败的集群单独列在 errors 中。总耗时取决于最慢的集群。
+    分页在合并后进行，因此每个集群都要返回前 from+size 条。
+    """
+    try:
+        names = resolve_clusters(clusters)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    size = dsl.get("size", 10)
+    from_ = dsl.get("from_", dsl.get("from", 0))
+    cluster_dsl = {k: v for k, v in dsl.items() if k not in ("from", "from_")}
+    cluster_dsl["size"] = from_ + size
+    if projection is not None:
+        cluster_dsl = projection.apply_to_dsl(cluster_dsl)
+
+    started = time.perf_counter()
+    futures = {
+        # 复制当前上下文，工作线程里的上游耗时指标仍归属当前工具
+        name: fanout_pool.submit(contextvars.copy_context().run, execute_query,
+                                 name, cluster_dsl, use_cache, None, request_timeout, normalize=normalize)
+        for name in names
+    }
+    responses, clusters_meta, errors = [], {}, {}
+    for name, future in futures.items():
+        try:
+            result = future.result()
+        except AdmissionRejected as e:
+            # 单个集群过载只记入 errors，其他集群的结果照常合并
+            errors[name] = str(e)
+            continue
+        if result["status"] != "success":
+            errors[name] = result.get("message")
+            continue
+        response = result["data"]
+        responses.append((name, response))
+        clusters_meta[name] = with_index_rewrite(
+            {"took": response.get("took"), "cache": result.get("cache", {"hit": False})}, result.get("index_rewrite"))
+
+    if not responses:
+        return {"status": "error", "message": "Query failed on all clusters", "errors": errors}
+
+    merged = {
+        "took": max(r.get("took") or 0 for _, r in responses),
+        "timed_out": any(r.get("timed_out") for _, r in responses),
+        "_shards": {
+            key: sum((r.get("_shards") or {}).get(key, 0) for _, r in responses)
+            for key in ("total", "successful", "skipped", "failed")
+        },
+        "hits": merge_hits(responses, dsl.get("sort"), from_, size)
+    }
+    agg_dsl = dsl.get("aggs") or dsl.get("aggregations")
+    if agg_dsl:
+        parts = [(name, r.get("aggregations") or {}, _total_value(r)) for name, r in responses]
+        merged["aggregations"] = merge_aggregations(parts, agg_dsl)
+
+    logger.info(f"multi-cluster query on {len(names)} clusters ({len(errors)} failed) "
+                f"in {time.perf_counter() - started:.3f}s: {_summarize(merged)}")
+    if projection is not None:
+        projection.trim(merged)
+    return {
+        "status": "success",
+        "data": merged,
+        "clusters": clusters_meta,
+        "errors": errors
+    }
+
+def _total_value(response: dict) -> Optional[float]:
+    total = (response.get("hits") or {}).get("total")
+    return total.get("value") if isinstance(total, dict) else total
+
+def iter_hits(cluster_name: str, dsl: dict, max_hits: Optional[int] = None,
+              page_size: int = STREAM_PAGE_SIZE) -> Iterator[dict]:
+    """
+    基于 point-in-time + search_after 逐页遍历命中，内存中最多只保留一页数据。
+    未指定排序时按 _shard_doc 排序（PIT 下最高效的遍历顺序）。
+    """
+    limit = min(max_hits or STREAM_MAX_HITS, STREAM_MAX_HITS)
+    es = ESClient.get_client(cluster_name)
+    body = {k: v for k, v in dsl.items() if k not in _PAGING_KEYS and k not in _PIT_INDEX_KEYS}
+    body.setdefault("sort", ["_shard_doc"])
+    index_options = {k: dsl[k] for k in _PIT_INDEX_KEYS if k in dsl}
+
+    pit_id = es.open_point_in_time(
+        index=dsl.get("index") or "_all", keep_alive=STREAM_PIT_KEEP_ALIVE, **index_options
+    )["id"]
+    try:
+        emitted = 0
+        search_after = None
+        while emitted < limit:
+            page = es.search(
+                **body,
+                size=min(page_size, limit - emitted),
+                pit={"id": pit_id, "keep_alive": STREAM_PIT_KEEP_ALIVE},
+                search_after=search_after,
+                track_total_hits=False
+            )
+            pit_id = page.get("pit_id", pit_id)
+            hits = page["hits"]["hits"]
+            for hit in hits:
+                yield hit
+            emitted += len(hits)
+            if len(hits) < page_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(body={"id": pit_id})
+        except Exception as e:
+            logger.warning(f"Closing PIT on cluster {cluster_name} failed: {e}")
+
+def stream_query(cluster_name: str, dsl: dict, max_hits: Optional[int] = None,
+                 stream_format: str = "ndjson", projection: Optional[Projection] = None,
+                 prune_indices: bool = True) -> Iterator[str]:
+    """
+    将 iter_hits 的结果编码为 NDJSON（每行一个命中）或 SSE 事件流，最后输出一条 summary。
+    流式模式下只下推 _source 过滤并截断超长字段；filter_path 会丢掉分页所需的 sort 值，因此不生效。
+    """
+    if projection is not None:
+        dsl = Projection(includes=projection.includes, excludes=projection.excludes).apply_to_dsl(dsl)
+    index_rewrite = None
+    if prune_indices:
+        dsl, index_rewrite = prune_query_indices(cluster_name, dsl)
+
+    def encode(kind: str, payload: dict) -> str:
+        if stream_format == "sse":
+            return f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        # NDJSON：命中原样输出一行，控制消息带 type 字段以便区分
+        line = payload if kind == "hit" else {"type": kind, **payload}
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    count = 0
+    try:
+        try:
+            dsl, guard = apply_query_guard(cluster_name, dsl, paged=True)
+        except QueryRejected as e:
+            yield encode("error", {**rejected_result(e), "count": 0})
+            return
+        for hit in iter_hits(cluster_name, dsl, max_hits):
+            count += 1
+            if projection is not None:
+                projection.trim_hit(hit)
+            yield encode("hit", hit)
+        limit = min(max_hits or STREAM_MAX_HITS, STREAM_MAX_HITS)
+        summary = {"status": "success", "count": count, "limit_reached": count >= limit}
+        yield encode("summary", with_guard(with_index_rewrite(summary, index_rewrite), guard))
+    except Exception as e:
+        logger.error(f"Stream query on cluster {cluster_name} failed after {count} hits: {e}")
+        yield encode("error", {"status": "error", "count": count, "message": str(e)})
+
+def _field_value(hit: dict, field: str):
+    """
+    按点分路径读取 _source 中的字段（兼容 "log.message" 这种扁平键），取不到时再看 fields。
+    """
+    source = hit.get("_source") or {}
+    if field in source:
+        value = source[field]
+    else:
+        value = source
+        for part in field.split("."):
+            if not isinstance(value, dict) or part not in value:
+                value = None
+                break
+            value = value[part]
+    if value is None:
+        value = (hit.get("fields") or {}).get(field)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+def summarize_templates(cluster_name: str, dsl: dict, message_field: Optional[str] = None,
+                        max_hits: Optional[int] = None, top: Optional[int] = None,
+                        projection: Optional[Projection] = None, prune_indices: bool = True) -> dict:
+    """
+    把命中的日志按 Drain 算法归纳成模板，返回每个模板的条数、首末时间和少量样例，代替原始命中。
+    通过 iter_hits 逐页拉取，模板归纳是增量的，内存只与模板数有关；未指定 includes 时只拉取消息和时间字段。
+    """
+    message_field = message_field or LOG_TEMPLATE_MESSAGE_FIELD
+    timestamp_field = LOG_TEMPLATE_TIMESTAMP_FIELD
+    includes = list(projection.includes) if projection is not None and projection.includes else []
+    for field in (message_field, timestamp_field):
+        if field not in includes:
+            includes.append(field)
+    dsl = {k: v for k, v in dsl.items() if k not in ("aggs", "aggregations", "filter_path")}
+    dsl["_source"] = {"includes": includes}
+    if projection is not None and projection.excludes:
+        dsl["_source"]["excludes"] = [f for f in projection.excludes if f not in (message_field, timestamp_field)]
+    index_rewrite = None
+    if prune_indices:
+        dsl, index_rewrite = prune_query_indices(cluster_name, dsl)
+    # 模板归纳要翻页扫描大量命中，同样需要代价预检
+    try:
+        dsl, guard = apply_query_guard(cluster_name, dsl, paged=True)
+    except QueryRejected as e:
+        return rejected_result(e)
+
+    miner = TemplateMiner(
+        depth=LOG_TEMPLATE_DEPTH, sim_threshold=LOG_TEMPLATE_SIM_THRESHOLD,
+        max_clusters=LOG_TEMPLATE_MAX_CLUSTERS, sample_size=LOG_TEMPLATE_SAMPLES
+    )
+    scanned, missing = 0, 0
+    started = time.perf_counter()
+    try:
+        for hit in iter_hits(cluster_name, dsl, max_hits):
+            scanned += 1
+            message = _field_value(hit, message_field)
+            if message is None:
+                missing += 1
+                continue
+            sample = {k: hit[k] for k in ("_index", "_id", "_source") if k in hit}
+            if projection is not None:
+                projection.trim_hit(sample)
+            miner.add(str(message), _field_value(hit, timestamp_field), sample)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Template summary on cluster {cluster_name} failed after {scanned} hits: {e}")
+        return {"status": "error", "message": str(e)}
+
+    limit = min(max_hits or STREAM_MAX_HITS, STREAM_MAX_HITS)
+    templates = miner.results(top or LOG_TEMPLATE_TOP)
+    logger.info(f"template summary {cluster_name}: hits={scanned} templates={len(miner.clusters)} "
+                f"in {time.perf_counter() - started:.3f}s")
+    return with_guard(with_index_rewrite({
+        "status": "success",
+        "data": {
+            "message_field": message_field,
+            "hits_scanned": scanned,
+            "limit_reached": scanned >= limit,
+            "missing_message": missing,
+            "unclustered": miner.unclustered,
+            "template_count": len(miner.clusters),
+            "templates": templates
+        }
+    }, index_rewrite), guard)
@@ -8,6 +8,9 @@
 from flask import jsonify
 
 def generate_swagger_doc(tools):
+    return jsonify(build_swagger_doc(tools))
+
+def build_swagger_doc(tools) -> dict:
     # 动态生成 Paths 和 Components
     paths = {}
     schemas = {}
@@ -76,4 +79,4 @@ def generate_swagger_doc(tools):
             "schemas": schemas
         }
     }
-    return jsonify(swagger_doc)
\ No newline at end of file
+    return swagger_doc
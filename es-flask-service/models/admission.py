@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : admission.py
+@Time    : 2026/10/18 20:40
+@Author  : xxlaila
+@Software: dify
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from utils import metrics
+
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 1
+_MAX_RETRY_AFTER = 60
+
+class AdmissionRejected(Exception):
+    """
+    集群并发名额已满且排队已满（queue_full），或排队超过 queue_timeout（timeout），由接口层转换为 429。
+    """
+
+    def __init__(self, cluster_name: str, reason: str, retry_after: int):
+        self.cluster_name = cluster_name
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(str(self))
+
+    def __str__(self):
+        detail = "queue is full" if self.reason == "queue_full" else "timed out waiting in queue"
+        return f"Cluster {self.cluster_name} is overloaded ({detail}), retry after {self.retry_after}s"
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "abandoned")
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.granted = False
+        self.abandoned = False
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class AdmissionController:
+    """
+    单个集群的准入控制：最多 max_concurrency 个请求同时发往ES，其余按 (优先级, 到达顺序) 排队，
+    队列超过 max_queue 或排队超过 queue_timeout 时拒绝并给出建议重试时间。
+    名额释放时直接交给队首请求，同步线程与事件循环中的协程共用同一个队列。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []  # (优先级, 序号, _Waiter)；放弃排队的条目惰性删除
+        self._seq = itertools.count()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        # 名额占用时长的指数滑动平均，用于估算 Retry-After
+        self._hold_avg = 0.0
+
+    def configure(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self.queue_timeout = queue_timeout
+            self._dispatch()
+
+    def acquire(self, priority: int = NORMAL_PRIORITY) -> float:
+        """
+        阻塞直到拿到名额，返回排队时长（秒）；被拒绝时抛出 AdmissionRejected。
+        """
+        started = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(priority, event.set)
+        if waiter is not None and not event.wait(self.queue_timeout):
+            self._abandon(waiter)
+        return time.monotonic() - started
+
+    async def acquire_async(self, priority: int = NORMAL_PRIORITY) -> float:
+        """
+        acquire 的协程版本：排队期间不阻塞事件循环。
+        """
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enter(priority, lambda: loop.call_soon_threadsafe(_resolve, future))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+            except asyncio.CancelledError:
+                # 取消时若名额已经交过来，要还回去
+                if not self._abandon(waiter, cancelled=True):
+                    self.release(0.0)
+                raise
+        return time.monotonic() - started
+
+    def release(self, held: float):
+        with self._lock:
+            self._hold_avg = held if not self._hold_avg else 0.8 * self._hold_avg + 0.2 * held
+            self.active -= 1
+            self._dispatch()
+
+    def _enter(self, priority: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """
+        有空闲名额时直接占用并返回 None，否则入队返回等待对象；队列已满时拒绝。
+        """
+        with self._lock:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                self.admitted += 1
+                self._publish()
+                return None
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(self.name, "queue_full", self._retry_after())
+            waiter = _Waiter(wake)
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self.queued += 1
+            self._publish()
+            return waiter
+
+    def _abandon(self, waiter: _Waiter, cancelled: bool = False) -> bool:
+        """
+        等待超时或被取消时退出队列；若名额恰好已交给它则视为拿到名额，返回 False。
+        """
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.abandoned = True
+            self.queued -= 1
+            self._publish()
+            if cancelled:
+                return True
+            self.rejected += 1
+            raise AdmissionRejected(self.name, "timeout", self._retry_after())
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency and self._heap:
+            waiter = heapq.heappop(self._heap)[2]
+            if waiter.abandoned:
+                continue
+            waiter.granted = True
+            self.queued -= 1
+            self.active += 1
+            self.admitted += 1
+            waiter.wake()
+        self._publish()
+
+    def _retry_after(self) -> int:
+        # 按当前排队数和平均占用时长估算队列排空所需时间
+        slots = max(self.max_concurrency, 1)
+        estimate = (self.queued + 1) * max(self._hold_avg, 0.1) / slots
+        return min(max(1, math.ceil(estimate)), _MAX_RETRY_AFTER)
+
+    def _publish(self):
+        metrics.admission_queue_depth.set(self.queued, self.name)
+        metrics.admission_in_flight.set(self.active, self.name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "in_flight": self.active,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_hold_seconds": round(self._hold_avg, 3)
+            }
+
+class AdmissionRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._controllers: Dict[str, AdmissionController] = {}
+
+    def get(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float) -> AdmissionController:
+        with self._lock:
+            controller = self._controllers.get(name)
+            if controller is None:
+                controller = self._controllers[name] = AdmissionController(
+                    name, max_concurrency, max_queue, queue_timeout)
+            else:
+                controller.configure(max_concurrency, max_queue, queue_timeout)
+            return controller
+
+    def states(self) -> Dict[str, dict]:
+        with self._lock:
+            controllers = list(self._controllers.values())
+        return {c.name: c.snapshot() for c in controllers}
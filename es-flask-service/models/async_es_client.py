@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : async_es_client.py
+@Time    : 2026/10/18 11:40
+@Author  : xxlaila
+@Software: dify
+"""
+import asyncio
+import time
+from elasticsearch import AsyncElasticsearch, AsyncTransport
+from config.es_config import get_cluster
+from models.admission import AdmissionController, AdmissionRejected
+from models.circuit_breaker import CircuitBreaker
+from models.es_client import get_admission, get_breaker, request_priority
+from utils import metrics
+from utils.logger import logger
+
+class AsyncClusterTransport(AsyncTransport):
+    """
+    ClusterTransport 的异步版本，与同步客户端共用同一个集群准入队列、熔断器和指标。
+    """
+    cluster_name: str = None
+    breaker: CircuitBreaker = None
+    admission: AdmissionController = None
+
+    async def perform_request(self, method, url, headers=None, params=None, body=None):
+        admission = self.admission
+        if admission is not None:
+            try:
+                metrics.record_admission(self.cluster_name, await admission.acquire_async(request_priority()))
+            except AdmissionRejected as e:
+                metrics.record_admission(self.cluster_name, rejected=e.reason)
+                raise
+        started = time.perf_counter()
+        try:
+            return await self._perform_guarded(method, url, headers, params, body, started)
+        finally:
+            if admission is not None:
+                admission.release(time.perf_counter() - started)
+
+    async def _perform_guarded(self, method, url, headers, params, body, started):
+        breaker = self.breaker
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            result = await super().perform_request(method, url, headers=headers, params=params, body=body)
+        except asyncio.CancelledError as e:
+            # 调用方取消（wait_for 超时、客户端断开）不能说明集群状态，但必须归还半开状态的试探名额，
+            # 否则熔断器一直停在 half_open，之后该集群的所有请求都会被拒绝
+            metrics.record_upstream(self.cluster_name, time.perf_counter() - started, error=e)
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            metrics.record_upstream(self.cluster_name, time.perf_counter() - started, error=e)
+            if breaker is not None:
+                breaker.record_error(e)
+            raise
+        metrics.record_upstream(self.cluster_name, time.perf_counter() - started, result)
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+class AsyncESClient:
+    """
+    异步服务模式（asgi.py）使用的客户端：每个集群一个长连接 AsyncElasticsearch，
+    只在事件循环线程内访问，因此不需要加锁。配置热加载后自动重建。
+    verify_certs 与同步路径保持一致：query 校验证书，command 不校验。
+    """
+    _clients = {}
+
+    @classmethod
+    def get_client(cls, cluster_name: str, verify_certs: bool = True) -> AsyncElasticsearch:
+        config = get_cluster(cluster_name)
+        key = (cluster_name, verify_certs)
+        entry = cls._clients.get(key)
+        if entry is not None and entry[1] is config:
+            return entry[0]
+
+        if entry is not None:
+            logger.info(f"Cluster {cluster_name} config changed, rebuilding async client")
+            asyncio.ensure_future(cls._close(entry[0]))
+        overrides = {"maxsize": config.async_pool_maxsize}
+        if not verify_certs:
+            overrides["verify_certs"] = False
+        try:
+            es = AsyncElasticsearch(**{**config.client_kwargs, **overrides}, transport_class=AsyncClusterTransport)
+            es.transport.cluster_name = config.name
+            es.transport.breaker = get_breaker(config)
+            es.transport.admission = get_admission(config)
+        except Exception as e:
+            raise RuntimeError(f"ES connection failed: {str(e)}")
+        cls._clients[key] = (es, config)
+        return es
+
+    @classmethod
+    async def close_all(cls):
+        clients, cls._clients = cls._clients, {}
+        for es, _ in clients.values():
+            await cls._close(es)
+
+    @staticmethod
+    async def _close(es: AsyncElasticsearch):
+        try:
+            await es.close()
+        except Exception as e:
+            logger.warning(f"Closing async ES client failed: {e}")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : circuit_breaker.py
+@Time    : 2026/10/18 13:10
+@Author  : xxlaila
+@Software: dify
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+from elasticsearch.exceptions import ConnectionError as ESConnectionError, TransportError
+from utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(ESConnectionError):
+    """
+    熔断打开时快速失败，继承 ES 的 ConnectionError，已有的连接异常处理逻辑无需改动。
+    """
+
+    def __init__(self, cluster_name: str, retry_after: float):
+        self.cluster_name = cluster_name
+        self.retry_after = retry_after
+        super().__init__("N/A", f"Cluster {cluster_name} is unavailable (circuit open)", None)
+
+    def __str__(self):
+        return f"Cluster {self.cluster_name} is unavailable (circuit open), retry after {self.retry_after:.1f}s"
+
+def is_failure(error: Exception) -> bool:
+    """
+    连接失败、超时以及 5xx 视为集群故障；4xx 说明集群能正常响应，不计入失败。
+    """
+    if isinstance(error, ESConnectionError):
+        return True
+    if isinstance(error, TransportError):
+        return not isinstance(error.status_code, int) or error.status_code >= 500
+    return False
+
+class CircuitBreaker:
+    """
+    单个集群的熔断器：由真实请求结果驱动。
+    closed  -> 连续失败 failure_threshold 次 -> open（快速失败，后台定时探活）
+    open    -> 探活成功 -> half_open（只放行一个试探请求）
+    half_open -> 试探成功 -> closed；试探失败 -> open
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 probe: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self.last_success = None
+        self._trial_in_flight = False
+        self._probe_timer = None
+
+    def configure(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def before_request(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_after = max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.last_success = time.time()
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                logger.info(f"Circuit for cluster {self.name} closed")
+                self.state = CLOSED
+
+    def record_error(self, error: Exception):
+        """
+        按异常类型反馈请求结果：集群故障计入失败，4xx 说明集群可用，其余异常只释放试探名额。
+        """
+        if is_failure(error):
+            self.record_failure(error)
+        elif isinstance(error, TransportError):
+            self.record_success()
+        else:
+            self.release()
+
+    def release(self):
+        """
+        请求因与集群健康无关的原因结束（如序列化异常），只释放试探名额。
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+
+    def _open(self):
+        logger.warning(f"Circuit for cluster {self.name} opened after {self.failures} failures: {self.last_error}")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._schedule_probe()
+
+    def _schedule_probe(self):
+        if self.probe is None or self._probe_timer is not None:
+            return
+        self._probe_timer = threading.Timer(self.reset_timeout, self._run_probe)
+        self._probe_timer.daemon = True
+        self._probe_timer.start()
+
+    def _run_probe(self):
+        try:
+            self.probe(self.name)
+            ok = True
+        except Exception as e:
+            ok = False
+            error = e
+        with self._lock:
+            self._probe_timer = None
+            if self.state != OPEN:
+                return
+            if ok:
+                logger.info(f"Probe for cluster {self.name} succeeded, circuit half-open")
+                self.state = HALF_OPEN
+            else:
+                self.last_error = str(error)
+                self.opened_at = time.monotonic()
+                self._schedule_probe()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "last_error": self.last_error,
+                "last_success": self.last_success
+            }
+            if self.state == OPEN:
+                snapshot["retry_after"] = round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 3)
+            return snapshot
+
+class BreakerRegistry:
+    def __init__(self, probe: Optional[Callable[[str], None]] = None):
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str, failure_threshold: int, reset_timeout: float) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout, self.probe)
+            else:
+                breaker.configure(failure_threshold, reset_timeout)
+            return breaker
+
+    def states(self) -> Dict[str, dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.snapshot() for b in breakers}
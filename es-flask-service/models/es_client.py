@@ -1,19 +1,177 @@
 # -*- coding: utf-8 -*-
 """
-@File    : es_client.py 
+@File    : es_client.py
 @Time    : 2025/4/2 16:50
 @Author  : xxlaila
 @Software: dify
 """
+import atexit
+import socket
+import threading
+import time
+from elasticsearch import Elasticsearch, Transport
+from urllib3.connection import HTTPConnection
+from typing import Optional
+from config.es_config import ClusterConfig, get_cluster, ADMISSION_PRIORITY_TOOLS
+from models.admission import AdmissionController, AdmissionRegistry, AdmissionRejected, HIGH_PRIORITY, NORMAL_PRIORITY
+from models.circuit_breaker import BreakerRegistry, CircuitBreaker
+from utils import metrics
+from utils.logger import logger
 
-from elasticsearch import Elasticsearch
-from config.es_config import get_cluster_config
+PROBE_TIMEOUT = 5
+
+class ClusterTransport(Transport):
+    """
+    所有请求（search、_cat、采集任务等）先经过集群准入控制拿到并发名额，再经过熔断器：熔断打开时直接失败，不再等待超时，
+    请求结果反馈给熔断器，取代每次请求前的 ping。同时记录上游耗时和 ES 返回的 took。
+    """
+    cluster_name: str = None
+    breaker: CircuitBreaker = None
+    admission: AdmissionController = None
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        admission = self.admission
+        if admission is not None:
+            try:
+                metrics.record_admission(self.cluster_name, admission.acquire(request_priority()))
+            except AdmissionRejected as e:
+                metrics.record_admission(self.cluster_name, rejected=e.reason)
+                raise
+        started = time.perf_counter()
+        try:
+            return self._perform_guarded(method, url, headers, params, body, started)
+        finally:
+            if admission is not None:
+                admission.release(time.perf_counter() - started)
+
+    def _perform_guarded(self, method, url, headers, params, body, started):
+        breaker = self.breaker
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            result = super().perform_request(method, url, headers=headers, params=params, body=body)
+        except Exception as e:
+            metrics.record_upstream(self.cluster_name, time.perf_counter() - started, error=e)
+            if breaker is not None:
+                breaker.record_error(e)
+            raise
+        metrics.record_upstream(self.cluster_name, time.perf_counter() - started, result)
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+class _PooledClient:
+    __slots__ = ("client", "config", "idle_timeout", "last_used")
+
+    def __init__(self, client: Elasticsearch, config: ClusterConfig):
+        self.client = client
+        self.config = config
+        self.idle_timeout = config.idle_timeout
+        self.last_used = time.monotonic()
+
+class ESClientRegistry:
+    """
+    按集群缓存长连接客户端，同一集群复用同一个 urllib3 连接池，避免每次请求重新建连/握手。
+    配置变化时自动重建，空闲超过 idle_timeout 的客户端会被关闭回收。
+    """
+    SWEEP_INTERVAL = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._last_sweep = time.monotonic()
+
+    def get(self, cluster_name: str, **overrides) -> Elasticsearch:
+        config = get_cluster(cluster_name)
+        key = (cluster_name, tuple(sorted(overrides.items())))
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._clients.get(key)
+            # 配置表热加载后会生成新的 ClusterConfig 对象，引用不同即说明配置已变化
+            if entry is not None and entry.config is not config:
+                logger.info(f"Cluster {cluster_name} config changed, rebuilding client")
+                self._close(self._clients.pop(key))
+                entry = None
+            if entry is None:
+                entry = _PooledClient(self._build(config, overrides), config)
+                self._clients[key] = entry
+            entry.last_used = now
+            if now - self._last_sweep >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+        return entry.client
+
+    def evict(self, cluster_name: str):
+        with self._lock:
+            for key in [k for k in self._clients if k[0] == cluster_name]:
+                self._close(self._clients.pop(key))
+
+    def close_all(self):
+        with self._lock:
+            for entry in self._clients.values():
+                self._close(entry)
+            self._clients.clear()
+
+    def _sweep(self, now: float):
+        self._last_sweep = now
+        for key in [k for k, e in self._clients.items() if e.idle_timeout and now - e.last_used > e.idle_timeout]:
+            logger.info(f"Evicting idle ES client for cluster {key[0]}")
+            self._close(self._clients.pop(key))
+
+    @staticmethod
+    def _build(config: ClusterConfig, overrides: dict) -> Elasticsearch:
+        es = Elasticsearch(**{**config.client_kwargs, **overrides}, transport_class=ClusterTransport)
+        es.transport.cluster_name = config.name
+        es.transport.breaker = get_breaker(config)
+        es.transport.admission = get_admission(config)
+        if config.keep_alive:
+            # 为连接池新建的 socket 打开 TCP keep-alive，防止空闲长连接被中间设备静默断开
+            socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            for conn in es.transport.connection_pool.connections:
+                conn.pool.conn_kw["socket_options"] = socket_options
+        return es
+
+    @staticmethod
+    def _close(entry: _PooledClient):
+        try:
+            entry.client.transport.close()
+        except Exception as e:
+            logger.warning(f"Closing ES client failed: {e}")
+
+registry = ESClientRegistry()
+atexit.register(registry.close_all)
+
+def _probe(cluster_name: str):
+    """
+    熔断打开后的后台探活：绕过熔断器直接发 HEAD /，失败抛异常。
+    """
+    es = registry.get(cluster_name, verify_certs=False)
+    Transport.perform_request(es.transport, "HEAD", "/", params={"request_timeout": PROBE_TIMEOUT})
+
+breakers = BreakerRegistry(probe=_probe)
+
+def get_breaker(config: ClusterConfig) -> CircuitBreaker:
+    return breakers.get(config.name, config.breaker_failure_threshold, config.breaker_reset_timeout)
+
+admission = AdmissionRegistry()
+
+def get_admission(config: ClusterConfig) -> Optional[AdmissionController]:
+    """
+    admission_max_concurrency 为 0 时不做准入控制。
+    """
+    if not config.admission_max_concurrency:
+        return None
+    return admission.get(config.name, config.admission_max_concurrency, config.admission_max_queue,
+                         config.admission_queue_timeout)
+
+def request_priority() -> int:
+    return HIGH_PRIORITY if metrics.current_tool() in ADMISSION_PRIORITY_TOOLS else NORMAL_PRIORITY
 
 class ESClient:
     @staticmethod
     def get_client(cluster_name: str) -> Elasticsearch:
         try:
-            return Elasticsearch(**get_cluster_config(cluster_name))
+            return registry.get(cluster_name)
         except Exception as e:
             raise RuntimeError(f"ES connection failed: {str(e)}")
 
@@ -21,20 +179,6 @@ class ESHttpClient:
     @staticmethod
     def get_client(cluster_name: str) -> Elasticsearch:
         try:
-            config = get_cluster_config(cluster_name)
-            # 添加验证配置
-            print(config)
-            es = Elasticsearch(
-                **config,
-                verify_certs=False,
-
-            )
-            # 测试连接
-            try:
-                if not es.ping():
-                    raise RuntimeError("无法连接到Elasticsearch集群")
-            except Exception as e:
-                raise RuntimeError(f"无法连接到Elasticsearch集群: {str(e)}")
-            return es
+            return registry.get(cluster_name, verify_certs=False)
         except Exception as e:
-            raise RuntimeError(f"ES连接失败: {str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"ES连接失败: {str(e)}")
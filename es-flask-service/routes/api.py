@@ -5,18 +5,168 @@
 @Author  : xxlaila
 @Software: dify
 """
-import json,re
-from typing import Dict, Any
+import json,re,time
+from typing import Dict, Any, Optional, Tuple
 from utils.logger import logger
-from flask import Blueprint, request, jsonify, make_response
-from controllers.query_controller import execute_query
-from docs.swagger_docs import generate_swagger_doc
+from flask import Blueprint, Response, request, jsonify, make_response, stream_with_context, g
+from controllers.query_controller import (
+    execute_query, execute_batch_query, execute_multi_cluster_query, query_cache, query_flight, stream_query
+)
 from urllib.parse import urlparse, parse_qs
-from models.es_client import ESHttpClient
+from controllers.command_controller import (
+    execute_command, command_history, command_cache, command_flight, columnar_params, columnar_output, CommandError
+)
+from controllers.field_controller import list_fields
+from services.slow_queries import slow_query_log, set_current_caller
+from controllers.async_search_controller import (
+    submit_async_search, async_search_status, fetch_async_search, async_search_jobs
+)
+from config.es_config import (
+    QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES, RESPONSE_COMPRESSION_ENABLED, RESPONSE_COMPRESSION_MIN_BYTES,
+    SLOW_QUERY_CALLER_HEADER, list_clusters
+)
+from utils.projection import Projection
+from models.admission import AdmissionRejected
+from models.es_client import admission, breakers
+from utils import metrics
+from utils.compression import COMPRESSIBLE_MIMETYPES, CompressedStream, compress_bytes, negotiate_encoding
+from .documents import ToolDocuments
 from .tool_suggestions import generate_tool_suggestions
 
 api_bp = Blueprint('api', __name__)
 
+class _ByteCountingIterable:
+    """
+    包装流式响应体，统计实际发送的字节数；close 透传给原迭代器以便释放 PIT 等资源。
+    """
+
+    def __init__(self, iterable, charset: str = "utf-8"):
+        self.iterable = iterable
+        self.charset = charset
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.charset)
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.iterable, "close", None)
+        if close is not None:
+            close()
+
+@api_bp.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    # 非 call_tool 接口以端点名作为 tool 标签
+    g.metrics_labels = ((request.endpoint or "unknown").rsplit('.', 1)[-1], "")
+    metrics.set_current_tool(g.metrics_labels[0])
+    set_current_caller(request.headers.get(SLOW_QUERY_CALLER_HEADER) or request.remote_addr)
+
+@api_bp.after_request
+def record_request_metrics(response):
+    started = g.get("metrics_started")
+    if started is None:
+        return response
+    tool, cluster = g.metrics_labels
+    record_response_status(tool, cluster, response.status_code, g.get("tool_error", False))
+
+    # 流式响应在 after_request 时尚未生成，耗时和字节数在响应关闭时才记录
+    if response.is_streamed:
+        body = response.response = _ByteCountingIterable(response.response)
+        size = lambda: body.bytes
+    else:
+        length = response.content_length or 0
+        size = lambda: length
+
+    def finish():
+        metrics.request_seconds.observe(time.perf_counter() - started, tool, cluster)
+        metrics.response_bytes.observe(size(), tool, cluster)
+    response.call_on_close(finish)
+    return response
+
+# after_request 按注册的逆序执行：压缩先于指标记录，response_bytes 统计的是实际发送的字节
+@api_bp.after_request
+def compress_response(response):
+    """
+    按 Accept-Encoding 协商 br/gzip 压缩响应；流式响应逐块压缩并立即 flush。
+    """
+    if not RESPONSE_COMPRESSION_ENABLED or response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = CompressedStream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # 不同编码的表示不能共用同一个强 ETag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+def metric_labels(tool_name: str, cluster_name: str = None) -> Tuple[str, str]:
+    # 未配置的集群名统一记为 unknown，避免任意输入撑大标签基数
+    cluster = cluster_name if cluster_name in list_clusters() else ("unknown" if cluster_name else "")
+    return tool_name, cluster
+
+def set_metric_labels(tool_name: str, cluster_name: str = None):
+    g.metrics_labels = metric_labels(tool_name, cluster_name)
+    metrics.set_current_tool(tool_name)
+
+def record_response_status(tool: str, cluster: str, status_code: int, tool_error: bool):
+    if status_code >= 400:
+        metrics.errors_total.inc(tool, cluster, f"http_{status_code}")
+    elif tool_error:
+        metrics.errors_total.inc(tool, cluster, "tool")
+
+def record_tool_result(result: Dict[str, Any], tool: str, cluster: str) -> bool:
+    """
+    记录工具结果的缓存命中，返回结果是否为工具级错误（status=error）；Flask 和 ASGI 两条路径共用。
+    """
+    output = result.get("output")
+    hits = []
+    tool_error = False
+    if isinstance(output, dict):
+        tool_error = output.get("status") == "error"
+        if (output.get("cache") or {}).get("hit"):
+            hits.append("result")
+        if isinstance(output.get("data"), list):
+            hits.extend("result" for entry in output["data"]
+                        if isinstance(entry, dict) and (entry.get("cache") or {}).get("hit"))
+    if (result.get("cache") or {}).get("hit"):
+        hits.append(result["cache"].get("source", "result"))
+    for source in hits:
+        metrics.cache_hits_total.inc(tool, cluster, source)
+    return tool_error
+
+def tool_response(result: Dict[str, Any], status_code: int = 200):
+    """
+    工具调用结果的统一响应：记录序列化耗时、工具级错误和缓存命中。
+    """
+    tool, cluster = g.metrics_labels
+    if record_tool_result(result, tool, cluster):
+        g.tool_error = True
+
+    started = time.perf_counter()
+    response = jsonify({"result": result})
+    metrics.serialization_seconds.observe(time.perf_counter() - started, tool, cluster)
+    return response, status_code
+
 TOOLS = [
     {
         "name": "query",
@@ -33,13 +183,213 @@ TOOLS = [
                 "description": "查询DSL结构（JSON格式）",
                 "required": True,
                 "example": {"query": {"match_all": {}}}
+            },
+            "cache": {
+                "type": "boolean",
+                "description": "是否使用结果缓存（默认 true，传 false 强制直接查询ES）",
+                "required": False,
+                "example": True
+            },
+            "stream": {
+                "type": "boolean",
+                "description": "流式返回：通过 point-in-time + search_after 分页拉取全部命中，逐条输出（适合上万条日志的排查）",
+                "required": False,
+                "example": False
+            },
+            "stream_format": {
+                "type": "string",
+                "description": "流式输出格式：ndjson（默认）或 sse",
+                "required": False,
+                "example": "ndjson"
+            },
+            "max_hits": {
+                "type": "number",
+                "description": "流式模式下最多返回的命中条数；summarize 模式下最多扫描的命中条数",
+                "required": False,
+                "example": 10000
+            },
+            "includes": {
+                "type": "array",
+                "description": "只返回这些 _source 字段（支持通配符），由ES端过滤",
+                "required": False,
+                "example": ["@timestamp", "appName", "message"]
+            },
+            "excludes": {
+                "type": "array",
+                "description": "不返回这些 _source 字段（支持通配符）",
+                "required": False,
+                "example": ["stack_trace"]
+            },
+            "filter_path": {
+                "type": "string",
+                "description": "ES filter_path，裁剪响应外层结构",
+                "required": False,
+                "example": "took,hits.total,hits.hits._source,aggregations"
+            },
+            "max_field_length": {
+                "type": "number",
+                "description": "单个字段值的最大字符数，超出部分截断并附加标记",
+                "required": False,
+                "example": 500
+            },
+            "max_bytes": {
+                "type": "number",
+                "description": "整个查询结果的最大字节数，超出时丢弃尾部命中并返回 _truncated 标记",
+                "required": False,
+                "example": 200000
+            },
+            "request_timeout": {
+                "type": "number",
+                "description": "本次请求的超时时间（秒），默认使用集群配置的 timeout",
+                "required": False,
+                "example": 10
+            },
+            "prune_indices": {
+                "type": "boolean",
+                "description": "按 @timestamp 范围把通配符索引改写为可能有数据的按天索引（默认 true，改写结果见返回的 index_rewrite）",
+                "required": False,
+                "example": True
+            },
+            "summarize": {
+                "type": "string",
+                "description": "结果归纳方式：templates 表示分页扫描全部命中并按日志模板聚类，只返回模板、条数、首末时间和少量样例（适合大量报错日志的排查）",
+                "required": False,
+                "example": "templates"
+            },
+            "message_field": {
+                "type": "string",
+                "description": "summarize=templates 时用于归纳模板的日志字段（默认 message）",
+                "required": False,
+                "example": "message"
+            },
+            "top_templates": {
+                "type": "number",
+                "description": "summarize=templates 时按条数返回前 N 个模板（默认 50）",
+                "required": False,
+                "example": 20
+            },
+            "normalize": {
+                "type": "boolean",
+                "description": "规范化 DSL 以提高缓存命中（默认 true）：键排序、range 中的 now-15m 等相对时间按分钟取整、size=0 聚合开启 request_cache",
+                "required": False,
+                "example": True
             }
         },
         "returns": {
             "type": "object",
-            "description": "查询结果，包含命中数据及聚合统计等"
+            "description": "查询结果，包含命中数据及聚合统计等；DSL 引用了不存在或类型不匹配的字段时，field_check 给出说明和最接近的字段名"
         },
-        "parameters_order": ["cluster_name", "dsl"]
+        "parameters_order": [
+            "cluster_name", "dsl", "cache", "stream", "stream_format", "max_hits",
+            "includes", "excludes", "filter_path", "max_field_length", "max_bytes", "request_timeout",
+            "prune_indices", "summarize", "message_field", "top_templates", "normalize"
+        ]
+    },
+    {
+        "name": "batch_query",
+        "description": "批量执行多条Elasticsearch DSL查询（合并为一次 _msearch 请求），按顺序返回每条结果",
+        "parameters": {
+            "cluster_name": {
+                "type": "string",
+                "description": "Elasticsearch集群名称（必须由Agent根据上下文显式传入）",
+                "required": True,
+                "example": "es-app"
+            },
+            "queries": {
+                "type": "array",
+                "description": "查询列表，每项包含 index（索引名）和 dsl（查询DSL）",
+                "required": True,
+                "example": [
+                    {"index": "app-log-*", "dsl": {"size": 0, "query": {"match_phrase": {"appName": "order-service"}}}},
+                    {"index": "app-log-*", "dsl": {"size": 0, "query": {"match_phrase": {"appName": "user-service"}}}}
+                ]
+            },
+            "cache": {
+                "type": "boolean",
+                "description": "是否使用结果缓存（默认 true）",
+                "required": False,
+                "example": True
+            },
+            "normalize": {
+                "type": "boolean",
+                "description": "规范化 DSL 以提高缓存命中（默认 true）：键排序、range 中的 now-15m 等相对时间按分钟取整、size=0 聚合开启 request_cache",
+                "required": False,
+                "example": True
+            }
+        },
+        "returns": {
+            "type": "object",
+            "description": "与 queries 顺序一致的结果列表，每项为成功结果或错误信息"
+        },
+        "parameters_order": ["cluster_name", "queries", "cache", "normalize"]
+    },
+    {
+        "name": "multi_cluster_query",
+        "description": "在多个Elasticsearch集群上并行执行同一DSL查询，合并命中（按排序键/评分重排）和聚合（按桶合并），失败的集群单独列出",
+        "parameters": {
+            "clusters": {
+                "type": "array",
+                "description": "集群名称列表，支持通配符（如 [\"es-*\"]）",
+                "required": True,
+                "example": ["es-app", "es-log-*"]
+            },
+            "dsl": {
+                "type": "object",
+                "description": "查询DSL结构（JSON格式），from/size 作用于合并后的结果",
+                "required": True,
+                "example": {"size": 20, "query": {"match_phrase": {"message": "OutOfMemoryError"}}, "sort": [{"@timestamp": "desc"}]}
+            },
+            "cache": {
+                "type": "boolean",
+                "description": "是否使用结果缓存（默认 true，按集群分别缓存）",
+                "required": False,
+                "example": True
+            },
+            "includes": {
+                "type": "array",
+                "description": "只返回这些 _source 字段（支持通配符），由ES端过滤",
+                "required": False,
+                "example": ["@timestamp", "appName", "message"]
+            },
+            "excludes": {
+                "type": "array",
+                "description": "不返回这些 _source 字段（支持通配符）",
+                "required": False,
+                "example": ["stack_trace"]
+            },
+            "max_field_length": {
+                "type": "number",
+                "description": "单个字段值的最大字符数，超出部分截断并附加标记",
+                "required": False,
+                "example": 500
+            },
+            "max_bytes": {
+                "type": "number",
+                "description": "合并结果的最大字节数，超出时丢弃尾部命中并返回 _truncated 标记",
+                "required": False,
+                "example": 200000
+            },
+            "request_timeout": {
+                "type": "number",
+                "description": "每个集群请求的超时时间（秒）",
+                "required": False,
+                "example": 10
+            },
+            "normalize": {
+                "type": "boolean",
+                "description": "规范化 DSL 以提高缓存命中（默认 true）：键排序、range 中的 now-15m 等相对时间按分钟取整、size=0 聚合开启 request_cache",
+                "required": False,
+                "example": True
+            }
+        },
+        "returns": {
+            "type": "object",
+            "description": "合并后的查询结果（每条命中带 _cluster），clusters 为各集群耗时与缓存情况，errors 为失败集群的错误信息"
+        },
+        "parameters_order": [
+            "clusters", "dsl", "cache", "includes", "excludes", "max_field_length", "max_bytes", "request_timeout",
+            "normalize"
+        ]
     },
     {
         "name": "command",
@@ -56,6 +406,43 @@ TOOLS = [
                 "description": "命令路径及参数（如：_cat/nodes?v&h=name,heap.percent）",
                 "required": True,
                 "example": "_cat/nodes?v&h=name,heap.percent"
+            },
+            "request_timeout": {
+                "type": "number",
+                "description": "本次请求的超时时间（秒），默认使用集群配置的 timeout",
+                "required": False,
+                "example": 10
+            },
+            "cache": {
+                "type": "boolean",
+                "description": "是否使用只读命令缓存（默认 true，各路径缓存时间不同，如 _cluster/health 5秒、_cat/indices 60秒）",
+                "required": False,
+                "example": True
+            },
+            "history_minutes": {
+                "type": "number",
+                "description": "返回后台采集的最近 N 分钟历史快照（仅 _cluster/health、_nodes/stats、_cat/thread_pool，需开启后台采集）",
+                "required": False,
+                "example": 5
+            },
+            "format": {
+                "type": "string",
+                "description": "返回格式：json（默认，原样返回）或 columnar（按列存放的紧凑表格，数字列为数字类型，"
+                               "_nodes/* 每个节点一行、嵌套字段展开为 jvm.mem.heap_used_percent 形式，体积通常小几倍）",
+                "required": False,
+                "example": "columnar"
+            },
+            "columns": {
+                "type": "array",
+                "description": "format=columnar 时保留的列，支持通配符；_cat 接口下推为 h= 参数",
+                "required": False,
+                "example": ["name", "heap.percent", "cpu"]
+            },
+            "filter_path": {
+                "type": "string",
+                "description": "format=columnar 时下推给ES的 filter_path（_cat 以外的接口），如 nodes.*.name,nodes.*.jvm.mem",
+                "required": False,
+                "example": "nodes.*.name,nodes.*.jvm.mem.heap_used_percent"
             }
         },
         "returns": {
@@ -68,11 +455,160 @@ TOOLS = [
                 },
                 "format": {
                     "type": "string",
-                    "description": "返回内容格式，如 text、json"
+                    "description": "返回内容格式，如 text、json、columnar"
+                },
+                "cache": {
+                    "type": "object",
+                    "description": "缓存信息：hit 是否命中、age 结果已缓存的秒数、ttl 缓存时间"
+                }
+            }
+        },
+        "parameters_order": [
+            "cluster_name", "action", "request_timeout", "cache", "history_minutes", "format", "columns", "filter_path"
+        ]
+    },
+    {
+        "name": "fields",
+        "description": "列出索引的字段及类型（是否可搜索、可聚合），编写 DSL 前用来确认字段名，结果带本地缓存，开销很小",
+        "parameters": {
+            "cluster_name": {
+                "type": "string",
+                "description": "Elasticsearch集群名称（必须由Agent根据上下文显式传入）",
+                "required": True,
+                "example": "es-app"
+            },
+            "index": {
+                "type": "string",
+                "description": "索引名或通配符（默认全部索引）",
+                "required": False,
+                "example": "app-log-*"
+            },
+            "pattern": {
+                "type": "string",
+                "description": "按字段名通配符过滤",
+                "required": False,
+                "example": "http.*"
+            },
+            "type": {
+                "type": "string",
+                "description": "按字段类型过滤（如 keyword、text、date、long）",
+                "required": False,
+                "example": "keyword"
+            },
+            "refresh": {
+                "type": "boolean",
+                "description": "忽略缓存重新获取字段目录（默认 false）",
+                "required": False,
+                "example": False
+            }
+        },
+        "returns": {
+            "type": "object",
+            "description": "fields 为字段列表（name、type、searchable、aggregatable），count 为匹配的字段总数"
+        },
+        "parameters_order": ["cluster_name", "index", "pattern", "type", "refresh"]
+    },
+    {
+        "name": "async_search_submit",
+        "description": "提交耗时较长的查询/聚合（如跨数周数据的统计）为ES异步查询任务，短时间内完成则直接返回结果，否则返回 job.id 供后续轮询",
+        "parameters": {
+            "cluster_name": {
+                "type": "string",
+                "description": "Elasticsearch集群名称（必须由Agent根据上下文显式传入）",
+                "required": True,
+                "example": "es-app"
+            },
+            "dsl": {
+                "type": "object",
+                "description": "查询DSL结构（JSON格式），与 query 工具相同",
+                "required": True,
+                "example": {
+                    "index": "app-log-*", "size": 0,
+                    "aggs": {"per_day": {"date_histogram": {"field": "@timestamp", "calendar_interval": "1d"}}}
                 }
+            },
+            "wait_seconds": {
+                "type": "number",
+                "description": "提交后同步等待结果的秒数（默认 1，最长 10）",
+                "required": False,
+                "example": 1
+            },
+            "keep_alive": {
+                "type": "string",
+                "description": "结果在ES端的保留时间（默认 1h），过期后任务被清理",
+                "required": False,
+                "example": "1h"
+            },
+            "prune_indices": {
+                "type": "boolean",
+                "description": "按 @timestamp 范围裁剪通配符索引（默认 true）",
+                "required": False,
+                "example": True
             }
         },
-        "parameters_order": ["cluster_name", "action"]
+        "returns": {
+            "type": "object",
+            "description": "job 为任务信息（id、过期时间、是否运行中），已完成时 data 为查询结果"
+        },
+        "parameters_order": ["cluster_name", "dsl", "wait_seconds", "keep_alive", "prune_indices"]
+    },
+    {
+        "name": "async_search_status",
+        "description": "查询异步查询任务的进度（是否运行中、已完成的分片数），不返回结果数据",
+        "parameters": {
+            "job_id": {
+                "type": "string",
+                "description": "async_search_submit 返回的 job.id",
+                "required": True,
+                "example": "es-app:FmRldE8zREVEUzA2ZVpUeGs2ejJFUFEaMkZ5QTVrSTZSaVN3WlNFVmtlWHJsdzoxMDc="
+            }
+        },
+        "returns": {
+            "type": "object",
+            "description": "任务进度，结束后包含 completion_status"
+        },
+        "parameters_order": ["job_id"]
+    },
+    {
+        "name": "async_search_fetch",
+        "description": "获取异步查询任务的结果：仍在运行时返回部分结果（is_partial=true），完成后返回最终结果",
+        "parameters": {
+            "job_id": {
+                "type": "string",
+                "description": "async_search_submit 返回的 job.id",
+                "required": True,
+                "example": "es-app:FmRldE8zREVEUzA2ZVpUeGs2ejJFUFEaMkZ5QTVrSTZSaVN3WlNFVmtlWHJsdzoxMDc="
+            },
+            "wait_seconds": {
+                "type": "number",
+                "description": "任务未完成时最多等待的秒数（默认 0 立即返回，最长 10）",
+                "required": False,
+                "example": 0
+            },
+            "delete": {
+                "type": "boolean",
+                "description": "任务已完成时取回结果后删除ES端保存的结果（默认 false）",
+                "required": False,
+                "example": True
+            },
+            "max_field_length": {
+                "type": "number",
+                "description": "单个字段值的最大字符数，超出部分截断并附加标记",
+                "required": False,
+                "example": 500
+            },
+            "max_bytes": {
+                "type": "number",
+                "description": "结果的最大字节数，超出时丢弃尾部命中并返回 _truncated 标记",
+                "required": False,
+                "example": 200000
+            }
+        },
+        "returns": {
+            "type": "object",
+            "description": "job 为任务信息，data 为当前（部分或最终）结果"
+        },
+        "parameters_order": ["job_id", "wait_seconds", "delete", "max_field_length", "max_bytes"]
     }
 ]
 
@@ -88,9 +624,18 @@ ALLOWED_PATH_PREFIXES = [
     '_explain'
 ]
 
+STREAM_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream"
+}
+
+SUMMARIZE_MODES = ("templates",)
+COMMAND_FORMATS = ("json", "columnar")
+
 TYPE_MAP = {
     "string": str,
     "object": dict,
+    "array": list,
     "number": (int, float),
     "boolean": bool
 }
@@ -105,6 +650,9 @@ def validate_parameters(parameters: Dict[str, Any], tool_schema: Dict[str, Any])
             errors.append(f"Missing required parameter '{param_name}'")
             continue
 
+        if param_name not in parameters:
+            continue
+
         expected_type = TYPE_MAP.get(param_schema['type'])
         actual_value = parameters.get(param_name)
         if expected_type and not isinstance(actual_value, expected_type):
@@ -114,10 +662,114 @@ def validate_parameters(parameters: Dict[str, Any], tool_schema: Dict[str, Any])
         raise ValueError("; ".join(errors))
     return parameters
 
+class ToolCallError(Exception):
+    """
+    工具调用请求不合法时抛出，携带 JSON-RPC 错误码和 HTTP 状态码（同步/异步两条服务路径共用）。
+    """
+
+    def __init__(self, code: int, message: str, status: int = 400, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        error = {"code": self.code, "message": self.message}
+        if self.retry_after is not None:
+            error["data"] = {"retry_after": self.retry_after}
+        return {
+            "jsonrpc": "2.0",
+            "error": error
+        }
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+
+def overloaded_error(e: AdmissionRejected) -> ToolCallError:
+    """
+    集群准入控制拒绝请求时返回 429，Retry-After 给出建议的重试间隔（秒）。
+    """
+    return ToolCallError(-32003, str(e), 429, retry_after=e.retry_after)
+
+def parse_tool_call(content: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    解析并校验 /call_tool 请求体，返回 (工具名, 参数)。
+    """
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        raise ToolCallError(-32700, "Invalid JSON format")
+
+    tool_name = data.get('name')
+    if not tool_name:
+        raise ToolCallError(-32602, "Missing required parameter 'name'")
+
+    tool = next((t for t in TOOLS if t['name'] == tool_name), None)
+    if not tool:
+        raise ToolCallError(-32601, f"Tool '{tool_name}' not found", 404)
+
+    parameters = data.get('parameters', {})
+    if isinstance(parameters, str):
+        try:
+            parameters = json.loads(parameters.replace("'", '"'))
+        except json.JSONDecodeError:
+            raise ToolCallError(-32602, "Invalid parameters format (must be valid JSON)")
+
+    # 参数校验
+    try:
+        validate_parameters(parameters, tool['parameters'])
+    except ValueError as e:
+        raise ToolCallError(-32602, str(e))
+
+    if tool_name in ('query', 'multi_cluster_query'):
+        dsl = parameters['dsl']
+        if not isinstance(dsl, dict) or 'query' not in dsl:
+            raise ToolCallError(-32602, "Invalid DSL format")
+        if tool_name == 'multi_cluster_query':
+            clusters = parameters['clusters']
+            if not clusters or not all(isinstance(c, str) and c for c in clusters):
+                raise ToolCallError(-32602, "Parameter 'clusters' must be a non-empty list of cluster names")
+        if parameters.get('stream'):
+            stream_format = parameters.get('stream_format', 'ndjson')
+            if stream_format not in STREAM_MIMETYPES:
+                raise ToolCallError(-32602, f"Unsupported stream_format: {stream_format}")
+        summarize = parameters.get('summarize')
+        if summarize is not None:
+            if summarize not in SUMMARIZE_MODES:
+                raise ToolCallError(-32602, f"Unsupported summarize mode: {summarize}")
+            if parameters.get('stream'):
+                raise ToolCallError(-32602, "Parameters 'stream' and 'summarize' cannot be combined")
+            top = parameters.get('top_templates')
+            if top is not None and (not isinstance(top, int) or top <= 0):
+                raise ToolCallError(-32602, "Parameter 'top_templates' must be a positive integer")
+        max_hits = parameters.get('max_hits')
+        if max_hits is not None and (not isinstance(max_hits, int) or max_hits <= 0):
+            raise ToolCallError(-32602, "Parameter 'max_hits' must be a positive integer")
+    elif tool_name == 'async_search_submit':
+        if not isinstance(parameters['dsl'], dict):
+            raise ToolCallError(-32602, "Invalid DSL format")
+    elif tool_name == 'command':
+        path, _ = parse_action_path_and_params(parameters['action'])
+        if not is_path_allowed(path):
+            raise ToolCallError(-32602, f"Disallowed path: {path}", 403)
+        if parameters.get('format', 'json') not in COMMAND_FORMATS:
+            raise ToolCallError(-32602, f"Unsupported format: {parameters['format']}")
+        columns = parameters.get('columns')
+        if columns is not None and (not isinstance(columns, list) or not all(isinstance(c, str) for c in columns)):
+            raise ToolCallError(-32602, "Parameter 'columns' must be a list of strings")
+        if parameters.get('format') == 'columnar' and parameters.get('history_minutes'):
+            raise ToolCallError(-32602, "Parameters 'history_minutes' and format 'columnar' cannot be combined")
+
+    return tool_name, parameters
+
+tool_documents = ToolDocuments(TOOLS)
+
 @api_bp.route('/api/swagger.json', methods=['GET'])
 def serve_swagger_json():
-    from docs.swagger_docs import generate_swagger_doc
-    return generate_swagger_doc(TOOLS)
+    return tool_documents.swagger.response(request)
 
 @api_bp.route('/tool_suggestions', methods=['POST'])
 def tool_suggestions():
@@ -141,6 +793,109 @@ def tool_suggestions():
         }), 500
 
 
+@api_bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    查看结果缓存的命中统计，以及在途请求合并（singleflight）的次数
+    ---
+    tags:
+      - 工具
+    responses:
+      200:
+        description: 返回缓存统计
+    """
+    return jsonify({
+        "query": query_cache.stats(),
+        "command": command_cache.stats(),
+        "singleflight": {"query": query_flight.stats(), "command": command_flight.stats()}
+    }), 200
+
+
+@api_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus 文本格式的服务指标（请求/上游/took/序列化耗时、响应大小、错误与缓存命中）
+    ---
+    tags:
+      - 工具
+    responses:
+      200:
+        description: Prometheus 指标
+    """
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@api_bp.route('/circuit_breakers', methods=['GET'])
+def circuit_breakers():
+    """
+    查看各集群熔断器状态（closed/open/half_open）
+    ---
+    tags:
+      - 工具
+    responses:
+      200:
+        description: 返回熔断器状态
+    """
+    return jsonify(breakers.states()), 200
+
+
+@api_bp.route('/slow_queries', methods=['GET'])
+def slow_queries():
+    """
+    查看各集群最慢的 query（按 DSL 哈希去重）：took、总耗时、响应字节数、调用方，抽样重放得到的 profile 概览
+    ---
+    tags:
+      - 工具
+    parameters:
+      - name: cluster_name
+        in: query
+        type: string
+        required: false
+        description: 只看某个集群
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: 每个集群最多返回的条数
+    responses:
+      200:
+        description: 返回慢查询榜单
+    """
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        **slow_query_log.stats(),
+        "clusters": slow_query_log.top(request.args.get('cluster_name'), limit)
+    }), 200
+
+
+@api_bp.route('/admission', methods=['GET'])
+def admission_states():
+    """
+    查看各集群准入控制状态（并发上限、在途数、排队数、累计放行/拒绝次数）
+    ---
+    tags:
+      - 工具
+    responses:
+      200:
+        description: 返回准入控制状态
+    """
+    return jsonify(admission.states()), 200
+
+
+@api_bp.route('/async_searches', methods=['GET'])
+def async_searches():
+    """
+    查看服务端记录的异步查询任务数（按集群统计运行中/已完成）
+    ---
+    tags:
+      - 工具
+    responses:
+      200:
+        description: 返回异步查询任务统计
+    """
+    return jsonify(async_search_jobs.stats()), 200
+
+
 def create_json_response(data, status_code=200):
     """
     创建标准JSON响应（保持Unicode转义）
@@ -162,8 +917,7 @@ def list_tools():
       200:
         description: 返回工具列表
     """
-    response_data = {"tools": [tool.copy() for tool in TOOLS]}
-    return create_json_response(response_data)
+    return tool_documents.tool_list.response(request)
 
 @api_bp.route('/call_tool', methods=['POST'])
 def call_tools():
@@ -194,97 +948,150 @@ def call_tools():
         description: 参数错误
       404:
         description: 工具不存在
+      429:
+        description: 集群繁忙，按 Retry-After 稍后重试
       500:
         description: 系统错误
     """
     try:
         content = request.get_data(as_text=True)
         logger.info(f"call_tools: {content}")
-        data = json.loads(content)
-
-        tool_name = data.get('name')
-        if not tool_name:
-            return jsonify({
-                "jsonrpc": "2.0",
-                "error": {"code": -32602, "message": "Missing required parameter 'name'"}
-            }), 400
-
-        tool = next((t for t in TOOLS if t['name'] == tool_name), None)
-        if not tool:
-            return jsonify({
-                "jsonrpc": "2.0",
-                "error": {"code": -32601, "message": f"Tool '{tool_name}' not found"}
-            }), 404
-
-        parameters = data.get('parameters', {})
-        if isinstance(parameters, str):
-            try:
-                parameters = json.loads(parameters.replace("'", '"'))
-            except json.JSONDecodeError:
-                return jsonify({
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32602, "message": "Invalid parameters format (must be valid JSON)"}
-                }), 400
-
-        # 参数校验
         try:
-            validate_parameters(parameters, tool['parameters'])
-        except ValueError as e:
-            return jsonify({
-                "jsonrpc": "2.0",
-                "error": {"code": -32602, "message": str(e)}
-            }), 400
+            tool_name, parameters = parse_tool_call(content)
+        except ToolCallError as e:
+            return jsonify(e.payload), e.status
+        set_metric_labels(tool_name, parameters.get('cluster_name'))
 
         if tool_name == 'query':
             cluster_name = parameters['cluster_name']
             dsl = parameters['dsl']
-            if not isinstance(dsl, dict) or 'query' not in dsl:
-                return jsonify({
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32602, "message": "Invalid DSL format"}
-                }), 400
-            result = execute_query(cluster_name, dsl)
-            return jsonify({"result": {"output": result, "format": "json"}}), 200
+
+            projection = Projection.from_parameters(parameters, QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES)
+            if parameters.get('stream'):
+                stream_format = parameters.get('stream_format', 'ndjson')
+                max_hits = parameters.get('max_hits')
+                response = Response(
+                    stream_with_context(stream_query(
+                        cluster_name, dsl, max_hits, stream_format, projection,
+                        prune_indices=parameters.get('prune_indices', True)
+                    )),
+                    mimetype=STREAM_MIMETYPES[stream_format]
+                )
+                # 关闭反向代理缓冲，保证逐条推送
+                response.headers["Cache-Control"] = "no-cache"
+                response.headers["X-Accel-Buffering"] = "no"
+                return response
+
+            result = execute_query(
+                cluster_name, dsl,
+                use_cache=parameters.get('cache', True),
+                projection=projection,
+                request_timeout=parameters.get('request_timeout'),
+                prune_indices=parameters.get('prune_indices', True),
+                summarize=parameters.get('summarize'),
+                message_field=parameters.get('message_field'),
+                max_hits=parameters.get('max_hits'),
+                top_templates=parameters.get('top_templates'),
+                normalize=parameters.get('normalize', True)
+            )
+            return tool_response({"output": result, "format": "json"})
+
+        elif tool_name == 'batch_query':
+            result = execute_batch_query(
+                parameters['cluster_name'],
+                parameters['queries'],
+                use_cache=parameters.get('cache', True),
+                normalize=parameters.get('normalize', True)
+            )
+            return tool_response({"output": result, "format": "json"})
+
+        elif tool_name == 'multi_cluster_query':
+            projection = Projection.from_parameters(parameters, QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES)
+            result = execute_multi_cluster_query(
+                parameters['clusters'],
+                parameters['dsl'],
+                use_cache=parameters.get('cache', True),
+                projection=projection,
+                request_timeout=parameters.get('request_timeout'),
+                normalize=parameters.get('normalize', True)
+            )
+            return tool_response({"output": result, "format": "json"})
+
+        elif tool_name == 'fields':
+            result = list_fields(
+                parameters['cluster_name'],
+                index=parameters.get('index'),
+                pattern=parameters.get('pattern'),
+                field_type=parameters.get('type'),
+                refresh=parameters.get('refresh', False)
+            )
+            return tool_response({"output": result, "format": "json"})
+
+        elif tool_name == 'async_search_submit':
+            result = submit_async_search(
+                parameters['cluster_name'],
+                parameters['dsl'],
+                wait_seconds=parameters.get('wait_seconds'),
+                keep_alive=parameters.get('keep_alive'),
+                prune_indices=parameters.get('prune_indices', True)
+            )
+            return tool_response({"output": result, "format": "json"})
+
+        elif tool_name == 'async_search_status':
+            return tool_response({"output": async_search_status(parameters['job_id']), "format": "json"})
+
+        elif tool_name == 'async_search_fetch':
+            projection = Projection.from_parameters(parameters, QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES)
+            result = fetch_async_search(
+                parameters['job_id'],
+                wait_seconds=parameters.get('wait_seconds'),
+                projection=projection,
+                delete=parameters.get('delete', False)
+            )
+            return tool_response({"output": result, "format": "json"})
 
         elif tool_name == 'command':
             cluster_name = parameters['cluster_name']
             action = parameters['action']
 
             path, params = parse_action_path_and_params(action)
-            if not is_path_allowed(path):
-                return jsonify({
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32602, "message": f"Disallowed path: {path}"}
-                }), 403
-
-            es = ESHttpClient.get_client(cluster_name)
-            if not es.ping():
-                return jsonify({
-                    "jsonrpc": "2.0",
-                    "error": {"code": -32602, "message": "Cannot connect to Elasticsearch cluster"}
-                }), 500
+            if parameters.get('history_minutes'):
+                try:
+                    history = command_history(cluster_name, path, parameters['history_minutes'])
+                except CommandError as e:
+                    return jsonify({
+                        "jsonrpc": "2.0",
+                        "error": {"code": -32602, "message": str(e)}
+                    }), 400
+                return tool_response({"output": history, "format": "json"})
 
+            columnar = parameters.get('format') == 'columnar'
+            if columnar:
+                params = columnar_params(path, params, parameters.get('columns'), parameters.get('filter_path'))
             try:
-                response = es.transport.perform_request(
-                    method='GET',
-                    url=f'/{path.lstrip("/")}',
-                    params=params
+                response, cache_meta = execute_command(
+                    cluster_name, path, params,
+                    request_timeout=parameters.get('request_timeout'),
+                    use_cache=parameters.get('cache', True)
                 )
-                logger.info(f"response: {response}")
-                return jsonify({"result": {"output": response, "format": "json"}}), 200
-            except Exception as e:
-                logger.error(f"Command execution failed: {e}")
+            except CommandError as e:
                 return jsonify({
                     "jsonrpc": "2.0",
                     "error": {"code": -32602, "message": str(e)}
                 }), 500
 
-    except json.JSONDecodeError:
-        return jsonify({
-            "jsonrpc": "2.0",
-            "error": {"code": -32700, "message": "Invalid JSON format"}
-        }), 400
+            if columnar:
+                result = {"output": columnar_output(path, response, parameters.get('columns')), "format": "columnar"}
+            else:
+                result = {"output": response, "format": "json"}
+            if cache_meta is not None:
+                result["cache"] = cache_meta
+            return tool_response(result)
 
+    except AdmissionRejected as e:
+        logger.warning(f"call_tools rejected: {e}")
+        error = overloaded_error(e)
+        return jsonify(error.payload), error.status, error.headers
     except Exception as e:
         logger.exception("Unexpected error occurred")
         return jsonify({
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : async_api.py
+@Time    : 2026/10/18 11:50
+@Author  : xxlaila
+@Software: dify
+"""
+from typing import Any, Dict, Optional, Tuple
+from utils.logger import logger
+from config.es_config import QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES
+from controllers.async_query_controller import execute_query_async, execute_command_async
+from controllers.command_controller import (
+    command_cache_key, lookup_cached_command, store_command_result, command_history, columnar_params,
+    columnar_output, CommandError
+)
+from models.admission import AdmissionRejected
+from models.async_es_client import AsyncESClient
+from services.cluster_poller import cluster_poller
+from utils import metrics
+from utils.projection import Projection
+from .api import ToolCallError, metric_labels, overloaded_error, parse_tool_call, parse_action_path_and_params
+
+def _rpc_error(code: int, message: str) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "error": {"code": code, "message": message}
+    }
+
+async def dispatch_tool_call(content: str) -> Optional[Tuple[int, Dict[str, Any], Dict[str, str], Tuple[str, str]]]:
+    """
+    异步处理 /call_tool：query（非流式、非 summarize）和 command 在事件循环中直接执行，
+    返回 (HTTP状态码, 响应体, 额外响应头, 指标标签)；其他工具返回 None，由调用方转交给 Flask（WSGI）处理。
+    """
+    logger.info(f"call_tools: {content}")
+    # 与 Flask 路径一致：解析失败时以端点名作为 tool 标签
+    labels = ("call_tool", "")
+    try:
+        tool_name, parameters = parse_tool_call(content)
+    except ToolCallError as e:
+        return e.status, e.payload, {}, labels
+    labels = metric_labels(tool_name, parameters.get('cluster_name'))
+    metrics.set_current_tool(tool_name)
+    try:
+        result = await _dispatch(tool_name, parameters)
+    except AdmissionRejected as e:
+        logger.warning(f"call_tools rejected: {e}")
+        error = overloaded_error(e)
+        return error.status, error.payload, error.headers, labels
+    return None if result is None else (*result, {}, labels)
+
+async def _dispatch(tool_name: str, parameters: Dict[str, Any]) -> Optional[Tuple[int, Dict[str, Any]]]:
+    try:
+        if tool_name == 'query' and not parameters.get('stream') and not parameters.get('summarize'):
+            projection = Projection.from_parameters(parameters, QUERY_MAX_FIELD_LENGTH, QUERY_MAX_RESPONSE_BYTES)
+            result = await execute_query_async(
+                parameters['cluster_name'], parameters['dsl'],
+                use_cache=parameters.get('cache', True),
+                projection=projection,
+                request_timeout=parameters.get('request_timeout'),
+                prune_indices=parameters.get('prune_indices', True),
+                normalize=parameters.get('normalize', True)
+            )
+            return 200, {"result": {"output": result, "format": "json"}}
+
+        if tool_name == 'command':
+            cluster_name = parameters['cluster_name']
+            path, params = parse_action_path_and_params(parameters['action'])
+            if parameters.get('history_minutes'):
+                try:
+                    history = command_history(cluster_name, path, parameters['history_minutes'])
+                except CommandError as e:
+                    return 400, _rpc_error(-32602, str(e))
+                return 200, {"result": {"output": history, "format": "json"}}
+
+            columnar = parameters.get('format') == 'columnar'
+            if columnar:
+                params = columnar_params(path, params, parameters.get('columns'), parameters.get('filter_path'))
+
+            def command_result(response, cache_meta=None) -> dict:
+                if columnar:
+                    result = {"output": columnar_output(path, response, parameters.get('columns')), "format": "columnar"}
+                else:
+                    result = {"output": response, "format": "json"}
+                if cache_meta is not None:
+                    result["cache"] = cache_meta
+                return {"result": result}
+
+            use_cache = parameters.get('cache', True)
+            snapshot = cluster_poller.lookup(cluster_name, path, params) if use_cache else None
+            if snapshot is not None:
+                return 200, command_result(*snapshot)
+
+            cache_key, ttl = command_cache_key(cluster_name, path, params, use_cache)
+            cached = lookup_cached_command(cache_key, ttl)
+            if cached is not None:
+                return 200, command_result(*cached)
+
+            es = AsyncESClient.get_client(cluster_name, verify_certs=False)
+
+            try:
+                response = await execute_command_async(
+                    es, cluster_name, path, params, parameters.get('request_timeout')
+                )
+                logger.info(f"response: {response}")
+                return 200, command_result(response, store_command_result(cache_key, ttl, response))
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                logger.error(f"Command execution failed: {e}")
+                return 500, _rpc_error(-32602, str(e))
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error occurred")
+        return 500, _rpc_error(-32000, str(e))
+
+    return None
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : documents.py
+@Time    : 2026/10/18 19:00
+@Author  : xxlaila
+@Software: dify
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+from flask import Request, Response
+from config.es_config import RESPONSE_COMPRESSION_ENABLED, RESPONSE_COMPRESSION_MIN_BYTES
+from docs.swagger_docs import build_swagger_doc
+from utils.compression import compress_bytes, negotiate_encoding, supported_encodings
+
+class PrecomputedDocument:
+    """
+    预先序列化（并按支持的编码预先压缩）的 JSON 文档，带强 ETag；
+    客户端带 If-None-Match 轮询且内容未变时直接返回 304。
+    """
+
+    def __init__(self, payload: Any):
+        self.body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.variants: Dict[Optional[str], bytes] = {None: self.body}
+        if RESPONSE_COMPRESSION_ENABLED and len(self.body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+            for encoding in supported_encodings():
+                self.variants[encoding] = compress_bytes(self.body, encoding)
+
+    def response(self, request: Request) -> Response:
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        if encoding not in self.variants:
+            encoding = None
+        response = Response(self.variants[encoding], content_type="application/json; charset=utf-8")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        # 与 compress_response 一致：不同编码的表示使用不同的强 ETag
+        response.set_etag(f"{self.etag}-{encoding}" if encoding else self.etag)
+        # 允许缓存但每次都要重新校验，轮询方拿到的始终是最新工具列表
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+class ToolDocuments:
+    """
+    /list_tools 与 /api/swagger.json 的预计算文档，启动时构建一次；修改 TOOLS 后调用 refresh() 重新生成。
+    """
+
+    def __init__(self, tools: List[dict]):
+        self.tools = tools
+        self.refresh()
+
+    def refresh(self):
+        self.tool_list = PrecomputedDocument({"tools": self.tools})
+        self.swagger = PrecomputedDocument(build_swagger_doc(self.tools))
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : __init__.py.py 
+@Time    : 2026/10/18 12:40
+@Author  : xxlaila
+@Software: dify
+"""
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : cluster_poller.py
+@Time    : 2026/10/18 12:40
+@Author  : xxlaila
+@Software: dify
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from config.es_config import (
+    get_cluster, list_clusters,
+    CLUSTER_POLLER_INTERVAL, CLUSTER_POLLER_HISTORY, CLUSTER_POLLER_WORKERS
+)
+from models.es_client import ESHttpClient
+from utils.logger import logger
+
+# 采集的路径及请求参数
+POLLED_PATHS = {
+    "_cluster/health": {},
+    "_nodes/stats": {},
+    "_cat/thread_pool": {"format": "json"}
+}
+# 只影响展示、不影响内容的参数，带这些参数的 command 仍可直接用快照回答
+_PRESENTATION_PARAMS = {"v", "pretty", "human"}
+
+class ClusterPoller:
+    """
+    后台周期采集所有集群的健康、节点统计与线程池状态，保存最新快照和一段历史（环形缓冲）。
+    每个集群的采集任务独立提交到有界线程池，上一轮未完成的集群本轮跳过，慢集群不会拖累其他集群。
+    """
+
+    def __init__(self, interval: float = CLUSTER_POLLER_INTERVAL, history: float = CLUSTER_POLLER_HISTORY,
+                 workers: int = CLUSTER_POLLER_WORKERS):
+        self.interval = interval
+        self.history_size = max(1, int(history // interval) + 1)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cluster-poller")
+        self._lock = threading.Lock()
+        self._snapshots: Dict[Tuple[str, str], deque] = {}
+        self._in_flight = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cluster-poller", daemon=True)
+        self._thread.start()
+        logger.info(f"Cluster poller started, interval={self.interval}s history={self.history_size} snapshots")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for cluster_name in list_clusters():
+                with self._lock:
+                    if cluster_name in self._in_flight:
+                        logger.warning(f"Cluster poller: previous round for {cluster_name} still running, skipped")
+                        continue
+                    self._in_flight.add(cluster_name)
+                self._executor.submit(self._collect, cluster_name)
+            self._stop.wait(self.interval)
+
+    def _collect(self, cluster_name: str):
+        try:
+            es = ESHttpClient.get_client(cluster_name)
+            timeout = min(self.interval, get_cluster(cluster_name).client_kwargs["timeout"])
+            for path, params in POLLED_PATHS.items():
+                started = time.time()
+                snapshot = {"collected_at": started}
+                try:
+                    snapshot["data"] = es.transport.perform_request(
+                        method='GET',
+                        url=f'/{path}',
+                        params={**params, "request_timeout": timeout}
+                    )
+                except Exception as e:
+                    snapshot["error"] = str(e)
+                snapshot["took_ms"] = round((time.time() - started) * 1000, 1)
+                self._store(cluster_name, path, snapshot)
+        except Exception as e:
+            logger.error(f"Cluster poller: collecting {cluster_name} failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(cluster_name)
+
+    def _store(self, cluster_name: str, path: str, snapshot: dict):
+        with self._lock:
+            ring = self._snapshots.get((cluster_name, path))
+            if ring is None:
+                ring = self._snapshots[(cluster_name, path)] = deque(maxlen=self.history_size)
+            ring.append(snapshot)
+
+    def is_collected(self, path: str) -> bool:
+        return self.running and "/".join(p for p in path.split("/") if p) in POLLED_PATHS
+
+    def lookup(self, cluster_name: str, path: str, params: Dict[str, Any]) -> Optional[Tuple[Any, dict]]:
+        """
+        command 请求与采集路径一致且快照足够新时，返回 (快照数据, 元数据)，否则返回 None。
+        """
+        if not self.is_collected(path):
+            return None
+        path = "/".join(p for p in path.split("/") if p)
+        if set(params) - _PRESENTATION_PARAMS - {"format", "request_timeout"}:
+            return None
+        # _cat 接口只有 format=json 时才返回结构化数据，其余接口默认就是 JSON
+        fmt = params.get("format")
+        if fmt != "json" and (POLLED_PATHS[path].get("format") == "json" or fmt is not None):
+            return None
+
+        with self._lock:
+            ring = self._snapshots.get((cluster_name, path))
+            snapshot = ring[-1] if ring else None
+        if snapshot is None or "data" not in snapshot:
+            return None
+        age = time.time() - snapshot["collected_at"]
+        if age > 2 * self.interval:
+            return None
+        return snapshot["data"], {"hit": True, "age": round(age, 3), "ttl": self.interval, "source": "snapshot"}
+
+    def history(self, cluster_name: str, path: str, minutes: float) -> List[dict]:
+        path = "/".join(p for p in path.split("/") if p)
+        since = time.time() - minutes * 60
+        with self._lock:
+            ring = list(self._snapshots.get((cluster_name, path), ()))
+        return [s for s in ring if s["collected_at"] >= since]
+
+cluster_poller = ClusterPoller()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : field_catalog.py
+@Time    : 2026/10/18 21:20
+@Author  : xxlaila
+@Software: dify
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from config.es_config import (
+    get_cluster, FIELD_CATALOG_TTL, FIELD_CATALOG_MAX_ENTRIES, FIELD_CATALOG_REFRESH_AFTER, FIELD_CATALOG_FAILURE_TTL
+)
+from models.admission import AdmissionRejected
+from models.async_es_client import AsyncESClient
+from models.es_client import ESClient
+from utils import metrics
+from utils.dsl_fields import FieldInfo, FieldRef, check_field_refs, collect_field_refs, parse_field_caps, runtime_fields
+from utils.logger import logger
+
+class InvalidFields(Exception):
+    """
+    DSL 引用了不存在或类型不匹配的字段，查询不发给ES；report 为校验详情（含最接近的字段名建议）。
+    """
+
+    def __init__(self, message: str, report: dict):
+        super().__init__(message)
+        self.report = report
+
+class FieldCatalogUnavailable(Exception):
+    """
+    该索引表达式的字段目录最近加载失败，在 failure_ttl 内不再访问ES重试。
+    """
+
+def _index_key(index: Any) -> str:
+    if isinstance(index, (list, tuple)):
+        return ",".join(index)
+    return index or "_all"
+
+class FieldCatalog:
+    """
+    按 (集群, 索引表达式) 缓存 _field_caps 合并后的字段目录（字段名 -> 类型、可搜索、可聚合），
+    超过 ttl 后下次访问时重新加载，条目数超过 max_entries 时淘汰最久未用的；
+    加载失败的结果缓存 failure_ttl 秒，避免每次查询都重复一次失败的 _field_caps 请求。
+    """
+
+    def __init__(self, ttl: float, max_entries: int, failure_ttl: float = 0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[float, Dict[str, FieldInfo]]]" = OrderedDict()
+        self._failures: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()  # 键 -> (失效时间, 错误信息)
+
+    def _cached(self, key: tuple, max_age: float) -> Optional[Tuple[float, Dict[str, FieldInfo]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _check_failure(self, key: tuple, max_age: Optional[float]):
+        # 显式刷新（max_age=0）不受失败缓存限制
+        if max_age == 0:
+            return
+        with self._lock:
+            failure = self._failures.get(key)
+        if failure is not None and failure[0] > time.monotonic():
+            raise FieldCatalogUnavailable(
+                f"Field catalog of {key[0]}/{key[1]} unavailable, retry in {failure[0] - time.monotonic():.0f}s: {failure[1]}"
+            )
+
+    def _record_failure(self, key: tuple, error: Exception):
+        # 准入拒绝只说明本服务繁忙，不缓存
+        if self.failure_ttl <= 0 or isinstance(error, AdmissionRejected):
+            return
+        with self._lock:
+            self._failures.pop(key, None)
+            self._failures[key] = (time.monotonic() + self.failure_ttl, str(error))
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def _store(self, key: tuple, response: dict) -> Tuple[float, Dict[str, FieldInfo]]:
+        entry = (time.monotonic(), parse_field_caps(response))
+        with self._lock:
+            self._failures.pop(key, None)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _params(index: str) -> dict:
+        return {"index": index, "fields": "*", "ignore_unavailable": True, "allow_no_indices": True}
+
+    def get(self, cluster_name: str, index: Any = None, max_age: Optional[float] = None) -> Tuple[Dict[str, FieldInfo], float]:
+        """
+        返回 (字段目录, 目录已缓存的秒数)；max_age=0 强制重新加载。
+        """
+        key = (cluster_name, _index_key(index))
+        entry = self._cached(key, self.ttl if max_age is None else max_age)
+        if entry is None:
+            self._check_failure(key, max_age)
+            es = ESClient.get_client(cluster_name)
+            try:
+                response = es.field_caps(**self._params(key[1]))
+            except Exception as e:
+                self._record_failure(key, e)
+                raise
+            entry = self._store(key, response)
+        return entry[1], time.monotonic() - entry[0]
+
+    async def get_async(self, cluster_name: str, index: Any = None,
+                        max_age: Optional[float] = None) -> Tuple[Dict[str, FieldInfo], float]:
+        key = (cluster_name, _index_key(index))
+        entry = self._cached(key, self.ttl if max_age is None else max_age)
+        if entry is None:
+            self._check_failure(key, max_age)
+            es = AsyncESClient.get_client(cluster_name)
+            try:
+                response = await es.field_caps(**self._params(key[1]))
+            except Exception as e:
+                self._record_failure(key, e)
+                raise
+            entry = self._store(key, response)
+        return entry[1], time.monotonic() - entry[0]
+
+    def invalidate(self, cluster_name: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == cluster_name]:
+                del self._entries[key]
+            for key in [k for k in self._failures if k[0] == cluster_name]:
+                del self._failures[key]
+
+field_catalog = FieldCatalog(FIELD_CATALOG_TTL, FIELD_CATALOG_MAX_ENTRIES, FIELD_CATALOG_FAILURE_TTL)
+
+def _check(refs: List[FieldRef], dsl: dict, fields: Dict[str, FieldInfo]) -> Tuple[List[dict], List[dict]]:
+    return check_field_refs(refs, {**fields, **runtime_fields(dsl)})
+
+def _needs_refresh(errors: List[dict], age: float) -> bool:
+    # 目录可能还没包含刚写入的新字段：判定为未知字段前，足够旧的目录先刷新一次
+    return age >= FIELD_CATALOG_REFRESH_AFTER and any(e["kind"] == "unknown_field" for e in errors)
+
+def _report(cluster_name: str, errors: List[dict], warnings: List[dict], age: float) -> Optional[dict]:
+    tool = metrics.current_tool()
+    if errors:
+        metrics.field_check_total.inc(tool, cluster_name, "rejected")
+        report = {"errors": errors, "warnings": warnings, "catalog_age": round(age, 3)}
+        raise InvalidFields("; ".join(e["message"] for e in errors), report)
+    if warnings:
+        metrics.field_check_total.inc(tool, cluster_name, "warned")
+        return {"warnings": warnings, "catalog_age": round(age, 3)}
+    return None
+
+def check_query_fields(cluster_name: str, dsl: dict) -> Optional[dict]:
+    """
+    用缓存的字段目录在本地校验 DSL 引用的字段：有错误时抛出 InvalidFields（不再访问ES执行查询），
+    只有警告时返回校验报告，没有问题返回 None。目录加载失败或索引不存在时跳过校验（失败结果缓存 failure_ttl 秒）。
+    """
+    if not get_cluster(cluster_name).field_validation:
+        return None
+    refs = collect_field_refs(dsl)
+    if not refs:
+        return None
+    try:
+        fields, age = field_catalog.get(cluster_name, dsl.get("index"))
+        errors, warnings = _check(refs, dsl, fields)
+        if _needs_refresh(errors, age):
+            fields, age = field_catalog.get(cluster_name, dsl.get("index"), max_age=0)
+            errors, warnings = _check(refs, dsl, fields)
+    except FieldCatalogUnavailable:
+        return None
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.warning(f"Loading field catalog of {cluster_name} failed, skip field validation: {e}")
+        return None
+    if not fields:
+        return None
+    return _report(cluster_name, errors, warnings, age)
+
+async def check_query_fields_async(cluster_name: str, dsl: dict) -> Optional[dict]:
+    if not get_cluster(cluster_name).field_validation:
+        return None
+    refs = collect_field_refs(dsl)
+    if not refs:
+        return None
+    try:
+        fields, age = await field_catalog.get_async(cluster_name, dsl.get("index"))
+        errors, warnings = _check(refs, dsl, fields)
+        if _needs_refresh(errors, age):
+            fields, age = await field_catalog.get_async(cluster_name, dsl.get("index"), max_age=0)
+            errors, warnings = _check(refs, dsl, fields)
+    except FieldCatalogUnavailable:
+        return None
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.warning(f"Loading field catalog of {cluster_name} failed, skip field validation: {e}")
+        return None
+    if not fields:
+        return None
+    return _report(cluster_name, errors, warnings, age)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : index_catalog.py
+@Time    : 2026/10/18 16:50
+@Author  : xxlaila
+@Software: dify
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from config.es_config import get_cluster, INDEX_CATALOG_TTL, INDEX_PRUNING_FIELD, INDEX_PRUNING_SLACK_HOURS
+from models.async_es_client import AsyncESClient
+from models.es_client import ESClient
+from utils.index_pruning import TimeRange, extract_time_range, prune_indices, split_index_expression
+from utils.logger import logger
+
+class IndexCatalog:
+    """
+    按集群缓存 _cat/indices 的 open 索引列表及各索引的主分片数，
+    供查询前按时间裁剪通配符索引、预估查询涉及的分片数使用。
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, List[str], Dict[str, int]]] = {}
+
+    def _cached(self, cluster_name: str) -> Optional[Tuple[float, List[str], Dict[str, int]]]:
+        with self._lock:
+            entry = self._entries.get(cluster_name)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    def _store(self, cluster_name: str, rows: list) -> Tuple[float, List[str], Dict[str, int]]:
+        rows = [row for row in rows if row.get("status", "open") == "open"]
+        names = sorted(row["index"] for row in rows)
+        shards = {row["index"]: int(row.get("pri") or 1) for row in rows}
+        entry = (time.monotonic() + self.ttl, names, shards)
+        with self._lock:
+            self._entries[cluster_name] = entry
+        return entry
+
+    def _load(self, cluster_name: str) -> Tuple[float, List[str], Dict[str, int]]:
+        entry = self._cached(cluster_name)
+        if entry is None:
+            es = ESClient.get_client(cluster_name)
+            entry = self._store(cluster_name, es.cat.indices(format="json", h="index,status,pri"))
+        return entry
+
+    def get(self, cluster_name: str) -> List[str]:
+        return self._load(cluster_name)[1]
+
+    def shard_counts(self, cluster_name: str, cached_only: bool = False) -> Optional[Dict[str, int]]:
+        """
+        {索引名: 主分片数}；cached_only=True 时只读缓存，没有缓存返回 None（不访问ES）。
+        """
+        entry = self._cached(cluster_name) if cached_only else self._load(cluster_name)
+        return entry[2] if entry is not None else None
+
+    async def get_async(self, cluster_name: str) -> List[str]:
+        entry = self._cached(cluster_name)
+        if entry is None:
+            es = AsyncESClient.get_client(cluster_name)
+            entry = self._store(cluster_name, await es.cat.indices(format="json", h="index,status,pri"))
+        return entry[1]
+
+    def invalidate(self, cluster_name: str):
+        with self._lock:
+            self._entries.pop(cluster_name, None)
+
+index_catalog = IndexCatalog(INDEX_CATALOG_TTL)
+
+def _pruning_plan(cluster_name: str, dsl: dict) -> Optional[Tuple[List[str], TimeRange]]:
+    if not get_cluster(cluster_name).index_pruning:
+        return None
+    patterns = split_index_expression(dsl.get("index"))
+    if not any(c in p for p in patterns for c in "*?"):
+        return None
+    try:
+        time_range = extract_time_range(dsl, INDEX_PRUNING_FIELD)
+    except ValueError as e:
+        logger.info(f"Skip index pruning on {cluster_name}: {e}")
+        return None
+    if time_range is None:
+        return None
+    if dsl.get("ignore_unavailable") is False:
+        # 展开后的具体索引可能在目录缓存期内被 ILM 删除，调用方明确要求缺失即报错时不改写
+        return None
+    return patterns, time_range
+
+def _apply_plan(dsl: dict, patterns: List[str], time_range: TimeRange,
+                catalog: List[str]) -> Tuple[dict, Optional[dict]]:
+    indices = prune_indices(patterns, catalog, time_range, timedelta(hours=INDEX_PRUNING_SLACK_HOURS))
+    if indices is None:
+        return dsl, None
+    start, end = time_range
+    rewrite = {
+        "original": dsl["index"],
+        "indices": indices,
+        "time_range": {
+            "gte": start.isoformat() if start else None,
+            "lte": end.isoformat() if end else None
+        }
+    }
+    # 目录有缓存期，期间被删除的索引不能让整个查询 index_not_found
+    return {**dsl, "index": ",".join(indices), "ignore_unavailable": True}, rewrite
+
+def prune_query_indices(cluster_name: str, dsl: dict) -> Tuple[dict, Optional[dict]]:
+    """
+    通配符索引 + 顶层时间范围时，把 index 改写为时间上可能有数据的具体索引，返回 (新DSL, 改写说明)。
+    无法改写或出错时原样返回，改写说明为 None。
+    """
+    plan = _pruning_plan(cluster_name, dsl)
+    if plan is None:
+        return dsl, None
+    try:
+        catalog = index_catalog.get(cluster_name)
+    except Exception as e:
+        logger.warning(f"Loading index catalog of {cluster_name} failed, skip pruning: {e}")
+        return dsl, None
+    return _apply_plan(dsl, *plan, catalog)
+
+async def prune_query_indices_async(cluster_name: str, dsl: dict) -> Tuple[dict, Optional[dict]]:
+    plan = _pruning_plan(cluster_name, dsl)
+    if plan is None:
+        return dsl, None
+    try:
+        catalog = await index_catalog.get_async(cluster_name)
+    except Exception as e:
+        logger.warning(f"Loading index catalog of {cluster_name} failed, skip pruning: {e}")
+        return dsl, None
+    return _apply_plan(dsl, *plan, catalog)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : query_guard.py
+@Time    : 2026/10/18 20:05
+@Author  : xxlaila
+@Software: dify
+"""
+import fnmatch
+import json
+from typing import List, Optional, Tuple
+from config.es_config import (
+    get_cluster, QUERY_GUARD_MAX_SIZE, QUERY_GUARD_MAX_TERMS_SIZE, QUERY_GUARD_MAX_SHARDS, QUERY_GUARD_TIMEOUT,
+    QUERY_GUARD_TERMINATE_AFTER, QUERY_GUARD_CACHE_TTL
+)
+from models.es_client import ESClient
+from services.index_catalog import index_catalog
+from utils import metrics
+from utils.cache import TTLCache
+from utils.index_pruning import split_index_expression
+from utils.logger import logger
+from utils.query_cost import inspect_dsl
+
+# 同一查询短时间内重复预检时复用 _validate 和分片数的结果
+_preflight_cache = TTLCache(4 * 1024 * 1024, 2000)
+_MAX_EXPLANATION_LENGTH = 500
+
+class QueryRejected(Exception):
+    """
+    查询被代价预检拒绝（集群策略为 reject，或 _validate 判定查询非法），report 为预检详情。
+    """
+
+    def __init__(self, message: str, report: dict):
+        super().__init__(message)
+        self.report = report
+
+def _many_shards(shards: Optional[int]) -> Optional[dict]:
+    if shards is None or shards <= QUERY_GUARD_MAX_SHARDS:
+        return None
+    return {"kind": "many_shards", "path": "index", "value": shards, "limit": QUERY_GUARD_MAX_SHARDS}
+
+def inspect_query(cluster_name: str, dsl: dict, paged: bool = False) -> List[dict]:
+    """
+    静态检查 DSL，并按已缓存的索引目录估算分片数（不访问ES）；没有问题时调用方可以跳过 guard_query。
+    paged=True 表示由服务端分页遍历（stream/summarize），顶层 size 不生效，不作为问题。
+    """
+    if get_cluster(cluster_name).query_guard == "allow":
+        return []
+    flags = inspect_dsl(dsl, QUERY_GUARD_MAX_SIZE, QUERY_GUARD_MAX_TERMS_SIZE)[1]
+    if paged:
+        flags = [flag for flag in flags if flag["kind"] != "large_size"]
+    many_shards = _many_shards(estimate_shards(cluster_name, dsl.get("index"), cached_only=True))
+    if many_shards is not None:
+        flags.append(many_shards)
+    return flags
+
+def estimate_shards(cluster_name: str, index, cached_only: bool = False) -> Optional[int]:
+    """
+    按缓存的 _cat/indices 估算查询涉及的主分片数；别名、数据流、跨集群索引无法估算时返回 None，
+    cached_only=True 且索引目录没有缓存时也返回 None。
+    """
+    patterns = split_index_expression(index) or ["*"]
+    if any(p.startswith("-") or ":" in p for p in patterns):
+        return None
+    shards = index_catalog.shard_counts(cluster_name, cached_only)
+    if shards is None:
+        return None
+    total, matched = 0, False
+    for name, count in shards.items():
+        if any(fnmatch.fnmatchcase(name, "*" if p == "_all" else p) for p in patterns):
+            total += count
+            matched = True
+    return total if matched else None
+
+def _validate(cluster_name: str, dsl: dict) -> Optional[dict]:
+    if "query" not in dsl:
+        return None
+    es = ESClient.get_client(cluster_name)
+    response = es.indices.validate_query(index=dsl.get("index"), body={"query": dsl["query"]}, explain=True)
+    explanations = []
+    for item in (response.get("explanations") or [])[:3]:
+        text = item.get("explanation") or item.get("error") or ""
+        explanations.append({"index": item.get("index"), "explanation": text[:_MAX_EXPLANATION_LENGTH]})
+    return {"valid": response.get("valid", True), "explanations": explanations}
+
+def _preflight(cluster_name: str, dsl: dict) -> dict:
+    key = (cluster_name, json.dumps(dsl, sort_keys=True, ensure_ascii=False))
+    cached = _preflight_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    preflight = {"shards": None, "validation": None}
+    try:
+        preflight["shards"] = estimate_shards(cluster_name, dsl.get("index"))
+    except Exception as e:
+        logger.warning(f"Estimating shards on {cluster_name} failed: {e}")
+    preflight["validation"] = _validate(cluster_name, dsl)
+    _preflight_cache.set(key, preflight, QUERY_GUARD_CACHE_TTL)
+    return preflight
+
+def guard_query(cluster_name: str, dsl: dict, flags: List[dict], limit_runtime: bool = True) -> Tuple[dict, dict]:
+    """
+    对静态检查出问题的查询做预检：_validate/query?explain 校验并展示改写后的 Lucene 查询，按索引元数据估算分片数，
+    再按集群策略处理——reject 抛出 QueryRejected；rewrite 收紧 size、补上 timeout 和 terminate_after；report 原样放行，只返回报告。
+    limit_runtime=False（异步查询，本来就是为长时间运行准备的）时 rewrite 只收紧 size，不加 timeout 和 terminate_after。
+    返回 (处理后的 DSL, 预检报告)。
+    """
+    policy = get_cluster(cluster_name).query_guard
+    preflight = _preflight(cluster_name, dsl)
+    flags = list(flags)
+    shards = preflight["shards"]
+    many_shards = _many_shards(shards)
+    if many_shards is not None and not any(flag["kind"] == "many_shards" for flag in flags):
+        flags.append(many_shards)
+    report = {"policy": policy, "flags": flags, "shards": shards}
+    if preflight["validation"] is not None:
+        report["validation"] = preflight["validation"]
+
+    tool = metrics.current_tool()
+    if policy == "report":
+        report["action"] = "reported"
+        metrics.query_guard_total.inc(tool, cluster_name, "reported")
+        logger.warning(f"Cost guard reported query on {cluster_name}: {[f['kind'] for f in flags]}")
+        return dsl, report
+    if preflight["validation"] is not None and not preflight["validation"]["valid"]:
+        report["action"] = "rejected"
+        metrics.query_guard_total.inc(tool, cluster_name, "invalid")
+        raise QueryRejected("Query rejected by cost guard: invalid query", report)
+    if policy == "reject":
+        report["action"] = "rejected"
+        metrics.query_guard_total.inc(tool, cluster_name, "rejected")
+        kinds = ", ".join(sorted({flag["kind"] for flag in flags}))
+        raise QueryRejected(f"Query rejected by cost guard: {kinds}", report)
+
+    if policy == "rewrite":
+        dsl, _ = inspect_dsl(dsl, QUERY_GUARD_MAX_SIZE, QUERY_GUARD_MAX_TERMS_SIZE, clamp=True)
+        report["action"] = "rewritten"
+        report["rewrites"] = {
+            "clamped": [flag["path"] for flag in flags if flag["kind"] in ("large_size", "large_terms_size")]
+        }
+        if limit_runtime:
+            dsl.setdefault("timeout", QUERY_GUARD_TIMEOUT)
+            dsl.setdefault("terminate_after", QUERY_GUARD_TERMINATE_AFTER)
+            report["rewrites"].update(timeout=dsl["timeout"], terminate_after=dsl["terminate_after"])
+    else:
+        report["action"] = "allowed"
+    metrics.query_guard_total.inc(tool, cluster_name, report["action"])
+    logger.warning(f"Cost guard {report['action']} query on {cluster_name}: {[f['kind'] for f in flags]}")
+    return dsl, report
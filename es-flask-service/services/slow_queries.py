@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : slow_queries.py
+@Time    : 2026/10/18 22:00
+@Author  : xxlaila
+@Software: dify
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from config.es_config import (
+    SLOW_QUERY_ENABLED, SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_TOP_K, SLOW_QUERY_PROFILE_SAMPLE_RATE,
+    SLOW_QUERY_PROFILE_MAX_PENDING, SLOW_QUERY_MAX_DSL_BYTES
+)
+from models.es_client import ESClient
+from utils import metrics
+from utils.es_profile import summarize_profile
+from utils.logger import logger
+
+_MAX_CALLERS = 10
+_MAX_CALLER_LENGTH = 200
+# 重放时只取 took 和 profile，不把命中和聚合结果再传一遍
+_PROFILE_FILTER_PATH = "took,profile"
+
+# 发起当前请求的调用方（请求头 SLOW_QUERY_CALLER_HEADER，缺省为客户端地址），由接口层在请求开始时设置
+_current_caller: ContextVar[Optional[str]] = ContextVar("current_caller", default=None)
+
+def set_current_caller(caller: Optional[str]):
+    return _current_caller.set(caller[:_MAX_CALLER_LENGTH] if caller else None)
+
+class SlowQueryLog:
+    """
+    按集群保存最慢的 top_k 个查询（按 DSL 哈希去重，同一查询只保留最慢一次的耗时并累计次数和调用方），
+    新进入榜单的查询按 sample_rate 抽样，在后台线程中加 "profile": true 重放一次，保存 profile 概览。
+    """
+
+    def __init__(self, threshold_ms: float, top_k: int, sample_rate: float, max_pending: int):
+        self.threshold_ms = threshold_ms
+        self.top_k = top_k
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, dict]] = {}  # 集群 -> {dsl_hash: 记录}
+        self._pending = 0
+        self.profiled = 0
+        self.profile_dropped = 0
+        # 重放会给集群增加负载，同一时间只跑一个
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-profile")
+
+    def observe(self, cluster_name: str, dsl: dict, digest: str, response: dict, wall_seconds: float):
+        """
+        查询返回后调用；未超过阈值时立即返回，开销只有一次比较。
+        """
+        wall_ms = wall_seconds * 1000
+        if wall_ms < self.threshold_ms:
+            return
+        caller = _current_caller.get() or "unknown"
+        now = time.time()
+        response_bytes = len(json.dumps(response, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            entries = self._entries.setdefault(cluster_name, {})
+            entry = entries.get(digest)
+            if entry is None:
+                if len(entries) >= self.top_k:
+                    fastest = min(entries.values(), key=lambda e: e["wall_ms"])
+                    if fastest["wall_ms"] >= wall_ms:
+                        return
+                    del entries[fastest["dsl_hash"]]
+                text = json.dumps(dsl, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+                if len(text) > SLOW_QUERY_MAX_DSL_BYTES:
+                    text = text[:SLOW_QUERY_MAX_DSL_BYTES] + "...(truncated)"
+                entry = entries[digest] = {
+                    "dsl_hash": digest, "index": dsl.get("index"), "dsl": text, "count": 0, "callers": {},
+                    "wall_ms": 0.0, "first_seen": now
+                }
+                profile = self._should_profile()
+            else:
+                profile = False
+            entry["count"] += 1
+            entry["last_seen"] = now
+            callers = entry["callers"]
+            if caller in callers or len(callers) < _MAX_CALLERS:
+                callers[caller] = callers.get(caller, 0) + 1
+            if wall_ms > entry["wall_ms"]:
+                entry.update(
+                    wall_ms=round(wall_ms, 3), took_ms=response.get("took"), caller=caller,
+                    tool=metrics.current_tool(), response_bytes=response_bytes
+                )
+            if profile:
+                entry["profile_status"] = "pending"
+        if profile:
+            self._executor.submit(self._profile, cluster_name, dict(dsl), entry)
+
+    def _should_profile(self) -> bool:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        if self._pending >= self.max_pending:
+            self.profile_dropped += 1
+            return False
+        self._pending += 1
+        return True
+
+    def _profile(self, cluster_name: str, dsl: dict, entry: dict):
+        # 后台重放不属于任何工具调用，单独打标签；准入控制中按普通优先级排队
+        metrics.set_current_tool("slow_query_profile")
+        try:
+            dsl.update(profile=True, request_cache=False, filter_path=_PROFILE_FILTER_PATH)
+            response = ESClient.get_client(cluster_name).search(**dsl)
+            summary = summarize_profile(response.get("profile") or {})
+            summary["took_ms"] = response.get("took")
+            with self._lock:
+                entry["profile"] = summary
+                entry["profile_status"] = "done"
+                self.profiled += 1
+        except Exception as e:
+            logger.warning(f"Profiling slow query {entry['dsl_hash'][:12]} on {cluster_name} failed: {e}")
+            with self._lock:
+                entry["profile_status"] = f"failed: {e}"
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def top(self, cluster_name: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, List[dict]]:
+        with self._lock:
+            clusters = {name: [dict(e, callers=dict(e["callers"])) for e in entries.values()]
+                        for name, entries in self._entries.items()
+                        if cluster_name is None or name == cluster_name}
+        return {
+            name: sorted(entries, key=lambda e: e["wall_ms"], reverse=True)[:limit or self.top_k]
+            for name, entries in clusters.items()
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold_ms,
+                "top_k": self.top_k,
+                "profile_sample_rate": self.sample_rate,
+                "profile_pending": self._pending,
+                "profiled": self.profiled,
+                "profile_dropped": self.profile_dropped
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+slow_query_log = SlowQueryLog(
+    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_TOP_K, SLOW_QUERY_PROFILE_SAMPLE_RATE, SLOW_QUERY_PROFILE_MAX_PENDING
+)
+
+def record_slow_query(cluster_name: str, dsl: dict, digest: str, response: dict, wall_seconds: float):
+    if SLOW_QUERY_ENABLED:
+        slow_query_log.observe(cluster_name, dsl, digest, response, wall_seconds)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : cache.py
+@Time    : 2026/10/18 10:20
+@Author  : xxlaila
+@Software: dify
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+class TTLCache:
+    """
+    线程安全的 TTL + LRU 结果缓存。
+    值以序列化后的 JSON 字节保存，既能精确统计内存占用，也保证命中时返回的是独立副本。
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int = 10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (payload, stored_at, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        返回 (value, age_seconds)，未命中或已过期返回 None。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, stored_at, expires_at = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        return json.loads(payload), now - stored_at
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> bool:
+        if ttl <= 0:
+            return False
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # 单条结果超过总预算的 1/4 时不缓存，避免一次大查询冲掉整个缓存
+        if len(payload) > self.max_bytes // 4:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (payload, now, now + ttl)
+            self._bytes += len(payload)
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+    def _remove(self, key: Hashable):
+        payload, _, _ = self._data.pop(key)
+        self._bytes -= len(payload)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : columnar.py
+@Time    : 2026/10/18 22:30
+@Author  : xxlaila
+@Software: dify
+"""
+import fnmatch
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_INT_RE = re.compile(r"^-?\d+$")
+_FLOAT_RE = re.compile(r"^-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+# 按对象展开成多行的集合：_nodes/* 每个节点一行，_stats、_cluster/health?level=indices 每个索引一行
+_ROW_COLLECTIONS = ("nodes", "indices")
+
+def _flatten(value: Any, prefix: str, out: Dict[str, Any]):
+    """
+    把嵌套对象展开为 {"jvm.mem.heap_used_percent": 42} 形式；数组保持原样作为单个值。
+    """
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(child, f"{prefix}.{key}" if prefix else key, out)
+    else:
+        out[prefix] = value
+
+def _rows(response: Any) -> Tuple[List[Dict[str, Any]], Optional[str], Dict[str, Any]]:
+    """
+    返回 (行列表, 行键列名, 表外的标量信息)：
+    _cat 接口的对象数组每个元素一行；含 nodes/indices 集合的对象每个成员一行（键作为 node/index 列），
+    其余标量（如 cluster_name、_nodes 计数）放在 meta 中；其他对象整体作为一行。
+    """
+    if isinstance(response, list):
+        rows = []
+        for item in response:
+            row = {}
+            _flatten(item if isinstance(item, dict) else {"value": item}, "", row)
+            rows.append(row)
+        return rows, None, {}
+    if not isinstance(response, dict):
+        return [{"value": response}], None, {}
+    for collection in _ROW_COLLECTIONS:
+        members = response.get(collection)
+        if isinstance(members, dict) and members and all(isinstance(m, dict) for m in members.values()):
+            key_column = collection[:-1] if collection == "nodes" else "index"
+            rows = []
+            for key, member in members.items():
+                row = {key_column: key}
+                _flatten(member, "", row)
+                rows.append(row)
+            meta = {}
+            _flatten({k: v for k, v in response.items() if k != collection}, "", meta)
+            return rows, key_column, meta
+    row = {}
+    _flatten(response, "", row)
+    return [row], None, {}
+
+def _column_type(values: List[Any]) -> str:
+    """
+    推断列类型：_cat 的 JSON 输出中数字也是字符串，整列都能解析为整数/小数时按数字返回，便于排序和取前 N。
+    """
+    kinds = set()
+    for value in values:
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            kinds.add("boolean")
+        elif isinstance(value, int):
+            kinds.add("integer")
+        elif isinstance(value, float):
+            kinds.add("float" if math.isfinite(value) else "string")
+        elif isinstance(value, str) and _INT_RE.match(value):
+            kinds.add("integer")
+        elif isinstance(value, str) and _FLOAT_RE.match(value):
+            kinds.add("float")
+        elif isinstance(value, str):
+            kinds.add("string")
+        else:
+            kinds.add("json")
+    if not kinds:
+        return "null"
+    if kinds <= {"integer"}:
+        return "integer"
+    if kinds <= {"integer", "float"}:
+        return "float"
+    if len(kinds) == 1:
+        return kinds.pop()
+    return "string" if "json" not in kinds else "json"
+
+def _typed(values: List[Any], column_type: str) -> List[Any]:
+    if column_type in ("integer", "float"):
+        convert = float if column_type == "float" else int
+        return [None if v is None or v == "" else convert(v) for v in values]
+    if column_type == "string":
+        return [None if v is None or v == "" else v if isinstance(v, str) else str(v) for v in values]
+    return values
+
+def _selected(names: List[str], patterns: Optional[List[str]]) -> List[str]:
+    if not patterns:
+        return names
+    return [n for n in names if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+
+def to_columnar(response: Any, columns: Optional[List[str]] = None, max_columns: int = 0) -> dict:
+    """
+    把 command 的 JSON 结果转换为按列存放的表：
+    {"rows": 行数, "columns": [列名], "types": [列类型], "values": [[第1列的值], [第2列的值], ...]}，
+    列名只出现一次，数字列转换为真正的数字。columns 为列名通配符（如 "jvm.mem.*"），只保留匹配的列（行键列始终保留）；
+    超过 max_columns 的列被丢弃并在 truncated_columns 中给出数量。
+    """
+    rows, key_column, meta = _rows(response)
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    selected = _selected(names, columns)
+    if key_column and key_column not in selected:
+        selected.insert(0, key_column)
+
+    table = {"rows": len(rows)}
+    if max_columns > 0 and len(selected) > max_columns:
+        table["truncated_columns"] = len(selected) - max_columns
+        selected = selected[:max_columns]
+
+    types, values = [], []
+    for name in selected:
+        column = [row.get(name) for row in rows]
+        column_type = _column_type(column)
+        types.append(column_type)
+        values.append(_typed(column, column_type))
+    table.update(columns=selected, types=types, values=values)
+    if meta:
+        table["meta"] = meta
+    return table
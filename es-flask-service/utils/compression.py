@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : compression.py
+@Time    : 2026/10/18 17:10
+@Author  : xxlaila
+@Software: dify
+"""
+import zlib
+from typing import Iterable, Iterator, Optional
+from config.es_config import RESPONSE_GZIP_LEVEL, RESPONSE_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # 未安装 Brotli 时只协商 gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json", "application/x-ndjson", "text/event-stream", "text/plain", "text/html",
+    "application/javascript", "text/css"
+)
+
+def supported_encodings() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    按 Accept-Encoding 的 q 值选择编码，同权重时优先 br；不接受任何压缩时返回 None。
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class StreamCompressor:
+    """
+    增量压缩器：每个分块压缩后立即 flush，保证 NDJSON/SSE 逐条推送不会被压缩缓冲卡住。
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=RESPONSE_BROTLI_QUALITY)
+        else:
+            # wbits=31 生成带 gzip 头的流
+            self._compressor = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=RESPONSE_BROTLI_QUALITY)
+    return zlib.compress(data, RESPONSE_GZIP_LEVEL, wbits=31)
+
+class CompressedStream:
+    """
+    包装流式响应体，逐块压缩；close 透传给原迭代器。
+    """
+
+    def __init__(self, iterable: Iterable, encoding: str, charset: str = "utf-8"):
+        self.iterable = iterable
+        self.charset = charset
+        self.compressor = StreamCompressor(encoding)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.charset)
+            if chunk:
+                yield self.compressor.compress(chunk)
+        yield self.compressor.finish()
+
+    def close(self):
+        close = getattr(self.iterable, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : dsl_fields.py
+@Time    : 2026/10/18 21:10
+@Author  : xxlaila
+@Software: dify
+"""
+import difflib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+TEXT_TYPES = ("text", "match_only_text", "annotated_text", "search_as_you_type")
+KEYWORD_TYPES = ("keyword", "constant_keyword", "wildcard")
+OBJECT_TYPES = ("object", "nested")
+
+# 全文查询：参数对象的键是字段名
+_FULL_TEXT_QUERIES = ("match", "match_phrase", "match_phrase_prefix", "match_bool_prefix", "intervals")
+# 精确词项查询：不做分词，直接与索引中的词项比较
+_TERM_QUERIES = ("term", "terms", "terms_set")
+# 其他按值匹配的查询，只检查字段是否存在
+_VALUE_QUERIES = ("range", "prefix", "wildcard", "regexp", "fuzzy")
+# 字段列表放在 fields 参数里的全文查询，字段名可带 ^权重
+_MULTI_FIELD_QUERIES = ("multi_match", "combined_fields", "query_string", "simple_query_string")
+# 参数对象中不是字段名的键
+_QUERY_OPTION_KEYS = ("boost", "_name")
+_SORT_SPECIAL = ("_score", "_doc", "_shard_doc", "_geo_distance", "_script")
+# 直接在 text 字段上做的聚合，不要求字段可聚合（doc_values/fielddata）
+_TEXT_AGGS = ("significant_text",)
+_MAX_SUGGESTIONS = 3
+
+class FieldInfo(NamedTuple):
+    types: Tuple[str, ...]
+    searchable: bool
+    aggregatable: bool
+
+class FieldRef(NamedTuple):
+    field: str
+    path: str
+    usage: str  # full_text / term / value / exists / aggregation / text_aggregation / sort / nested
+
+def _add(refs: List[FieldRef], field: Any, path: str, usage: str):
+    if isinstance(field, str) and field:
+        refs.append(FieldRef(field.split("^", 1)[0], path, usage))
+
+def _walk_query(node: Any, path: str, refs: List[FieldRef]):
+    if isinstance(node, list):
+        for i, child in enumerate(node):
+            _walk_query(child, f"{path}[{i}]", refs)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, child in node.items():
+        child_path = f"{path}.{key}"
+        if key in _FULL_TEXT_QUERIES + _TERM_QUERIES + _VALUE_QUERIES and isinstance(child, dict):
+            usage = "full_text" if key in _FULL_TEXT_QUERIES else "term" if key in _TERM_QUERIES else "value"
+            for field in child:
+                if field not in _QUERY_OPTION_KEYS:
+                    _add(refs, field, child_path, usage)
+        elif key in _MULTI_FIELD_QUERIES and isinstance(child, dict):
+            for field in child.get("fields") or []:
+                _add(refs, field, child_path, "full_text")
+            _add(refs, child.get("default_field"), child_path, "full_text")
+        elif key == "exists" and isinstance(child, dict):
+            _add(refs, child.get("field"), child_path, "exists")
+        elif key == "nested" and isinstance(child, dict):
+            _add(refs, child.get("path"), child_path, "nested")
+            _walk_query(child.get("query"), f"{child_path}.query", refs)
+        else:
+            _walk_query(child, child_path, refs)
+
+def _walk_sort(sort: Any, path: str, refs: List[FieldRef]):
+    items = sort if isinstance(sort, list) else [sort]
+    for i, item in enumerate(items):
+        fields = [item] if isinstance(item, str) else list(item) if isinstance(item, dict) else []
+        for field in fields:
+            # 带 unmapped_type 的排序字段允许不存在（ES 按该类型当作空值排序）
+            if isinstance(item, dict) and isinstance(item[field], dict) and "unmapped_type" in item[field]:
+                continue
+            # "field:desc" 是 URL 参数写法
+            field = field.split(":", 1)[0]
+            if field not in _SORT_SPECIAL:
+                _add(refs, field, f"{path}[{i}]", "sort")
+
+def _walk_aggs(aggs: Any, path: str, refs: List[FieldRef]):
+    if not isinstance(aggs, dict):
+        return
+    for name, agg in aggs.items():
+        if not isinstance(agg, dict):
+            continue
+        agg_path = f"{path}.{name}"
+        for agg_type, params in agg.items():
+            type_path = f"{agg_path}.{agg_type}"
+            if agg_type in ("aggs", "aggregations"):
+                _walk_aggs(params, type_path, refs)
+            elif not isinstance(params, dict):
+                continue
+            elif agg_type == "filter":
+                _walk_query(params, type_path, refs)
+            elif agg_type == "filters":
+                _walk_query(params.get("filters"), f"{type_path}.filters", refs)
+            elif agg_type == "nested":
+                _add(refs, params.get("path"), type_path, "nested")
+            elif agg_type == "top_hits":
+                _walk_sort(params.get("sort") or [], f"{type_path}.sort", refs)
+            elif agg_type in _TEXT_AGGS:
+                _add(refs, params.get("field"), type_path, "text_aggregation")
+            else:
+                _add(refs, params.get("field"), type_path, "aggregation")
+                for i, term in enumerate(params.get("terms") or []):
+                    if isinstance(term, dict):
+                        _add(refs, term.get("field"), f"{type_path}.terms[{i}]", "aggregation")
+                for i, source in enumerate(params.get("sources") or []):
+                    for source_name, source_agg in (source.items() if isinstance(source, dict) else []):
+                        for source_params in (source_agg.values() if isinstance(source_agg, dict) else []):
+                            if isinstance(source_params, dict):
+                                _add(refs, source_params.get("field"), f"{type_path}.sources[{i}].{source_name}",
+                                     "aggregation")
+
+def collect_field_refs(dsl: dict) -> List[FieldRef]:
+    """
+    收集 DSL 中引用的字段及其用途：查询（全文/词项/exists/nested）、聚合、排序和 collapse。
+    脚本、_source 过滤以及不带 fields 的 query_string 中的字段无法静态确定，不做收集。
+    """
+    refs = []
+    _walk_query(dsl.get("query"), "query", refs)
+    _walk_query(dsl.get("post_filter"), "post_filter", refs)
+    for key in ("aggs", "aggregations"):
+        _walk_aggs(dsl.get(key), key, refs)
+    if dsl.get("sort"):
+        _walk_sort(dsl["sort"], "sort", refs)
+    if isinstance(dsl.get("collapse"), dict):
+        _add(refs, dsl["collapse"].get("field"), "collapse", "sort")
+    return refs
+
+def suggest_fields(field: str, names: List[str]) -> List[str]:
+    """
+    最接近的字段名：先找路径结尾相同的（漏写了对象前缀，如 level -> log.level），再按编辑相似度补充。
+    """
+    suffix = [n for n in names if n.endswith("." + field)]
+    close = difflib.get_close_matches(field, names, n=_MAX_SUGGESTIONS, cutoff=0.6)
+    return list(dict.fromkeys(suffix + close))[:_MAX_SUGGESTIONS]
+
+def _issue(kind: str, ref: FieldRef, message: str, suggestions: Optional[List[str]] = None) -> dict:
+    issue = {"kind": kind, "field": ref.field, "path": ref.path, "message": message}
+    if suggestions:
+        issue["suggestions"] = suggestions
+    return issue
+
+def _keyword_variant(field: str, fields: Dict[str, FieldInfo]) -> Optional[str]:
+    info = fields.get(f"{field}.keyword")
+    return f"{field}.keyword" if info is not None and info.aggregatable else None
+
+def check_field_refs(refs: List[FieldRef], fields: Dict[str, FieldInfo]) -> Tuple[List[dict], List[dict]]:
+    """
+    按字段目录检查字段引用，返回 (错误, 警告)。
+    错误是ES一定会报错或必然查不到结果的写法：字段不存在、对不可聚合字段聚合/排序（significant_text 除外）、nested 路径不是 nested 字段、
+    对对象字段做值查询；警告是能执行但多半不符合预期的写法：对 keyword 做全文匹配、对 text 做词项查询。
+    带通配符的字段名和 _ 开头的元数据字段不检查。
+    """
+    errors, warnings = [], []
+    names = None
+    for ref in refs:
+        field = ref.field
+        if field.startswith("_") or any(c in field for c in "*?"):
+            continue
+        info = fields.get(field)
+        if info is None:
+            if names is None:
+                names = sorted(fields)
+            suggestions = suggest_fields(field, names)
+            hint = f" (did you mean: {', '.join(suggestions)}?)" if suggestions else ""
+            # exists 常用于 must_not 判断字段缺失，查询仍然有意义，只给警告
+            issues = warnings if ref.usage == "exists" else errors
+            issues.append(_issue("unknown_field", ref, f"Unknown field '{field}' at {ref.path}{hint}", suggestions))
+            continue
+
+        types = set(info.types)
+        if ref.usage == "nested":
+            if "nested" not in types:
+                errors.append(_issue("not_nested", ref, f"Field '{field}' at {ref.path} is not a nested field"))
+        elif types and types <= set(OBJECT_TYPES):
+            if ref.usage != "exists":
+                errors.append(_issue("object_field", ref,
+                                     f"Field '{field}' at {ref.path} is an object, query one of its sub-fields"))
+        elif ref.usage in ("aggregation", "sort") and not info.aggregatable:
+            keyword = _keyword_variant(field, fields)
+            hint = f", use '{keyword}'" if keyword else ""
+            errors.append(_issue("not_aggregatable", ref,
+                                 f"Field '{field}' ({'/'.join(info.types)}) at {ref.path} is not aggregatable{hint}",
+                                 [keyword] if keyword else None))
+        elif ref.usage == "full_text" and types <= set(KEYWORD_TYPES):
+            warnings.append(_issue("keyword_full_text", ref,
+                                   f"Full-text query on keyword field '{field}' at {ref.path} only matches the whole value"))
+        elif ref.usage == "term" and types <= set(TEXT_TYPES):
+            keyword = _keyword_variant(field, fields)
+            hint = f", use '{keyword}' for exact values" if keyword else ""
+            warnings.append(_issue("term_on_text", ref,
+                                   f"Term-level query on analyzed text field '{field}' at {ref.path}{hint}",
+                                   [keyword] if keyword else None))
+    return errors, warnings
+
+def parse_field_caps(response: dict) -> Dict[str, FieldInfo]:
+    """
+    把 _field_caps 响应转换为 {字段名: FieldInfo}；多个索引中类型不一致时保留全部类型，
+    searchable/aggregatable 只要在部分索引中成立即为 True。
+    """
+    fields = {}
+    for name, caps in (response.get("fields") or {}).items():
+        if name.startswith("_"):
+            continue
+        caps = {t: c for t, c in caps.items() if t != "unmapped"}
+        if not caps:
+            continue
+        fields[name] = FieldInfo(
+            types=tuple(sorted(caps)),
+            searchable=any(c.get("searchable", True) for c in caps.values()),
+            aggregatable=any(c.get("aggregatable", False) for c in caps.values())
+        )
+    return fields
+
+def runtime_fields(dsl: dict) -> Dict[str, FieldInfo]:
+    """
+    DSL 中 runtime_mappings 定义的运行时字段，可查询也可聚合。
+    """
+    mappings = dsl.get("runtime_mappings")
+    if not isinstance(mappings, dict):
+        return {}
+    return {
+        name: FieldInfo((spec.get("type", "keyword"),) if isinstance(spec, dict) else ("keyword",), True, True)
+        for name, spec in mappings.items()
+    }
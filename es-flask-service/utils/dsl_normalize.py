@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : dsl_normalize.py
+@Time    : 2026/10/18 19:20
+@Author  : xxlaila
+@Software: dify
+"""
+import json
+import re
+from typing import Any, Optional
+
+# 未取整的相对时间：now、now-15m、now-1d+2h；已带 /单位 或 || 锚点的不处理
+_RELATIVE_DATE = re.compile(r"now(?:[+\-]\d+[yMwdhHms])*")
+# 取整时开区间边界先改为闭区间：ES 对 gte 向下取整、对 lte 向上取整，而对 gt 向上、lt 向下取整，
+# 直接给 gt/lt 取整会丢掉区间两端最多一个单位内的文档（如 lt now/m 丢掉最近不到一分钟的数据）
+_CLOSED_BOUNDS = {"gt": "gte", "lt": "lte", "gte": "gte", "lte": "lte", "from": "from", "to": "to"}
+# from/to 的开闭由 include_lower/include_upper 决定，开区间时不取整
+_FROM_TO_INCLUSIVE = {"from": "include_lower", "to": "include_upper"}
+# bool 查询中与顺序无关的子句列表
+_BOOL_CLAUSES = ("filter", "must", "must_not", "should")
+
+def _clause_key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def _round_range(params: dict, unit: str) -> dict:
+    rounded = dict(params)
+    for bound, closed in _CLOSED_BOUNDS.items():
+        date = params.get(bound)
+        if not isinstance(date, str) or not _RELATIVE_DATE.fullmatch(date):
+            continue
+        if params.get(_FROM_TO_INCLUSIVE.get(bound)) is False or (closed != bound and closed in params):
+            continue
+        del rounded[bound]
+        rounded[closed] = f"{date}/{unit}"
+    return dict(sorted(rounded.items()))
+
+def _normalize(value: Any, unit: Optional[str]) -> Any:
+    """
+    递归复制并规范化：键排序；range 边界上未取整的 now 相对时间追加 /unit，gt/lt 同时改为 gte/lte
+    （取整后下界向下、上界向上移动，区间总是包含原区间）；
+    子句先规范化再排序，写法不同但等价的子句得到相同的顺序。
+    """
+    if isinstance(value, list):
+        return [_normalize(v, unit) for v in value]
+    if not isinstance(value, dict):
+        return value
+    result = {k: _normalize(value[k], unit) for k in sorted(value)}
+    if unit and isinstance(result.get("range"), dict):
+        for field, params in result["range"].items():
+            if isinstance(params, dict):
+                result["range"][field] = _round_range(params, unit)
+    if isinstance(result.get("bool"), dict):
+        for clause in _BOOL_CLAUSES:
+            clauses = result["bool"].get(clause)
+            if isinstance(clauses, list):
+                result["bool"][clause] = sorted(clauses, key=_clause_key)
+    return result
+
+def normalize_dsl(dsl: dict, date_rounding: Optional[str] = "m") -> dict:
+    """
+    返回规范化后的 DSL（不修改入参）：
+    1. range 中未取整的 now 相对时间按 date_rounding 取整，同一分钟内的查询得到相同的 DSL；
+    2. size=0 的聚合查询显式开启 request_cache；
+    3. 所有对象的键递归排序，bool 的 filter/must/must_not/should 子句按内容排序，
+       保证发给ES的请求体字节一致（ES 分片请求缓存以请求体为键）。
+    """
+    dsl = _normalize(dsl, date_rounding)
+    if dsl.get("size") == 0 and (dsl.get("aggs") or dsl.get("aggregations")) and "request_cache" not in dsl:
+        dsl = dict(sorted({**dsl, "request_cache": True}.items()))
+    return dsl
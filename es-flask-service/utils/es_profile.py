@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : es_profile.py
+@Time    : 2026/10/18 21:50
+@Author  : xxlaila
+@Software: dify
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_TOP_COMPONENTS = 5
+_MAX_DESCRIPTION_LENGTH = 200
+
+def _ms(nanos: float) -> float:
+    return round(nanos / 1e6, 3)
+
+def _self_times(nodes: Optional[List[dict]]) -> Iterator[Tuple[str, str, float]]:
+    """
+    展开 profile 树，返回每个节点的 (类型, 描述, 自身耗时)；time_in_nanos 包含子节点，自身耗时 = 总耗时 - 子节点耗时。
+    """
+    for node in nodes or []:
+        children = node.get("children") or []
+        own = node.get("time_in_nanos", 0) - sum(c.get("time_in_nanos", 0) for c in children)
+        yield node.get("type", ""), (node.get("description") or "")[:_MAX_DESCRIPTION_LENGTH], max(own, 0)
+        yield from _self_times(children)
+
+def _top(totals: Dict[Tuple[str, str], float], total_nanos: float) -> List[dict]:
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:_TOP_COMPONENTS]
+    return [
+        {
+            "type": kind,
+            "description": description,
+            "time_ms": _ms(nanos),
+            "share": round(nanos / total_nanos, 3) if total_nanos else None
+        }
+        for (kind, description), nanos in ranked
+    ]
+
+def summarize_profile(profile: dict) -> dict:
+    """
+    把 "profile": true 的分片级结果汇总成一份概览：查询、rewrite、collector、聚合各自的总耗时，占比最大的部分，
+    以及按自身耗时排序的前几个查询/聚合组件（跨分片累加），原始 profile 往往有几 MB，不适合直接保存。
+    """
+    totals = {"query": 0.0, "rewrite": 0.0, "collector": 0.0, "aggregations": 0.0}
+    queries: Dict[Tuple[str, str], float] = {}
+    aggregations: Dict[Tuple[str, str], float] = {}
+    collectors: Dict[Tuple[str, str], float] = {}
+    slowest = None
+    shards = profile.get("shards") or []
+    for shard in shards:
+        shard_nanos = 0.0
+        for search in shard.get("searches") or []:
+            query_nanos = sum(q.get("time_in_nanos", 0) for q in search.get("query") or [])
+            collector_nanos = sum(c.get("time_in_nanos", 0) for c in search.get("collector") or [])
+            totals["query"] += query_nanos
+            totals["rewrite"] += search.get("rewrite_time", 0)
+            totals["collector"] += collector_nanos
+            shard_nanos += query_nanos + search.get("rewrite_time", 0) + collector_nanos
+            for kind, description, nanos in _self_times(search.get("query")):
+                queries[(kind, description)] = queries.get((kind, description), 0) + nanos
+            for collector in search.get("collector") or []:
+                key = (collector.get("name", ""), collector.get("reason", ""))
+                collectors[key] = collectors.get(key, 0) + collector.get("time_in_nanos", 0)
+        agg_nanos = sum(a.get("time_in_nanos", 0) for a in shard.get("aggregations") or [])
+        totals["aggregations"] += agg_nanos
+        shard_nanos += agg_nanos
+        for kind, description, nanos in _self_times(shard.get("aggregations")):
+            aggregations[(kind, description)] = aggregations.get((kind, description), 0) + nanos
+        if slowest is None or shard_nanos > slowest[1]:
+            slowest = (shard.get("id"), shard_nanos)
+
+    overall = sum(totals.values())
+    return {
+        "shards": len(shards),
+        "breakdown_ms": {name: _ms(nanos) for name, nanos in totals.items()},
+        "dominant": max(totals, key=totals.get) if overall else None,
+        "slowest_shard": {"id": slowest[0], "time_ms": _ms(slowest[1])} if slowest else None,
+        "top_queries": _top(queries, totals["query"]),
+        "collectors": [
+            {"name": name, "reason": reason, "time_ms": _ms(nanos)}
+            for (name, reason), nanos in sorted(collectors.items(), key=lambda item: item[1], reverse=True)
+        ][:_TOP_COMPONENTS],
+        "top_aggregations": _top(aggregations, totals["aggregations"])
+    }
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : index_pruning.py
+@Time    : 2026/10/18 16:20
+@Author  : xxlaila
+@Software: dify
+"""
+import calendar
+import fnmatch
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Tuple
+
+# 单个索引名拼进 URL 后的总长度上限，超过时放弃改写（ES 默认 http.max_initial_line_length 为 4kb）
+MAX_INDEX_LIST_LENGTH = 3000
+
+_DAILY_SUFFIX = re.compile(r"(\d{4})[.\-](\d{2})[.\-](\d{2})$")
+_MONTHLY_SUFFIX = re.compile(r"(\d{4})[.\-](\d{2})$")
+_MATH_TOKEN = re.compile(r"([+\-])(\d*)([yMwdhHms])|/([yMwdhHms])")
+
+TimeRange = Tuple[Optional[datetime], Optional[datetime]]
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+def _round_down(value: datetime, unit: str) -> datetime:
+    if unit == "y":
+        return value.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == "M":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == "w":
+        day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day - timedelta(days=day.weekday())
+    if unit == "d":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit in ("h", "H"):
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == "m":
+        return value.replace(second=0, microsecond=0)
+    return value.replace(microsecond=0)
+
+def _shift(value: datetime, amount: int, unit: str) -> datetime:
+    if unit == "y":
+        return _add_months(value, 12 * amount)
+    if unit == "M":
+        return _add_months(value, amount)
+    seconds = {"w": 604800, "d": 86400, "h": 3600, "H": 3600, "m": 60, "s": 1}[unit]
+    return value + timedelta(seconds=seconds * amount)
+
+def _parse_absolute(text: str, tz: timezone) -> datetime:
+    if text.isdigit():
+        return datetime.fromtimestamp(int(text) / 1000.0, timezone.utc)
+    value = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=tz)
+
+def _parse_time_zone(time_zone: Optional[str]) -> timezone:
+    if not time_zone or time_zone in ("UTC", "Z"):
+        return timezone.utc
+    match = re.fullmatch(r"([+\-])(\d{2}):?(\d{2})", time_zone)
+    if not match:
+        raise ValueError(f"Unsupported time_zone {time_zone}")
+    offset = timedelta(hours=int(match.group(2)), minutes=int(match.group(3)))
+    return timezone(-offset if match.group(1) == "-" else offset)
+
+def parse_date_math(value: Any, now: datetime, upper: bool, time_zone: Optional[str] = None) -> datetime:
+    """
+    解析 ES 的日期/日期运算表达式（now-15m、now-1d/d、2026-10-18||+1d、epoch 毫秒、ISO8601）。
+    取整时下界向下取整、上界取到该单位的末尾，保证得到的区间不小于 ES 实际使用的区间。
+    """
+    tz = _parse_time_zone(time_zone)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value / 1000.0, timezone.utc)
+    if not isinstance(value, str):
+        raise ValueError(f"Unsupported date value {value!r}")
+
+    if value.startswith("now"):
+        anchor, math = now, value[3:]
+    elif "||" in value:
+        text, math = value.split("||", 1)
+        anchor = _parse_absolute(text, tz)
+    else:
+        return _parse_absolute(value, tz)
+
+    position = 0
+    for match in _MATH_TOKEN.finditer(math):
+        if match.start() != position:
+            raise ValueError(f"Unsupported date math {value!r}")
+        position = match.end()
+        if match.group(4):
+            unit = match.group(4)
+            anchor = _round_down(anchor.astimezone(tz), unit)
+            if upper:
+                anchor = _shift(anchor, 1, unit) - timedelta(milliseconds=1)
+        else:
+            amount = int(match.group(2) or 1) * (-1 if match.group(1) == "-" else 1)
+            anchor = _shift(anchor, amount, match.group(3))
+    if position != len(math):
+        raise ValueError(f"Unsupported date math {value!r}")
+    return anchor
+
+def _range_clauses(query: Any, field: str):
+    """
+    只遍历与整个查询是“与”关系的子句（bool.filter / bool.must），should/must_not 中的时间条件不能用于裁剪。
+    """
+    if not isinstance(query, dict):
+        return
+    if isinstance(query.get("range"), dict) and field in query["range"]:
+        yield query["range"][field]
+    bool_query = query.get("bool")
+    if isinstance(bool_query, dict):
+        for key in ("filter", "must"):
+            clauses = bool_query.get(key)
+            for clause in clauses if isinstance(clauses, list) else [clauses]:
+                yield from _range_clauses(clause, field)
+
+def extract_time_range(dsl: dict, field: str, now: Optional[datetime] = None) -> Optional[TimeRange]:
+    """
+    从 DSL 顶层查询中取出 field 上的时间范围 (start, end)，多个范围取交集；没有可用的范围时返回 None。
+    """
+    now = now or datetime.now(timezone.utc)
+    start, end = None, None
+    for condition in _range_clauses(dsl.get("query"), field):
+        if not isinstance(condition, dict):
+            continue
+        time_zone = condition.get("time_zone")
+        if condition.get("format") and not str(condition["format"]).startswith(("strict_date", "date_optional", "epoch_millis")):
+            # 自定义格式无法可靠解析，放弃裁剪
+            return None
+        for key in ("gte", "gt", "from"):
+            if condition.get(key) is not None:
+                value = parse_date_math(condition[key], now, upper=False, time_zone=time_zone)
+                start = value if start is None else max(start, value)
+        for key in ("lte", "lt", "to"):
+            if condition.get(key) is not None:
+                value = parse_date_math(condition[key], now, upper=True, time_zone=time_zone)
+                end = value if end is None else min(end, value)
+    if start is None and end is None:
+        return None
+    return start, end
+
+def index_time_span(index: str) -> Optional[TimeRange]:
+    """
+    按索引名末尾的日期（YYYY.MM.DD / YYYY-MM-DD 或 YYYY.MM）推断索引覆盖的时间段（UTC）。
+    """
+    match = _DAILY_SUFFIX.search(index)
+    try:
+        if match:
+            day = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)), tzinfo=timezone.utc)
+            return day, day + timedelta(days=1)
+        match = _MONTHLY_SUFFIX.search(index)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            return month, _add_months(month, 1)
+    except ValueError:
+        return None
+    return None
+
+def split_index_expression(index: Any) -> List[str]:
+    if isinstance(index, (list, tuple)):
+        return [str(i).strip() for i in index if str(i).strip()]
+    return [part.strip() for part in str(index or "").split(",") if part.strip()]
+
+def prune_indices(patterns: List[str], catalog: List[str], time_range: TimeRange,
+                  slack: timedelta, now: Optional[datetime] = None) -> Optional[List[str]]:
+    """
+    将通配符展开为具体索引，并去掉日期与时间范围不相交的索引。
+    时间范围的上界（没有上界时为当前时间）已超出该通配符下最新日期索引的时间段时，目录里可能还没有刚滚动出的新索引，
+    这个通配符原样保留不展开。
+    无法安全改写（排除语法、跨集群、别名/数据流等不在索引列表中的目标）或没有可裁剪的索引时返回 None。
+    """
+    if any(p.startswith("-") or ":" in p for p in patterns):
+        return None
+    start, end = time_range
+    upper = end or now or datetime.now(timezone.utc)
+    start = start - slack if start else None
+    end = end + slack if end else None
+
+    selected, pruned = [], 0
+    for pattern in patterns:
+        if not any(c in pattern for c in "*?"):
+            selected.append(pattern)
+            continue
+        matches = [name for name in catalog
+                   if fnmatch.fnmatchcase(name, pattern) and (pattern.startswith(".") or not name.startswith("."))]
+        if not matches:
+            return None
+        spans = [index_time_span(name) for name in matches]
+        newest = max((span[1] for span in spans if span is not None), default=None)
+        if newest is not None and upper >= newest:
+            selected.append(pattern)
+            continue
+        for name, span in zip(matches, spans):
+            if span is None or ((end is None or span[0] <= end) and (start is None or span[1] > start)):
+                selected.append(name)
+            else:
+                pruned += 1
+
+    selected = list(dict.fromkeys(selected))
+    if not pruned or not selected:
+        return None
+    if len(",".join(selected)) > MAX_INDEX_LIST_LENGTH:
+        return None
+    return selected
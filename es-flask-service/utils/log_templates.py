@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : log_templates.py
+@Time    : 2026/10/18 17:40
+@Author  : xxlaila
+@Software: dify
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+WILDCARD = "<*>"
+
+# 先把明显的变量替换成通配符，再分词；顺序很重要（UUID/IP 要在纯数字之前匹配）
+_MASKS = [
+    re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),
+    re.compile(r"\b0[xX][0-9a-fA-F]+\b"),
+    re.compile(r"\b[0-9a-fA-F]{16,}\b"),
+    re.compile(r"(?<![A-Za-z_])[-+]?\d+(?:\.\d+)?"),
+]
+
+def mask_variables(message: str) -> str:
+    for pattern in _MASKS:
+        message = pattern.sub(WILDCARD, message)
+    return message
+
+def _has_digit(token: str) -> bool:
+    return any(c.isdigit() for c in token)
+
+class LogCluster:
+    __slots__ = ("id", "tokens", "count", "first_timestamp", "last_timestamp", "samples")
+
+    def __init__(self, cluster_id: int, tokens: List[str]):
+        self.id = cluster_id
+        self.tokens = tokens
+        self.count = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.samples = []
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+def _earlier(a: Any, b: Any) -> bool:
+    try:
+        return a < b
+    except TypeError:
+        return str(a) < str(b)
+
+class TemplateMiner:
+    """
+    Drain 算法的增量实现：按 token 数和前 depth-2 个 token 构建固定深度的前缀树，
+    叶子节点中按相似度匹配已有模板，相似度低于阈值时新建模板；匹配上时把不同位置替换为 <*>。
+    模板数量有上限，超过后无法归类的日志只计数，内存占用与扫描的日志条数无关。
+    """
+
+    def __init__(self, depth: int = 4, sim_threshold: float = 0.4, max_children: int = 100,
+                 max_clusters: int = 1000, max_tokens: int = 80, sample_size: int = 3):
+        self.depth = max(depth, 3)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.max_tokens = max_tokens
+        self.sample_size = sample_size
+        self.root: Dict[Any, Any] = {}
+        self.clusters: List[LogCluster] = []
+        self.unclustered = 0
+
+    def add(self, message: str, timestamp: Any = None, sample: Optional[dict] = None) -> Optional[LogCluster]:
+        tokens = mask_variables(message).split()[:self.max_tokens]
+        if not tokens:
+            tokens = [""]
+        leaf = self._leaf(tokens)
+        cluster = self._best_match(leaf, tokens)
+        if cluster is None:
+            if len(self.clusters) >= self.max_clusters:
+                self.unclustered += 1
+                return None
+            cluster = LogCluster(len(self.clusters), tokens)
+            self.clusters.append(cluster)
+            leaf.append(cluster)
+        elif cluster.tokens != tokens:
+            cluster.tokens = [t if t == other else WILDCARD for t, other in zip(cluster.tokens, tokens)]
+
+        cluster.count += 1
+        if timestamp is not None:
+            if cluster.first_timestamp is None or _earlier(timestamp, cluster.first_timestamp):
+                cluster.first_timestamp = timestamp
+            if cluster.last_timestamp is None or _earlier(cluster.last_timestamp, timestamp):
+                cluster.last_timestamp = timestamp
+        if sample is not None and len(cluster.samples) < self.sample_size:
+            cluster.samples.append(sample)
+        return cluster
+
+    def _leaf(self, tokens: List[str]) -> list:
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            # 含数字的 token 多半是变量，统一走通配分支；子节点过多时也归入通配分支
+            key = WILDCARD if _has_digit(token) else token
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    def _best_match(self, leaf: List[LogCluster], tokens: List[str]) -> Optional[LogCluster]:
+        best, best_sim, best_params = None, -1.0, -1
+        for cluster in leaf:
+            same = sum(1 for t, other in zip(cluster.tokens, tokens) if t == other and t != WILDCARD)
+            params = sum(1 for t in cluster.tokens if t == WILDCARD)
+            sim = same / len(tokens)
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best, best_sim, best_params = cluster, sim, params
+        if best is not None and best_sim >= self.sim_threshold:
+            return best
+        return None
+
+    def results(self, limit: Optional[int] = None) -> List[dict]:
+        ordered = sorted(self.clusters, key=lambda c: -c.count)
+        return [{
+            "template": c.template,
+            "count": c.count,
+            "first_timestamp": c.first_timestamp,
+            "last_timestamp": c.last_timestamp,
+            "samples": c.samples
+        } for c in (ordered[:limit] if limit else ordered)]
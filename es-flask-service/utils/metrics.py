@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : metrics.py
+@Time    : 2026/10/18 15:00
+@Author  : xxlaila
+@Software: dify
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in values)
+        return lines
+
+class Gauge:
+    """
+    当前值型指标（队列深度、在途请求数等），由业务代码在状态变化时 set。
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in values)
+        return lines
+
+class Histogram:
+    """
+    固定分桶的直方图，每组标签只保存各桶计数、总和与次数，内存占用与请求量无关。
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket_counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(e[0]), e[1], e[2])) for labels, e in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Prometheus 文本格式（text/plain; version=0.0.4）。
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+request_seconds = registry.register(Histogram(
+    "es_service_request_seconds", "Total time spent handling an API request, including streamed bodies",
+    ("tool", "cluster")))
+upstream_seconds = registry.register(Histogram(
+    "es_service_upstream_seconds", "Wall time of each HTTP request to Elasticsearch, including retries",
+    ("tool", "cluster")))
+es_took_seconds = registry.register(Histogram(
+    "es_service_es_took_seconds", "The took value reported by Elasticsearch in search responses",
+    ("tool", "cluster")))
+serialization_seconds = registry.register(Histogram(
+    "es_service_serialization_seconds", "Time spent serializing tool results to JSON",
+    ("tool", "cluster")))
+response_bytes = registry.register(Histogram(
+    "es_service_response_bytes", "Size of API response bodies in bytes",
+    ("tool", "cluster"), buckets=BYTES_BUCKETS))
+errors_total = registry.register(Counter(
+    "es_service_errors_total", "Failed API requests and failed upstream requests, by kind",
+    ("tool", "cluster", "kind")))
+cache_hits_total = registry.register(Counter(
+    "es_service_cache_hits_total", "Tool results served without calling Elasticsearch, by cache",
+    ("tool", "cluster", "source")))
+query_guard_total = registry.register(Counter(
+    "es_service_query_guard_total", "Queries flagged by the pre-flight cost guard, by action taken",
+    ("tool", "cluster", "action")))
+coalesced_total = registry.register(Counter(
+    "es_service_coalesced_total", "Requests that waited on an identical in-flight Elasticsearch request",
+    ("tool", "cluster")))
+field_check_total = registry.register(Counter(
+    "es_service_field_check_total", "Queries with field problems found by local DSL field validation, by result",
+    ("tool", "cluster", "result")))
+admission_wait_seconds = registry.register(Histogram(
+    "es_service_admission_wait_seconds", "Time requests spent queued for a per-cluster concurrency slot",
+    ("tool", "cluster")))
+admission_rejected_total = registry.register(Counter(
+    "es_service_admission_rejected_total", "Requests rejected by admission control, by reason (queue_full, timeout)",
+    ("tool", "cluster", "reason")))
+admission_queue_depth = registry.register(Gauge(
+    "es_service_admission_queue_depth", "Requests currently waiting for a concurrency slot", ("cluster",)))
+admission_in_flight = registry.register(Gauge(
+    "es_service_admission_in_flight", "Requests currently holding a concurrency slot", ("cluster",)))
+
+# 当前请求的工具名，供传输层给上游耗时打标签；后台任务（如集群采集）没有工具名
+_current_tool: ContextVar[str] = ContextVar("current_tool", default="background")
+
+def set_current_tool(tool: str):
+    return _current_tool.set(tool)
+
+def current_tool() -> str:
+    return _current_tool.get()
+
+def record_upstream(cluster: str, seconds: float, result=None, error: Optional[Exception] = None):
+    """
+    由 ES 传输层调用：记录一次上游请求的耗时，以及响应中的 took（搜索类请求才有）。
+    """
+    tool = _current_tool.get()
+    upstream_seconds.observe(seconds, tool, cluster)
+    if error is not None:
+        errors_total.inc(tool, cluster, f"upstream_{type(error).__name__}")
+    elif isinstance(result, dict) and isinstance(result.get("took"), (int, float)):
+        es_took_seconds.observe(result["took"] / 1000.0, tool, cluster)
+
+def record_coalesced(cluster: str):
+    coalesced_total.inc(_current_tool.get(), cluster)
+
+def record_admission(cluster: str, waited: float = 0.0, rejected: Optional[str] = None):
+    """
+    由 ES 传输层调用：记录拿到并发名额前的排队时长，或被拒绝的原因。
+    """
+    tool = _current_tool.get()
+    if rejected is not None:
+        admission_rejected_total.inc(tool, cluster, rejected)
+    else:
+        admission_wait_seconds.observe(waited, tool, cluster)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : projection.py
+@Time    : 2026/10/18 11:05
+@Author  : xxlaila
+@Software: dify
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+TRUNCATION_MARKER = "...[truncated {} chars]"
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+@dataclass
+class Projection:
+    """
+    query 工具的响应裁剪选项：
+    includes/excludes 下推为 _source 过滤，filter_path 裁剪响应外层结构（由ES完成）；
+    max_field_length / max_bytes 在服务端对结果再做截断。
+    """
+    includes: Optional[List[str]] = None
+    excludes: Optional[List[str]] = None
+    filter_path: Optional[str] = None
+    max_field_length: int = 0
+    max_bytes: int = 0
+
+    @classmethod
+    def from_parameters(cls, parameters: Dict[str, Any], max_field_length: int = 0, max_bytes: int = 0) -> "Projection":
+        filter_path = parameters.get("filter_path")
+        if isinstance(filter_path, list):
+            filter_path = ",".join(filter_path)
+        return cls(
+            includes=parameters.get("includes"),
+            excludes=parameters.get("excludes"),
+            filter_path=filter_path,
+            max_field_length=int(parameters.get("max_field_length", max_field_length) or 0),
+            max_bytes=int(parameters.get("max_bytes", max_bytes) or 0)
+        )
+
+    def apply_to_dsl(self, dsl: dict) -> dict:
+        """
+        返回下推了 _source 过滤和 filter_path 的新 DSL（不修改入参）。
+        """
+        dsl = dict(dsl)
+        if self.includes or self.excludes:
+            source = {}
+            if self.includes:
+                source["includes"] = self.includes
+            if self.excludes:
+                source["excludes"] = self.excludes
+            dsl["_source"] = source
+        if self.filter_path:
+            dsl["filter_path"] = self.filter_path
+        return dsl
+
+    def trim(self, response: dict) -> dict:
+        """
+        就地截断超长字段并按字节预算丢弃尾部命中，被裁剪时在响应中加入 _truncated 标记。
+        """
+        if not isinstance(response, dict):
+            return response
+        hits = response.get("hits", {}).get("hits")
+        if not isinstance(hits, list):
+            return response
+
+        truncated_fields = sum(self.trim_hit(hit) for hit in hits)
+
+        dropped = 0
+        if self.max_bytes > 0 and _json_size(response) > self.max_bytes:
+            budget = self.max_bytes - _json_size({k: v for k, v in response.items() if k != "hits"}) - 256
+            kept, used = 0, 0
+            for hit in hits:
+                used += _json_size(hit) + 1
+                if used > budget:
+                    break
+                kept += 1
+            dropped = len(hits) - kept
+            del hits[kept:]
+
+        if truncated_fields or dropped:
+            response["_truncated"] = {
+                "fields_truncated": truncated_fields,
+                "hits_returned": len(hits),
+                "hits_dropped": dropped,
+                "max_field_length": self.max_field_length,
+                "max_bytes": self.max_bytes
+            }
+        return response
+
+    def trim_hit(self, hit: dict) -> int:
+        """
+        截断单条命中中的超长字段，返回被截断的字段数。
+        """
+        if self.max_field_length <= 0:
+            return 0
+        count = 0
+        for section in ("_source", "fields", "highlight"):
+            if section in hit:
+                hit[section], n = self._truncate(hit[section])
+                count += n
+        return count
+
+    def _truncate(self, value: Any):
+        limit = self.max_field_length
+        if isinstance(value, str):
+            if len(value) > limit:
+                return value[:limit] + TRUNCATION_MARKER.format(len(value) - limit), 1
+            return value, 0
+        if isinstance(value, dict):
+            count = 0
+            for k, v in value.items():
+                value[k], n = self._truncate(v)
+                count += n
+            return value, count
+        if isinstance(value, list):
+            count = 0
+            for i, v in enumerate(value):
+                value[i], n = self._truncate(v)
+                count += n
+            return value, count
+        return value, 0
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : query_cost.py
+@Time    : 2026/10/18 19:50
+@Author  : xxlaila
+@Software: dify
+"""
+import copy
+import re
+from typing import Any, List, Tuple
+
+_QUERY_STRING_TOKEN = re.compile(r"[\s:()]+")
+# 所有子聚合都按 aggs/aggregations 嵌套；这些聚合的 size 决定协调节点要归并的桶数
+_SIZED_AGGS = ("terms", "significant_terms", "rare_terms", "multi_terms", "composite")
+
+def _flag(flags: List[dict], kind: str, path: str, **detail):
+    flags.append({"kind": kind, "path": path, **detail})
+
+def _wildcard_value(params: Any, *keys: str) -> Any:
+    if isinstance(params, dict):
+        return next((params[k] for k in keys if k in params), None)
+    return params
+
+def _inspect_query(node: Any, path: str, flags: List[dict]):
+    if isinstance(node, list):
+        for i, child in enumerate(node):
+            _inspect_query(child, f"{path}[{i}]", flags)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, child in node.items():
+        child_path = f"{path}.{key}"
+        if key == "wildcard" and isinstance(child, dict):
+            for field, params in child.items():
+                value = _wildcard_value(params, "value", "wildcard")
+                if isinstance(value, str) and value[:1] in ("*", "?"):
+                    _flag(flags, "leading_wildcard", f"{child_path}.{field}", value=value)
+        elif key == "regexp" and isinstance(child, dict):
+            for field, params in child.items():
+                value = _wildcard_value(params, "value")
+                if isinstance(value, str) and value.startswith("."):
+                    _flag(flags, "leading_wildcard", f"{child_path}.{field}", value=value)
+        elif key in ("query_string", "simple_query_string") and isinstance(child, dict):
+            text = child.get("query")
+            if isinstance(text, str) and child.get("allow_leading_wildcard", True):
+                tokens = [t for t in _QUERY_STRING_TOKEN.split(text) if t[:1] in ("*", "?")]
+                if tokens:
+                    _flag(flags, "leading_wildcard", child_path, value=tokens[0])
+        elif key in ("script", "script_score"):
+            _flag(flags, "script", child_path)
+            continue
+        _inspect_query(child, child_path, flags)
+
+def _inspect_aggs(aggs: Any, path: str, flags: List[dict], max_terms_size: int, clamp: bool):
+    if not isinstance(aggs, dict):
+        return
+    for name, agg in aggs.items():
+        if not isinstance(agg, dict):
+            continue
+        agg_path = f"{path}.{name}"
+        for agg_type, params in agg.items():
+            if agg_type in ("aggs", "aggregations"):
+                _inspect_aggs(params, f"{agg_path}.{agg_type}", flags, max_terms_size, clamp)
+                continue
+            if not isinstance(params, dict):
+                continue
+            if "script" in params or agg_type in ("scripted_metric", "bucket_script", "bucket_selector"):
+                _flag(flags, "script", f"{agg_path}.{agg_type}")
+            size = params.get("size")
+            if agg_type in _SIZED_AGGS and isinstance(size, int) and size > max_terms_size:
+                _flag(flags, "large_terms_size", f"{agg_path}.{agg_type}.size", value=size, limit=max_terms_size)
+                if clamp:
+                    params["size"] = max_terms_size
+
+def inspect_dsl(dsl: dict, max_size: int, max_terms_size: int, clamp: bool = False) -> Tuple[dict, List[dict]]:
+    """
+    静态检查 DSL 中的高代价写法：前导通配符（wildcard/regexp/query_string）、脚本、超过上限的 size 和 terms 类聚合的 size。
+    返回 (DSL, 问题列表)；clamp=True 时返回把 size 收紧到上限后的副本，否则原样返回入参。
+    """
+    flags = []
+    if clamp:
+        dsl = copy.deepcopy(dsl)
+    size = dsl.get("size")
+    if isinstance(size, int) and size > max_size:
+        _flag(flags, "large_size", "size", value=size, limit=max_size)
+        if clamp:
+            dsl["size"] = max_size
+    _inspect_query(dsl.get("query"), "query", flags)
+    for key in ("aggs", "aggregations"):
+        _inspect_aggs(dsl.get(key), key, flags, max_terms_size, clamp)
+    for key in ("script_fields", "runtime_mappings"):
+        if dsl.get(key):
+            _flag(flags, "script", key)
+    return dsl, flags
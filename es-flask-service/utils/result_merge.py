@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : result_merge.py
+@Time    : 2026/10/18 15:40
+@Author  : xxlaila
+@Software: dify
+"""
+import json
+import math
+from functools import cmp_to_key
+from typing import Any, Dict, List, Optional, Tuple
+
+# (集群名, 含聚合结果的对象, 该对象的 doc_count)：顶层为整个响应的 aggregations，子聚合为所在的桶
+AggPart = Tuple[str, dict, Optional[float]]
+
+_SINGLE_BUCKET = {"filter", "global", "missing", "nested", "reverse_nested", "sampler", "diversified_sampler",
+                  "children", "parent"}
+_MULTI_BUCKET = {"terms", "multi_terms", "significant_terms", "rare_terms", "histogram", "date_histogram",
+                 "range", "date_range", "ip_range", "filters", "adjacency_matrix", "geohash_grid", "geotile_grid"}
+# 按 key 升序返回桶的聚合；range 类保持请求中的区间顺序
+_KEY_ORDERED = {"histogram", "date_histogram"}
+_RANGE_ORDERED = {"range", "date_range", "ip_range", "filters", "adjacency_matrix"}
+# cardinality 不能相加：同一个值出现在多个集群时会被重复计数
+_SUMMABLE = {"sum", "value_count"}
+
+def parse_sort(sort: Any) -> List[Tuple[str, bool]]:
+    """
+    将 DSL 中的 sort 解析为 [(字段, 是否降序)]，未指定时按 _score 降序。
+    支持 "field"、"field:desc"、{"field": "desc"}、{"field": {"order": "desc"}} 及其列表。
+    """
+    if not sort:
+        return [("_score", True)]
+    spec = []
+    for item in sort if isinstance(sort, list) else [sort]:
+        if isinstance(item, str):
+            field, _, order = item.partition(":")
+            spec.append((field, order == "desc" if order else field == "_score"))
+        elif isinstance(item, dict):
+            for field, options in item.items():
+                order = options.get("order") if isinstance(options, dict) else options
+                spec.append((field, order == "desc" if order else field == "_score"))
+    return spec or [("_score", True)]
+
+def _compare_values(a: Any, b: Any) -> int:
+    # 缺失值总是排在最后，与 ES 默认的 missing: _last 一致
+    if a is None or b is None:
+        return (a is None) - (b is None)
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        return (str(a) > str(b)) - (str(a) < str(b))
+
+def _hit_sort_values(hit: dict, spec: List[Tuple[str, bool]]) -> list:
+    if isinstance(hit.get("sort"), list):
+        return hit["sort"]
+    return [hit.get("_score") if field == "_score" else None for field, _ in spec]
+
+def merge_hits(parts: List[Tuple[str, dict]], sort: Any, from_: int, size: int) -> dict:
+    """
+    合并各集群的 hits：每条命中标注 _cluster，按排序键重新排序后取 [from, from+size)。
+    """
+    spec = parse_sort(sort)
+    total, relation, max_score, all_hits = 0, "eq", None, []
+    total_as_int = False
+    for cluster, response in parts:
+        hits = response.get("hits") or {}
+        hits_total = hits.get("total")
+        if isinstance(hits_total, dict):
+            total += hits_total.get("value", 0)
+            if hits_total.get("relation") == "gte":
+                relation = "gte"
+        elif isinstance(hits_total, int):
+            total += hits_total
+            total_as_int = True
+        score = hits.get("max_score")
+        if score is not None and (max_score is None or score > max_score):
+            max_score = score
+        for hit in hits.get("hits") or []:
+            all_hits.append({**hit, "_cluster": cluster})
+
+    def compare(a: dict, b: dict) -> int:
+        for (_, descending), va, vb in zip(spec, _hit_sort_values(a, spec), _hit_sort_values(b, spec)):
+            result = _compare_values(va, vb)
+            if result:
+                return -result if descending and va is not None and vb is not None else result
+        return 0
+
+    all_hits.sort(key=cmp_to_key(compare))
+    return {
+        "total": total if total_as_int else {"value": total, "relation": relation},
+        "max_score": max_score,
+        "hits": all_hits[from_:from_ + size]
+    }
+
+def _agg_type(definition: dict) -> Tuple[Optional[str], dict, dict]:
+    """
+    返回 (聚合类型, 该类型的参数, 子聚合定义)。
+    """
+    sub_aggs = definition.get("aggs") or definition.get("aggregations") or {}
+    for key, value in definition.items():
+        if key not in ("aggs", "aggregations", "meta"):
+            return key, value if isinstance(value, dict) else {}, sub_aggs
+    return None, {}, sub_aggs
+
+def merge_aggregations(parts: List[AggPart], agg_dsl: dict) -> dict:
+    """
+    按 DSL 中的聚合定义逐个合并：桶聚合按 key 合并桶并递归合并子聚合，
+    可加和的指标直接合并，avg 按所在桶的 doc_count 加权；无法精确合并的（如 cardinality、percentiles、top_hits）
+    按集群分别列出在 _by_cluster 中。
+    """
+    merged = {}
+    for name, definition in (agg_dsl or {}).items():
+        values = [(cluster, container[name], doc_count) for cluster, container, doc_count in parts
+                  if isinstance(container, dict) and name in container]
+        if not values or not isinstance(definition, dict):
+            continue
+        agg_type, params, sub_dsl = _agg_type(definition)
+        merged[name] = _merge_agg(agg_type, params, sub_dsl, values)
+    return merged
+
+def _merge_agg(agg_type: Optional[str], params: dict, sub_dsl: dict, values: List[AggPart]) -> dict:
+    first = values[0][1]
+    result = {"meta": first["meta"]} if "meta" in first else {}
+
+    if agg_type in _SINGLE_BUCKET:
+        result["doc_count"] = sum(v.get("doc_count", 0) for _, v, _ in values)
+        result.update(merge_aggregations([(c, v, v.get("doc_count")) for c, v, _ in values], sub_dsl))
+        return result
+
+    if agg_type in _MULTI_BUCKET:
+        result.update(_merge_bucket_agg(agg_type, params, sub_dsl, values))
+        return result
+
+    numbers = [v.get("value") for _, v, _ in values if isinstance(v.get("value"), (int, float))]
+    if agg_type in _SUMMABLE:
+        result["value"] = sum(numbers) if numbers else None
+    elif agg_type == "min":
+        result["value"] = min(numbers) if numbers else None
+    elif agg_type == "max":
+        result["value"] = max(numbers) if numbers else None
+    elif agg_type == "avg":
+        weighted = [(v["value"], w or 0) for _, v, w in values if isinstance(v.get("value"), (int, float))]
+        total_weight = sum(w for _, w in weighted)
+        if total_weight:
+            result["value"] = sum(value * w for value, w in weighted) / total_weight
+        else:
+            result["value"] = sum(value for value, _ in weighted) / len(weighted) if weighted else None
+    elif agg_type in ("stats", "extended_stats"):
+        result.update(_merge_stats(agg_type, [v for _, v, _ in values]))
+    else:
+        result["_by_cluster"] = {cluster: value for cluster, value, _ in values}
+    return result
+
+def _merge_stats(agg_type: str, values: List[dict]) -> dict:
+    count = sum(v.get("count", 0) for v in values)
+    mins = [v["min"] for v in values if v.get("min") is not None]
+    maxs = [v["max"] for v in values if v.get("max") is not None]
+    total = sum(v.get("sum") or 0 for v in values)
+    merged = {
+        "count": count,
+        "min": min(mins) if mins else None,
+        "max": max(maxs) if maxs else None,
+        "avg": total / count if count else None,
+        "sum": total
+    }
+    if agg_type == "extended_stats":
+        squares = sum(v.get("sum_of_squares") or 0 for v in values)
+        merged["sum_of_squares"] = squares
+        if count:
+            variance = max(squares / count - merged["avg"] ** 2, 0.0)
+            merged["variance"] = variance
+            merged["std_deviation"] = math.sqrt(variance)
+        else:
+            merged["variance"] = merged["std_deviation"] = None
+    return merged
+
+def _bucket_id(bucket: dict) -> str:
+    return json.dumps(bucket.get("key"), sort_keys=True, default=str)
+
+def _merge_bucket_group(group: List[Tuple[str, dict]], sub_dsl: dict) -> dict:
+    bucket = {k: v for k, v in group[0][1].items() if k not in sub_dsl}
+    bucket["doc_count"] = sum(b.get("doc_count", 0) for _, b in group)
+    bucket.update(merge_aggregations([(c, b, b.get("doc_count")) for c, b in group], sub_dsl))
+    return bucket
+
+def _merge_bucket_agg(agg_type: str, params: dict, sub_dsl: dict, values: List[AggPart]) -> dict:
+    result = {}
+    buckets = [(cluster, value.get("buckets")) for cluster, value, _ in values]
+
+    # keyed: true（或 filters 聚合）时 buckets 是 {key: bucket}
+    if all(isinstance(b, dict) for _, b in buckets):
+        merged = {}
+        for _, keyed in buckets:
+            for key in keyed:
+                merged.setdefault(key, None)
+        for key in merged:
+            merged[key] = _merge_bucket_group([(c, b[key]) for c, b in buckets if key in b], sub_dsl)
+        result["buckets"] = merged
+        return result
+
+    groups: Dict[str, List[Tuple[str, dict]]] = {}
+    for cluster, bucket_list in buckets:
+        for bucket in bucket_list or []:
+            groups.setdefault(_bucket_id(bucket), []).append((cluster, bucket))
+    merged = [_merge_bucket_group(group, sub_dsl) for group in groups.values()]
+
+    if agg_type in _KEY_ORDERED:
+        merged.sort(key=cmp_to_key(lambda a, b: _compare_values(a.get("key"), b.get("key"))))
+    elif agg_type not in _RANGE_ORDERED:
+        order = params.get("order")
+        if isinstance(order, dict) and "_key" in order:
+            descending = order["_key"] == "desc"
+            merged.sort(key=cmp_to_key(lambda a, b: _compare_values(a.get("key"), b.get("key"))), reverse=descending)
+        elif not (isinstance(order, dict) and "_count" in order and order["_count"] == "asc"):
+            merged.sort(key=lambda b: -b.get("doc_count", 0))
+        else:
+            merged.sort(key=lambda b: b.get("doc_count", 0))
+
+        # terms 类聚合按请求的 size 截断，被截掉的桶计入 sum_other_doc_count
+        size = params.get("size", 10) if agg_type != "rare_terms" else len(merged)
+        dropped = merged[size:]
+        merged = merged[:size]
+        other = [v.get("sum_other_doc_count") for _, v, _ in values if "sum_other_doc_count" in v]
+        if other or dropped:
+            result["sum_other_doc_count"] = sum(o or 0 for o in other) + sum(b.get("doc_count", 0) for b in dropped)
+        errors = [v.get("doc_count_error_upper_bound") for _, v, _ in values if "doc_count_error_upper_bound" in v]
+        if errors:
+            result["doc_count_error_upper_bound"] = sum(e or 0 for e in errors)
+
+    result["buckets"] = merged
+    return result
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+@File    : singleflight.py
+@Time    : 2026/10/18 18:40
+@Author  : xxlaila
+@Software: dify
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+def copy_tree(value: Any) -> Any:
+    """
+    复制 JSON 结构（dict/list/标量）：ES 响应只由这几种类型组成，比 copy.deepcopy 快得多（不需要 memo 和类型分派）。
+    """
+    if isinstance(value, dict):
+        return {k: copy_tree(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(v) for v in value]
+    return value
+
+class _LeaderCancelled(Exception):
+    """
+    AsyncSingleFlight 中第一个调用被取消（如客户端断开），等待方据此重新发起，而不是跟着被取消。
+    """
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    合并相同键的并发调用：同一时刻只有第一个调用真正执行，其余调用等待并共享它的结果或异常。
+    调用方会就地修改结果（如 query 截断字段）时 copy_results=True，等待方拿到各自的副本；
+    结果只读时（如 command，缓存中也是共享同一个对象）不复制。
+    """
+
+    def __init__(self, copy_results: bool = True):
+        self.copy_results = copy_results
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        返回 (结果, 是否共享了其他调用的结果)。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._copy(call.value), True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        # 有等待方时 call.value 要保持原样供它们复制，第一个调用方也拿副本
+        return (self._copy(call.value) if call.waiters else call.value), False
+
+    def _copy(self, value: Any) -> Any:
+        return copy_tree(value) if self.copy_results else value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的协程版本，供 ASGI 服务模式在同一事件循环内合并请求。
+    """
+
+    def __init__(self, copy_results: bool = True):
+        self.copy_results = copy_results
+        self._calls: Dict[Hashable, list] = {}  # key -> [future, 等待方数量]
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        返回 (结果, 是否共享了其他调用的结果)。第一个调用被取消时，等待方中先恢复的一个用自己的 fn 重新发起，其余继续等它。
+        """
+        call = self._calls.get(key)
+        while call is not None:
+            call[1] += 1
+            self.coalesced += 1
+            try:
+                # shield：等待方被取消时不影响第一个调用
+                value = await asyncio.shield(call[0])
+            except _LeaderCancelled:
+                call = self._calls.get(key)
+                continue
+            return self._copy(value), True
+
+        future = asyncio.get_running_loop().create_future()
+        call = self._calls[key] = [future, 0]
+        self.leaders += 1
+        try:
+            value = await fn()
+            future.set_result(value)
+        except asyncio.CancelledError:
+            # 不能 future.cancel()：等待方没有被取消，只是第一个调用不再需要结果
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待方时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        return (self._copy(value) if call[1] else value), False
+
+    def _copy(self, value: Any) -> Any:
+        return copy_tree(value) if self.copy_results else value
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}